@@ -29,6 +29,11 @@
 opentestrobot - APIs for GUI testing with robots
 """
 
-from userinteraction import UserInteraction
+from userinteraction import UserInteraction, Step
 import vision
 import gesture
+import robot
+import calibration
+import safety
+import persistentcache
+import tracing
@@ -0,0 +1,367 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Calibration -- system and coordinate handling configuration
+
+Coordinate systems:
+* unity:  work area (display) coordinates, (0.0, 0.0) is the top-left
+          and (1.0, 1.0) the bottom-right corner of the display
+* robot:  robot coordinates (x, y, z)
+* camera: camera frame pixel coordinates
+* frame:  unity coordinates of the whole camera frame, used by
+          vision backends
+
+Transforms between the systems are homographies fitted to the
+robot and camera coordinates of the display corners. The bottom-right
+robot corner is also used to estimate the accuracy of the setup data.
+
+Example:
+
+>>> c = calibration.Calibration(
+...     robotCorners=[(10, 20, 0), (70, 20, 0), (10, 140, 0), (70, 140, 0)],
+...     cameraCorners=[(100, 50), (700, 50), (100, 1250), (700, 1250)],
+...     cameraSize=(800, 1300))
+>>> c.transform((0.5, 0.5), "unity", "robot")
+(40.0, 80.0, 0.0)
+"""
+
+import json
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+COORDINATE_SYSTEMS = ("unity", "robot", "camera", "frame")
+
+# display corners in the order corner lists are given
+UNITY_CORNERS = ((0.0, 0.0), (1.0, 0.0), (0.0, 1.0), (1.0, 1.0))
+
+class CalibrationError(Exception):
+    pass
+
+def _solve(matrix, vector):
+    # Solve linear equations with Gaussian elimination and partial
+    # pivoting.
+    n = len(vector)
+    rows = [list(row) + [value] for row, value in zip(matrix, vector)]
+    for column in range(n):
+        pivot = max(range(column, n), key=lambda r: abs(rows[r][column]))
+        if abs(rows[pivot][column]) < 1e-12:
+            raise CalibrationError("degenerate reference points")
+        rows[column], rows[pivot] = rows[pivot], rows[column]
+        for r in range(column + 1, n):
+            factor = rows[r][column] / rows[column][column]
+            if factor:
+                for c in range(column, n + 1):
+                    rows[r][c] -= factor * rows[column][c]
+    solution = [0.0] * n
+    for r in range(n - 1, -1, -1):
+        solution[r] = (rows[r][n] - sum(rows[r][c] * solution[c]
+                                        for c in range(r + 1, n))) / rows[r][r]
+    return solution
+
+class Homography(object):
+    """Projective transform of 2D points
+
+    matrix is a 3x3 list of rows. Points are mapped with precomputed
+    coefficients, batches of points in one call with transformPoints.
+    """
+    def __init__(self, matrix):
+        self.matrix = [[float(value) for value in row] for row in matrix]
+
+    @classmethod
+    def fromPoints(cls, sourcePoints, targetPoints):
+        """Returns homography that maps four source points to targets
+        """
+        if len(sourcePoints) != 4 or len(targetPoints) != 4:
+            raise CalibrationError("homography needs exactly four point pairs")
+        equations, values = [], []
+        for (x, y), (u, v) in zip(sourcePoints, targetPoints):
+            equations.append([x, y, 1, 0, 0, 0, -u * x, -u * y])
+            values.append(u)
+            equations.append([0, 0, 0, x, y, 1, -v * x, -v * y])
+            values.append(v)
+        h = _solve(equations, values) + [1.0]
+        return cls([h[0:3], h[3:6], h[6:9]])
+
+    @classmethod
+    def scale(cls, sx, sy):
+        return cls([[sx, 0, 0], [0, sy, 0], [0, 0, 1]])
+
+    def inverse(self):
+        (a, b, c), (d, e, f), (g, h, i) = self.matrix
+        det = a * (e * i - f * h) - b * (d * i - f * g) + c * (d * h - e * g)
+        if abs(det) < 1e-18:
+            raise CalibrationError("transform is not invertible")
+        return Homography([[(e * i - f * h) / det, (c * h - b * i) / det, (b * f - c * e) / det],
+                           [(f * g - d * i) / det, (a * i - c * g) / det, (c * d - a * f) / det],
+                           [(d * h - e * g) / det, (b * g - a * h) / det, (a * e - b * d) / det]])
+
+    def then(self, other):
+        """Returns homography that maps with self and then with other
+        """
+        m1, m2 = self.matrix, other.matrix
+        return Homography([[sum(m2[r][k] * m1[k][c] for k in range(3))
+                            for c in range(3)] for r in range(3)])
+
+    def transform(self, point):
+        (a, b, c), (d, e, f), (g, h, i) = self.matrix
+        x, y = point[0], point[1]
+        w = g * x + h * y + i
+        return ((a * x + b * y + c) / w, (d * x + e * y + f) / w)
+
+    def transformPoints(self, points):
+        """Transform a batch of points
+
+        Returns numpy array of shape (n, 2) if points is a numpy
+        array, otherwise a list of (x, y) tuples.
+        """
+        if numpy != None and isinstance(points, numpy.ndarray):
+            points = numpy.asarray(points, dtype=float)[:, :2]
+            m = numpy.array(self.matrix)
+            mapped = points.dot(m[:, :2].T) + m[:, 2]
+            return mapped[:, :2] / mapped[:, 2:3]
+        (a, b, c), (d, e, f), (g, h, i) = self.matrix
+        result = []
+        for point in points:
+            x, y = point[0], point[1]
+            w = g * x + h * y + i
+            result.append(((a * x + b * y + c) / w, (d * x + e * y + f) / w))
+        return result
+
+def fourthCornerError(corners):
+    """Returns distance of the bottom-right corner from where the
+    other three corners predict it, if the display is a parallelogram
+    """
+    (tlx, tly), (trx, try_), (blx, bly), (brx, bry) = [c[:2] for c in corners]
+    return ((trx + blx - tlx - brx) ** 2 + (try_ + bly - tly - bry) ** 2) ** 0.5
+
+def isConvex(corners):
+    """Returns True if corners form a convex quadrilateral
+
+    A homography maps the unit square to a convex quadrilateral with
+    corners in the same order, so this holds for a display seen in
+    perspective even if it is not a parallelogram.
+    """
+    (tlx, tly), (trx, try_), (blx, bly), (brx, bry) = [c[:2] for c in corners]
+    ring = [(tlx, tly), (trx, try_), (brx, bry), (blx, bly)]
+    turns = []
+    for k in range(4):
+        (x1, y1), (x2, y2), (x3, y3) = ring[k], ring[(k + 1) % 4], ring[(k + 2) % 4]
+        turns.append((x2 - x1) * (y3 - y2) - (y2 - y1) * (x3 - x2))
+    return all(t > 0 for t in turns) or all(t < 0 for t in turns)
+
+class Calibration(object):
+    """Reference points of the device under test and transforms
+    between coordinate systems
+
+    Corners are given in order top-left, top-right, bottom-left,
+    bottom-right.
+    """
+    def __init__(self, robotCorners=None, cameraCorners=None, cameraSize=None,
+                 locations=None, tolerance=None):
+        """Create calibration from reference points
+
+        Args:
+            robotCorners (list): robot coordinates (x, y, z) of the
+                display corners.
+
+            cameraCorners (list): camera pixel coordinates (x, y) of
+                the display corners.
+
+            cameraSize (tuple): (width, height) of camera frames in
+                pixels, required for "frame" coordinates.
+
+            locations (dict): additional named robot locations, for
+                instance {"power": (5.0, 60.0, 2.0)}.
+
+            tolerance (float): raise CalibrationError if fourth corner
+                error of robot corners exceeds tolerance. Camera
+                corners are seen in perspective, they are only
+                required to form a convex quadrilateral.
+        """
+        self._corners = {}
+        self._homographies = {}
+        if robotCorners != None:
+            self._setCorners("robot", robotCorners)
+        if cameraCorners != None:
+            self._setCorners("camera", cameraCorners)
+        self._cameraSize = cameraSize
+        self._locations = dict(locations or {})
+        if tolerance != None:
+            if "robot" in self._corners:
+                error = fourthCornerError(self._corners["robot"])
+                if error > tolerance:
+                    raise CalibrationError(
+                        "robot corners are %.3f off a parallelogram, tolerance %s"
+                        % (error, tolerance))
+            if "camera" in self._corners and not isConvex(self._corners["camera"]):
+                raise CalibrationError("camera corners do not form a convex quadrilateral")
+
+    @classmethod
+    def fromRectangle(cls, topLeft, bottomRight, z=0.0):
+        """Returns calibration for a display aligned with robot axes
+        """
+        (left, top), (right, bottom) = topLeft[:2], bottomRight[:2]
+        return cls(robotCorners=[(left, top, z), (right, top, z),
+                                 (left, bottom, z), (right, bottom, z)])
+
+    @classmethod
+    def fromDict(cls, config):
+        """Returns calibration from a dictionary with keys of
+        constructor arguments
+        """
+        return cls(**dict((str(key), value) for key, value in config.items()))
+
+    @classmethod
+    def load(cls, filename):
+        """Returns calibration from a JSON file
+        """
+        with open(filename) as f:
+            return cls.fromDict(json.load(f))
+
+    def toDict(self):
+        config = {"locations": self._locations}
+        if "robot" in self._corners:
+            config["robotCorners"] = self._corners["robot"]
+        if "camera" in self._corners:
+            config["cameraCorners"] = self._corners["camera"]
+        if self._cameraSize != None:
+            config["cameraSize"] = self._cameraSize
+        return config
+
+    def save(self, filename):
+        with open(filename, "w") as f:
+            json.dump(self.toDict(), f, indent=2)
+
+    def accuracy(self):
+        """Returns {"robot": fourth corner error in robot units}, or {}
+        without robot corners
+
+        Camera corners are not reported: a display seen in perspective
+        is not a parallelogram in camera coordinates.
+        """
+        if not "robot" in self._corners:
+            return {}
+        return {"robot": fourthCornerError(self._corners["robot"])}
+
+    def location(self, name):
+        """Returns robot coordinates of a named location
+        """
+        try:
+            return tuple(self._locations[name])
+        except KeyError:
+            raise CalibrationError('unknown location "%s"' % (name,))
+
+    def locations(self):
+        return dict(self._locations)
+
+    def homography(self, source, target):
+        """Returns Homography from source to target coordinate system
+        """
+        key = (source, target)
+        if not key in self._homographies:
+            self._homographies[key] = self._fromUnity(source).inverse().then(
+                self._fromUnity(target))
+        return self._homographies[key]
+
+    def transform(self, point, source, target):
+        """Returns point transformed from source to target system
+
+        Points in robot coordinates are (x, y, z), where z is
+        interpolated from the z coordinates of the corners.
+        """
+        mapped = self.homography(source, target).transform(point)
+        if target == "robot":
+            return mapped + (self._robotZ(self.homography(source, "unity").transform(point)),)
+        return mapped
+
+    def transformPoints(self, points, source, target):
+        """Transform a batch of points with one precomputed transform
+
+        Returns numpy array if points is a numpy array, otherwise a
+        list of tuples.
+        """
+        homography = self.homography(source, target)
+        mapped = homography.transformPoints(points)
+        if target != "robot":
+            return mapped
+        if source == "unity":
+            unityPoints = points
+        else:
+            unityPoints = self.homography(source, "unity").transformPoints(points)
+        if numpy != None and isinstance(mapped, numpy.ndarray):
+            zs = self._robotZ(numpy.asarray(unityPoints, dtype=float).T)
+            return numpy.column_stack((mapped, zs))
+        return [xy + (self._robotZ(unityPoint),)
+                for xy, unityPoint in zip(mapped, unityPoints)]
+
+    def transformBbox(self, bbox, source, target):
+        """Returns bounding box of transformed corners of bbox
+        """
+        (left, top), (right, bottom) = bbox
+        corners = self.homography(source, target).transformPoints(
+            [(left, top), (right, top), (left, bottom), (right, bottom)])
+        xs = [x for x, _ in corners]
+        ys = [y for _, y in corners]
+        return ((min(xs), min(ys)), (max(xs), max(ys)))
+
+    def _setCorners(self, system, corners):
+        if len(corners) != 4:
+            raise CalibrationError("%s corners: four corners required" % (system,))
+        self._corners[system] = [tuple(float(c) for c in corner) for corner in corners]
+
+    def _fromUnity(self, system):
+        if system == "unity":
+            return Homography([[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+        if system == "frame":
+            if self._cameraSize == None:
+                raise CalibrationError("cameraSize required for frame coordinates")
+            width, height = self._cameraSize
+            return self._fromUnity("camera").then(
+                Homography.scale(1.0 / width, 1.0 / height))
+        if not system in COORDINATE_SYSTEMS:
+            raise CalibrationError('unknown coordinate system "%s"' % (system,))
+        if not system in self._corners:
+            raise CalibrationError('no %s corners in calibration' % (system,))
+        key = ("unity", system)
+        if not key in self._homographies:
+            self._homographies[key] = Homography.fromPoints(
+                UNITY_CORNERS, [corner[:2] for corner in self._corners[system]])
+        return self._homographies[key]
+
+    def _robotZ(self, unityPoint):
+        # Bilinear interpolation of corner z coordinates, works for
+        # scalars and for numpy arrays of coordinates.
+        corners = self._corners["robot"]
+        if len(corners[0]) < 3:
+            return 0.0
+        u, v = unityPoint[0], unityPoint[1]
+        return (corners[0][2] * (1 - u) * (1 - v) + corners[1][2] * u * (1 - v) +
+                corners[2][2] * (1 - u) * v + corners[3][2] * u * v)
@@ -29,6 +29,497 @@
 camera - interface for reading screenshots from devices
 """
 
+import hashlib
+import math
+import os
+import struct
+import tempfile
+import threading
+import time
+import zlib
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# bytes per pixel in supported BufferFrame pixel formats
+PIXEL_FORMATS = {
+    "GRAY8": 1,
+    "RGB888": 3,
+    "BGR888": 3,
+    "RGBA8888": 4,
+    "BGRA8888": 4,
+}
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+# channels of PNG color types: gray, RGB, palette, gray+alpha, RGBA
+_PNG_CHANNELS = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}
+
+def readImage(filename):
+    """Returns (width, height, channels, pixels) of a PNG or PNM file
+
+    pixels is a bytearray of 8-bit samples, channels per pixel, row
+    by row. Palette images are expanded to RGB, 16-bit samples are
+    reduced to 8 bits. Transparency of palette images is ignored.
+    Interlaced PNGs are not supported.
+    """
+    data = open(filename, "rb").read()
+    if data.startswith(PNG_SIGNATURE):
+        return _readPng(data)
+    elif data[:2] in (b"P5", b"P6"):
+        return _readPnm(data)
+    raise ValueError('unsupported image format: "%s"' % (filename,))
+
+def _readPnm(data):
+    # binary PGM (P5) and PPM (P6) with maxval 255
+    tokens = []
+    pos = 0
+    while len(tokens) < 4:
+        while data[pos:pos + 1].isspace():
+            pos += 1
+        if data[pos:pos + 1] == b"#":
+            pos = data.index(b"\n", pos)
+            continue
+        end = pos
+        while end < len(data) and not data[end:end + 1].isspace():
+            end += 1
+        tokens.append(data[pos:end])
+        pos = end
+    magic, width, height, maxval = tokens[0], int(tokens[1]), int(tokens[2]), int(tokens[3])
+    if maxval != 255:
+        raise ValueError("unsupported PNM maxval: %s" % (maxval,))
+    channels = 1 if magic == b"P5" else 3
+    pixels = bytearray(data[pos + 1:pos + 1 + width * height * channels])
+    if len(pixels) < width * height * channels:
+        raise ValueError("truncated PNM data")
+    return width, height, channels, pixels
+
+def _readPng(data):
+    pos = len(PNG_SIGNATURE)
+    header, palette, compressed = None, None, []
+    while pos < len(data):
+        length, chunkType = struct.unpack(">I4s", data[pos:pos + 8])
+        chunk = data[pos + 8:pos + 8 + length]
+        pos += length + 12
+        if chunkType == b"IHDR":
+            header = struct.unpack(">IIBBBBB", chunk)
+        elif chunkType == b"PLTE":
+            palette = bytearray(chunk)
+        elif chunkType == b"IDAT":
+            compressed.append(chunk)
+        elif chunkType == b"IEND":
+            break
+    if header == None:
+        raise ValueError("PNG header missing")
+    width, height, bitDepth, colorType, _, _, interlace = header
+    if not colorType in _PNG_CHANNELS or not bitDepth in (1, 2, 4, 8, 16):
+        raise ValueError("unsupported PNG color type %s, bit depth %s" %
+                         (colorType, bitDepth))
+    if interlace:
+        raise ValueError("interlaced PNGs are not supported")
+    channels = _PNG_CHANNELS[colorType]
+    bitsPerPixel = channels * bitDepth
+    rowBytes = (width * bitsPerPixel + 7) // 8
+    rows = _pngUnfilter(bytearray(zlib.decompress(b"".join(compressed))),
+                        height, rowBytes, max(1, bitsPerPixel // 8))
+    if bitDepth == 16:
+        samples = rows[0::2]
+    elif bitDepth < 8:
+        samples = bytearray()
+        perByte = 8 // bitDepth
+        mask = (1 << bitDepth) - 1
+        # gray levels are scaled to 0-255, palette indices are not
+        scale = 1 if colorType == 3 else 255 // mask
+        for y in xrange(height):
+            row = rows[y * rowBytes:(y + 1) * rowBytes]
+            samples.extend(
+                ((row[x // perByte] >> (8 - bitDepth * (x % perByte + 1))) & mask) * scale
+                for x in xrange(width))
+    else:
+        samples = rows
+    if colorType == 3:
+        if palette == None:
+            raise ValueError("PNG palette missing")
+        rgb = bytearray()
+        for index in samples:
+            rgb.extend(palette[3 * index:3 * index + 3])
+        return width, height, 3, rgb
+    return width, height, channels, samples
+
+def _pngUnfilter(data, height, rowBytes, bpp):
+    # Reverse PNG scanline filters, bpp is bytes per complete pixel.
+    if numpy != None:
+        return _pngUnfilterArray(data, height, rowBytes, bpp)
+    pixels = bytearray(height * rowBytes)
+    prior = bytearray(rowBytes)
+    for y in xrange(height):
+        begin = y * (rowBytes + 1)
+        filterType = data[begin]
+        row = data[begin + 1:begin + 1 + rowBytes]
+        if filterType == 1:
+            for i in xrange(bpp, rowBytes):
+                row[i] = (row[i] + row[i - bpp]) & 0xff
+        elif filterType == 2:
+            row = bytearray((r + p) & 0xff for r, p in zip(row, prior))
+        elif filterType == 3:
+            for i in xrange(rowBytes):
+                left = row[i - bpp] if i >= bpp else 0
+                row[i] = (row[i] + ((left + prior[i]) >> 1)) & 0xff
+        elif filterType == 4:
+            for i in xrange(rowBytes):
+                if i >= bpp:
+                    a, c = row[i - bpp], prior[i - bpp]
+                else:
+                    a, c = 0, 0
+                b = prior[i]
+                p = a + b - c
+                pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+                if pa <= pb and pa <= pc:
+                    predictor = a
+                elif pb <= pc:
+                    predictor = b
+                else:
+                    predictor = c
+                row[i] = (row[i] + predictor) & 0xff
+        elif filterType != 0:
+            raise ValueError("invalid PNG filter type: %s" % (filterType,))
+        pixels[y * rowBytes:(y + 1) * rowBytes] = row
+        prior = row
+    return pixels
+
+def _pngUnfilterArray(data, height, rowBytes, bpp):
+    # Reverse PNG scanline filters with NumPy.
+    rows = numpy.frombuffer(data, numpy.uint8).reshape(height, rowBytes + 1)
+    filterTypes = rows[:, 0]
+    if filterTypes.max() > 4:
+        raise ValueError("invalid PNG filter type: %s" % (filterTypes.max(),))
+    if (filterTypes >= 3).any():
+        return _pngUnfilterDiagonals(rows, filterTypes, bpp)
+    pixels = numpy.empty((height, rowBytes), numpy.uint8)
+    prior = numpy.zeros(rowBytes, numpy.uint8)
+    for y in xrange(height):
+        row = rows[y, 1:]
+        if filterTypes[y] == 0:
+            pixels[y] = row
+        elif filterTypes[y] == 1:
+            # cumulative sums of uint8 wrap around like the filter
+            pixels[y] = row.reshape(-1, bpp).cumsum(axis=0, dtype=numpy.uint8).reshape(-1)
+        else:
+            numpy.add(row, prior, out=pixels[y])
+        prior = pixels[y]
+    return bytearray(pixels.tobytes())
+
+def _pngUnfilterDiagonals(rows, filterTypes, bpp):
+    # Average and Paeth filters predict a byte from its unfiltered
+    # left, upper and upper-left neighbours. Pixels on the same
+    # anti-diagonal do not depend on each other, so the image is
+    # unfiltered one anti-diagonal at a time. Rows are skewed so that
+    # pixel (x, y) is at skewed[y + 1, x + y + 2] and anti-diagonals
+    # are columns. The first row and columns are zero padding.
+    height = rows.shape[0]
+    width = (rows.shape[1] - 1) // bpp
+    skewed = numpy.zeros((height + 1, width + height + 2, bpp), numpy.int16)
+    for y in xrange(height):
+        skewed[y + 1, y + 2:y + 2 + width] = rows[y, 1:].reshape(width, bpp)
+    masks = [(filterTypes == filterType).astype(numpy.int16)[:, None]
+             for filterType in range(5)]
+    for column in xrange(2, width + height + 2):
+        first, last = max(1, column - width), min(height, column - 1)
+        if first > last:
+            continue
+        left = skewed[first:last + 1, column - 1]
+        up = skewed[first - 1:last, column - 1]
+        upLeft = skewed[first - 1:last, column - 2]
+        pa, pb = numpy.abs(up - upLeft), numpy.abs(left - upLeft)
+        pc = numpy.abs(left + up - upLeft - upLeft)
+        paeth = numpy.where((pa <= pb) & (pa <= pc), left,
+                            numpy.where(pb <= pc, up, upLeft))
+        types = slice(first - 1, last)
+        pixel = skewed[first:last + 1, column]
+        pixel += (left * masks[1][types] + up * masks[2][types] +
+                  ((left + up) >> 1) * masks[3][types] + paeth * masks[4][types])
+        pixel &= 0xff
+    pixels = numpy.empty((height, width, bpp), numpy.uint8)
+    for y in xrange(height):
+        pixels[y] = skewed[y + 1, y + 2:y + 2 + width]
+    return bytearray(pixels.tobytes())
+
+class Frame(object):
+    """Handle to a captured frame
+
+    Frames are passed from cameras to OIR and OCR backends. A backend
+    that decodes the frame stores the decoded image in the handle, so
+    that the frame is loaded only once no matter how many recognisers
+    search it. The frame file is only a fallback for backends that
+    cannot use any of the stored images.
+    """
+    def __init__(self, filename=None, timestamp=None):
+        super(Frame, self).__init__()
+        self._filename = filename
+        if timestamp == None:
+            timestamp = time.time()
+        self._timestamp = timestamp
+        self._images = {}
+        self._digest = None
+
+    def __getstate__(self):
+        # Decoded images are specific to the process that loaded them.
+        state = dict(self.__dict__)
+        state["_images"] = {}
+        return state
+
+    def filename(self):
+        """Returns name of the file that contains the frame
+        """
+        return self._filename
+
+    def timestamp(self):
+        """Returns the time when the frame was captured
+        """
+        return self._timestamp
+
+    def image(self, key, loader=None):
+        """Returns decoded image stored with key
+
+        If there is no image for the key, image is loaded by calling
+        loader with the frame file name and stored for later calls.
+        Returns None if there is neither image nor loader.
+        """
+        if not key in self._images:
+            if loader == None:
+                return None
+            self._images[key] = loader(self.filename())
+        return self._images[key]
+
+    def nbytes(self):
+        """Returns size of the frame in bytes
+        """
+        try:
+            return os.path.getsize(self._filename)
+        except (OSError, TypeError):
+            return 0
+
+    def thumbnail(self, size=(32, 32), area=None):
+        """Returns grayscale thumbnail of the frame, or None
+
+        Thumbnail is a tuple of size[0] * size[1] gray values (0-255)
+        sampled evenly from area (the whole frame by default), row by
+        row. Returns None if pixels of the frame are not available.
+        """
+        return None
+
+    def setImage(self, key, image):
+        """Store decoded image so that image(key) returns it
+        """
+        self._images[key] = image
+
+    def digest(self):
+        """Returns a digest that identifies frame contents, or None
+        """
+        if self._digest == None and self._filename != None:
+            try:
+                self._digest = hashlib.md5(
+                    open(self._filename, "rb").read()).digest()
+            except IOError:
+                pass
+        return self._digest
+
+class BufferFrame(Frame):
+    """Frame delivered as a pixel buffer in memory
+
+    Pixels are not copied: the frame refers to the buffer given by
+    the camera. Rows start stride bytes apart, pixels in a row are
+    packed according to the format (see PIXEL_FORMATS).
+
+    If a backend needs a file, filename() writes the frame to a
+    temporary PPM/PGM file on the first call.
+    """
+    def __init__(self, pixels, width, height, stride=None, format="RGB888",
+                 timestamp=None):
+        """Wrap a pixel buffer
+
+        Args:
+            pixels: object that supports the buffer protocol, for
+                instance bytearray, mmap or numpy array.
+
+            width, height (int): frame size in pixels.
+
+            stride (int): optional, bytes from the beginning of a row
+                to the beginning of the next one. The default is
+                width times bytes per pixel.
+
+            format (str): pixel format, one of PIXEL_FORMATS.
+        """
+        super(BufferFrame, self).__init__(None, timestamp)
+        if not format in PIXEL_FORMATS:
+            raise ValueError('unsupported pixel format: "%s"' % (format,))
+        if numpy != None and isinstance(pixels, numpy.ndarray):
+            pixels = pixels.reshape(-1)
+        self._pixels = memoryview(pixels)
+        self._width = width
+        self._height = height
+        self._bytesPerPixel = PIXEL_FORMATS[format]
+        if stride == None:
+            stride = width * self._bytesPerPixel
+        self._stride = stride
+        self._format = format
+        self._filenameLock = threading.Lock()
+        if len(self._pixels) < (height - 1) * stride + width * self._bytesPerPixel:
+            raise ValueError("pixel buffer is too small for %sx%s frame" %
+                             (width, height))
+
+    def __getstate__(self):
+        state = super(BufferFrame, self).__getstate__()
+        state["_pixels"] = self._pixels.tobytes()
+        # the temporary file belongs to this instance
+        state["_filename"] = None
+        del state["_filenameLock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pixels = memoryview(self._pixels)
+        self._filenameLock = threading.Lock()
+
+    def __del__(self):
+        if self._filename != None:
+            try:
+                os.remove(self._filename)
+            except OSError:
+                pass
+
+    def pixels(self):
+        """Returns memoryview of the pixel buffer
+        """
+        return self._pixels
+
+    def size(self):
+        """Returns (width, height)
+        """
+        return (self._width, self._height)
+
+    def stride(self):
+        return self._stride
+
+    def format(self):
+        return self._format
+
+    def bytesPerPixel(self):
+        return self._bytesPerPixel
+
+    def nbytes(self):
+        """Returns number of bytes in the pixel buffer
+        """
+        return len(self._pixels) * self._pixels.itemsize
+
+    def row(self, y):
+        """Returns memoryview of pixels on row y
+        """
+        begin = y * self._stride
+        return self._pixels[begin:begin + self._width * self._bytesPerPixel]
+
+    def crop(self, area):
+        """Returns (frame, croppedArea) that contains area of this frame
+
+        area ((left, top), (right, bottom)) is given in unity
+        coordinates. It is extended to whole pixels, croppedArea is
+        the extended area. The returned frame shares the pixel buffer
+        with this frame.
+        """
+        (left, top), (right, bottom) = area
+        x1 = max(0, min(self._width - 1, int(math.floor(left * self._width))))
+        y1 = max(0, min(self._height - 1, int(math.floor(top * self._height))))
+        x2 = max(x1 + 1, min(self._width, int(math.ceil(right * self._width))))
+        y2 = max(y1 + 1, min(self._height, int(math.ceil(bottom * self._height))))
+        offset = y1 * self._stride + x1 * self._bytesPerPixel
+        frame = BufferFrame(self._pixels[offset:], x2 - x1, y2 - y1,
+                            self._stride, self._format, self._timestamp)
+        croppedArea = ((x1 / float(self._width), y1 / float(self._height)),
+                       (x2 / float(self._width), y2 / float(self._height)))
+        return frame, croppedArea
+
+    def thumbnail(self, size=(32, 32), area=None):
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        (left, top), (right, bottom) = area
+        columns, rows = size
+        bpp = self._bytesPerPixel
+        xs = [bpp * min(self._width - 1, int(
+            (left + (right - left) * (i + 0.5) / columns) * self._width))
+              for i in xrange(columns)]
+        if self._format == "GRAY8":
+            channels = (0, 0, 0)
+        elif self._format.startswith("BGR"):
+            channels = (2, 1, 0)
+        else:
+            channels = (0, 1, 2)
+        r, g, b = channels
+        values = []
+        for i in xrange(rows):
+            y = min(self._height - 1, int(
+                (top + (bottom - top) * (i + 0.5) / rows) * self._height))
+            row = bytearray(self.row(y).tobytes())
+            values.extend(
+                (row[x + r] * 299 + row[x + g] * 587 + row[x + b] * 114) // 1000
+                for x in xs)
+        return tuple(values)
+
+    def array(self):
+        """Returns pixels as numpy array of shape (height, width, channels)
+
+        The array is a view to the pixel buffer, no data is copied.
+        """
+        if numpy == None:
+            raise ImportError("numpy is required for BufferFrame.array()")
+        # numpy.ndarray(buffer=...) does not accept memoryviews on
+        # Python 2, asarray shares their memory on both versions.
+        return numpy.lib.stride_tricks.as_strided(
+            numpy.asarray(self._pixels).view(numpy.uint8),
+            shape=(self._height, self._width, self._bytesPerPixel),
+            strides=(self._stride, self._bytesPerPixel, 1))
+
+    def filename(self):
+        with self._filenameLock:
+            if self._filename == None:
+                fd, filename = tempfile.mkstemp(
+                    prefix="opentestrobot-frame-",
+                    suffix=(".pgm" if self._bytesPerPixel == 1 else ".ppm"))
+                f = os.fdopen(fd, "wb")
+                try:
+                    self._writePnm(f)
+                finally:
+                    f.close()
+                self._filename = filename
+        return self._filename
+
+    def _writePnm(self, f):
+        if self._format == "GRAY8":
+            f.write(b"P5\n%d %d\n255\n" % (self._width, self._height))
+        else:
+            f.write(b"P6\n%d %d\n255\n" % (self._width, self._height))
+        for y in xrange(self._height):
+            row = self.row(y).tobytes()
+            if self._format in ("GRAY8", "RGB888"):
+                f.write(row)
+                continue
+            rgb = bytearray(self._width * 3)
+            bpp = self._bytesPerPixel
+            if self._format.startswith("BGR"):
+                rgb[0::3], rgb[1::3], rgb[2::3] = row[2::bpp], row[1::bpp], row[0::bpp]
+            else:
+                rgb[0::3], rgb[1::3], rgb[2::3] = row[0::bpp], row[1::bpp], row[2::bpp]
+            f.write(rgb)
+
+    def digest(self):
+        if self._digest == None:
+            md5 = hashlib.md5()
+            for y in xrange(self._height):
+                md5.update(self.row(y))
+            self._digest = md5.digest()
+        return self._digest
+
 class Interface(object):
     """API required from Camera implementations
     """
@@ -42,7 +533,9 @@ class Interface(object):
 
         Features are:
         * locateImage (built-in optical image recognition)
-        * captureFrame
+        * frame (type of frame() return value: "frame" for a
+          Frame handle, "buffer" for a BufferFrame, "filename" for
+          a name of an image file)
 
         Type/version 0 means not supported.
         """
@@ -50,6 +543,8 @@ class Interface(object):
 
     def frame(self):
         """Return a still image on screen
+
+        Return value type is given by features()["frame"].
         """
         raise NotImplementedError
 
@@ -68,8 +563,39 @@ class SwEmulation(Interface):
 
     def features(self):
         return {"locateImage": 0,
-                "frame": "filename"}
+                "frame": "frame"}
+
+    def frame(self):
+        screenshot = self._gti.refreshScreenshot()
+        frame = Frame(screenshot.filename())
+        # fMBT based recognisers search the already loaded screenshot.
+        frame.setImage(self._gti, screenshot)
+        return frame
+
+class BufferSource(Interface):
+    """Camera that delivers frames from memory
+
+    Wraps frame grabbers that hand out pixel buffers, for instance a
+    capture card SDK callback. Frames are not encoded to files.
+    """
+    def __init__(self, grabFunc, width, height, stride=None, format="RGB888"):
+        """Create camera reading frames with grabFunc
+
+        Args:
+            grabFunc (function): returns a new pixel buffer, see
+                BufferFrame for supported buffer types.
+
+            width, height, stride, format: layout of returned
+                buffers, see BufferFrame.
+        """
+        super(BufferSource, self).__init__()
+        self._grabFunc = grabFunc
+        self._layout = (width, height, stride, format)
+
+    def features(self):
+        return {"locateImage": 0,
+                "frame": "buffer"}
 
     def frame(self):
-        self._gti.refreshScreenshot()
-        return self._gti.screenshot().filename()
+        width, height, stride, format = self._layout
+        return BufferFrame(self._grabFunc(), width, height, stride, format)
@@ -30,6 +30,396 @@ Gesture -- robot control library
 
 """
 
+import calibration
+import collections
+import json
+import math
+import robot
+import select
+import socket
+import threading
+import time
+import tracing
+
+try:
+    import httplib
+    import urlparse
+except ImportError:
+    import http.client as httplib
+    import urllib.parse as urlparse
+
+# duration of moves in paths when dragDuration is not given
+DEFAULT_MOVE_DURATION = 0.25
+
+# number of path points used to approximate smooth begin or end
+SMOOTH_STEPS = 8
+
+# degrees of arc between path points of rotate gestures
+ROTATE_STEP_ANGLE = 15.0
+
+# HTTP requests that ConnectionPool may send again after a failed response
+IDEMPOTENT_METHODS = ("GET", "HEAD", "PUT", "DELETE", "OPTIONS")
+
+class GestureError(Exception):
+    pass
+
+class CancelledError(GestureError):
+    pass
+
+class GestureTimeoutError(GestureError):
+    pass
+
+class Future(object):
+    """Result of a gesture submitted to a CommandQueue
+    """
+    PENDING, RUNNING, DONE, CANCELLED = range(4)
+
+    def __init__(self, description=""):
+        self._description = description
+        self._state = Future.PENDING
+        self._result = None
+        self._exception = None
+        self._callbacks = []
+        self._cond = threading.Condition()
+
+    def __repr__(self):
+        return "<%s %s: %s>" % (
+            self.__class__.__name__, self._description,
+            ("pending", "running", "done", "cancelled")[self._state])
+
+    def cancel(self):
+        """Cancel the gesture if it has not been started
+
+        Returns True if the gesture was cancelled.
+        """
+        with self._cond:
+            if self._state == Future.PENDING:
+                self._state = Future.CANCELLED
+                self._cond.notify_all()
+            cancelled = (self._state == Future.CANCELLED)
+        if cancelled:
+            self._runCallbacks()
+        return cancelled
+
+    def cancelled(self):
+        return self._state == Future.CANCELLED
+
+    def running(self):
+        return self._state == Future.RUNNING
+
+    def done(self):
+        return self._state in (Future.DONE, Future.CANCELLED)
+
+    def result(self, timeout=None):
+        """Wait for the gesture to finish and return its return value
+
+        Raises the exception raised by the gesture, CancelledError if
+        the gesture was cancelled, or GestureTimeoutError if the
+        gesture did not finish within timeout seconds.
+        """
+        exception = self.exception(timeout)
+        if exception != None:
+            raise exception
+        return self._result
+
+    def exception(self, timeout=None):
+        """Wait for the gesture to finish and return its exception
+
+        Returns None if the gesture succeeded.
+        """
+        with self._cond:
+            if not self.done():
+                self._cond.wait(timeout)
+            if self._state == Future.CANCELLED:
+                raise CancelledError("cancelled: %s" % (self._description,))
+            if not self.done():
+                raise GestureTimeoutError("timeout: %s" % (self._description,))
+            return self._exception
+
+    def addDoneCallback(self, callback):
+        """Call callback(future) when the gesture is done or cancelled
+        """
+        with self._cond:
+            if not self.done():
+                self._callbacks.append(callback)
+                return
+        callback(self)
+
+    def _start(self):
+        with self._cond:
+            if self._state != Future.PENDING:
+                return False
+            self._state = Future.RUNNING
+            return True
+
+    def _finish(self, result, exception):
+        with self._cond:
+            self._result = result
+            self._exception = exception
+            self._state = Future.DONE
+            self._cond.notify_all()
+        self._runCallbacks()
+
+    def _runCallbacks(self):
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback(self)
+
+class CommandQueue(object):
+    """Runs gestures in submission order in a worker thread
+
+    If a gesture raises an exception, the exception is stored in its
+    future and the queue enters error state: queued gestures are
+    cancelled, because they were planned for a state the device or
+    robot may not be in, and gestures submitted later are cancelled
+    immediately. The next flush() raises the exception and clears
+    the error state.
+    """
+    def __init__(self):
+        self._commands = collections.deque()
+        self._cond = threading.Condition()
+        self._busy = False
+        self._error = None
+        self._worker = None
+
+    def submit(self, func, args=(), kwargs={}, description=""):
+        """Queue func(*args, **kwargs), returns Future
+        """
+        future = Future(description or getattr(func, "__name__", ""))
+        with self._cond:
+            if self._error != None:
+                future.cancel()
+                return future
+            self._commands.append((future, func, args, kwargs))
+            if self._worker == None:
+                self._worker = threading.Thread(target=self._run)
+                self._worker.daemon = True
+                self._worker.start()
+            self._cond.notify_all()
+        return future
+
+    def pending(self):
+        """Returns number of gestures queued or running
+        """
+        with self._cond:
+            return len(self._commands) + int(self._busy)
+
+    def cancelPending(self):
+        """Cancel gestures that have not been started
+
+        Returns number of cancelled gestures.
+        """
+        with self._cond:
+            commands, self._commands = self._commands, collections.deque()
+        return len([future for future, _, _, _ in commands if future.cancel()])
+
+    def flush(self, timeout=None):
+        """Wait until all queued gestures are finished
+
+        Raises the first exception raised by a gesture since the
+        previous flush, or GestureTimeoutError if gestures did not
+        finish within timeout seconds.
+        """
+        if timeout != None:
+            endTime = time.time() + timeout
+        with self._cond:
+            while self._commands or self._busy:
+                if timeout == None:
+                    self._cond.wait()
+                elif time.time() < endTime:
+                    self._cond.wait(endTime - time.time())
+                else:
+                    raise GestureTimeoutError("gestures still running")
+            error, self._error = self._error, None
+        if error != None:
+            raise error
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._commands:
+                    self._cond.wait()
+                future, func, args, kwargs = self._commands.popleft()
+                self._busy = future._start()
+            if not self._busy:
+                continue
+            try:
+                with tracing.span("gesture.%s" % (future._description,), queued=True):
+                    result, exception = func(*args, **kwargs), None
+            except Exception as e:
+                result, exception = None, e
+            if exception != None:
+                with self._cond:
+                    if self._error == None:
+                        self._error = exception
+                self.cancelPending()
+            future._finish(result, exception)
+            with self._cond:
+                self._busy = False
+                self._cond.notify_all()
+
+_commandQueueLock = threading.Lock()
+
+def _movePoints(startTime, beginPos, endPos, duration, profile):
+    # Returns pressed path points from beginPos (excluded) to endPos,
+    # profile maps linear progress 0.0-1.0 to distance 0.0-1.0.
+    if profile == None:
+        steps = 1
+    else:
+        steps = SMOOTH_STEPS
+    points = []
+    for step in range(1, steps + 1):
+        progress = float(step) / steps
+        distance = progress if profile == None else profile(progress)
+        points.append((startTime + duration * progress,
+                       (beginPos[0] + (endPos[0] - beginPos[0]) * distance,
+                        beginPos[1] + (endPos[1] - beginPos[1]) * distance),
+                       True))
+    return points
+
+def _smoothBeginEnd(progress):
+    return progress * progress * (3 - 2 * progress)
+
+def _smoothEnd(progress):
+    return 1 - (1 - progress) * (1 - progress)
+
+def gesturePath(gestureName, args=(), kwargs={}):
+    """Returns timed path of a tap, drag, swipe, flick or rotate gesture
+
+    Path is a list of (time, (x, y), pressed) points in work area
+    coordinates. Time is seconds from the beginning of the gesture,
+    the finger moves linearly between consecutive points.
+    """
+    if gestureName == "tap":
+        pos = args[0] if args else kwargs["pos"]
+        duration = args[1] if len(args) > 1 else kwargs.get("duration", 0.0)
+        return [(0.0, pos, False), (0.0, pos, True),
+                (duration, pos, True), (duration, pos, False)]
+    elif gestureName in ("drag", "swipe", "flick"):
+        names = ["beginPos", "endPos", "beginDuration", "endDuration"]
+        p = {"beginDuration": 0.0, "endDuration": 0.0}
+        p.update(zip(names, args))
+        p.update((name, kwargs[name]) for name in names if name in kwargs)
+        if gestureName != "drag":
+            p["beginDuration"] = p["endDuration"] = 0.0
+        profile = {"drag": None, "swipe": _smoothBeginEnd,
+                   "flick": _smoothEnd}[gestureName]
+        moveDuration = kwargs.get("dragDuration", DEFAULT_MOVE_DURATION)
+        beginPos, endPos = p["beginPos"], p["endPos"]
+        moveStart = p["beginDuration"]
+        moveEnd = moveStart + moveDuration
+        path = [(0.0, beginPos, False), (0.0, beginPos, True)]
+        if moveStart > 0:
+            path.append((moveStart, beginPos, True))
+        path.extend(_movePoints(moveStart, beginPos, endPos, moveDuration, profile))
+        if p["endDuration"] > 0:
+            path.append((moveEnd + p["endDuration"], endPos, True))
+        path.append((path[-1][0], endPos, False))
+        return path
+    elif gestureName == "rotate":
+        names = ["centerPos", "beginPos", "arcAngle"]
+        p = {"arcAngle": 360}
+        p.update(zip(names, args))
+        p.update((name, kwargs[name]) for name in names if name in kwargs)
+        (cx, cy), (bx, by) = p["centerPos"], p["beginPos"]
+        radius = math.hypot(bx - cx, by - cy)
+        beginAngle = math.atan2(by - cy, bx - cx)
+        # y grows downwards, so growing angle turns clockwise
+        steps = max(1, int(math.ceil(abs(p["arcAngle"]) / ROTATE_STEP_ANGLE)))
+        duration = kwargs.get("dragDuration", DEFAULT_MOVE_DURATION)
+        path = [(0.0, (bx, by), False), (0.0, (bx, by), True)]
+        for step in range(1, steps + 1):
+            angle = beginAngle + math.radians(p["arcAngle"]) * step / steps
+            path.append((duration * step / steps,
+                         (cx + radius * math.cos(angle), cy + radius * math.sin(angle)),
+                         True))
+        path.append((duration, path[-1][1], False))
+        return path
+    raise GestureError('gesture "%s" cannot be converted to a path' % (gestureName,))
+
+def sequencePath(gestures):
+    """Returns coalesced timed path that executes gestures in order
+
+    gestures is a list of (gestureName, args, kwargs) tuples. Moves
+    between gestures are made lifted as fast as the robot can, so
+    the time difference of two points is the minimum time to move
+    from one to the other.
+    """
+    path = []
+    for gestureName, args, kwargs in gestures:
+        startTime = path[-1][0] if path else 0.0
+        path.extend((startTime + t, pos, pressed)
+                    for t, pos, pressed in gesturePath(gestureName, args, kwargs))
+    return coalescePath(path)
+
+def coalescePath(path, tolerance=1e-9):
+    """Returns path without redundant points
+
+    Duplicate points and points on a constant velocity segment
+    between their neighbours are removed, so consecutive moves along
+    the same line become one move.
+    """
+    result = []
+    for point in path:
+        if result and _samePoint(result[-1], point, tolerance):
+            continue
+        if (len(result) > 1 and
+            _onSegment(result[-2], result[-1], point, tolerance)):
+            result[-1] = point
+        else:
+            result.append(point)
+    return result
+
+def _samePoint(point1, point2, tolerance):
+    return (point1[2] == point2[2] and
+            abs(point1[0] - point2[0]) <= tolerance and
+            abs(point1[1][0] - point2[1][0]) <= tolerance and
+            abs(point1[1][1] - point2[1][1]) <= tolerance)
+
+def _onSegment(first, middle, last, tolerance):
+    # True if pressed middle point is where the finger would be anyway
+    # when moving from first to last.
+    if not (first[2] and middle[2] and last[2]):
+        return False
+    duration = last[0] - first[0]
+    if duration <= tolerance:
+        return False
+    progress = (middle[0] - first[0]) / duration
+    for axis in (0, 1):
+        expected = first[1][axis] + (last[1][axis] - first[1][axis]) * progress
+        if abs(expected - middle[1][axis]) > tolerance:
+            return False
+    return True
+
+class Batch(object):
+    """Records gestures to be executed with one executeSequence call
+
+    Returned by Interface.batch().
+    """
+    def __init__(self, gestureInstance):
+        self._gesture = gestureInstance
+        self.gestures = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType == None and self.gestures:
+            self._gesture.flush()
+            self._gesture.executeSequence(self.gestures)
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self.gestures.append(("tap", (pos, duration), kwargs))
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        self.gestures.append(("drag", (beginPos, endPos, beginDuration, endDuration), kwargs))
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        self.gestures.append(("swipe", (beginPos, endPos), kwargs))
+
+    def flick(self, beginPos, endPos, **kwargs):
+        self.gestures.append(("flick", (beginPos, endPos), kwargs))
+
 class Interface(object):
     """API required from Gesture implementations
     """
@@ -150,6 +540,89 @@ class Interface(object):
     def rotate(self, centerPos, beginPos, arcAngle=360, *kwargs):
         raise NotImplementedError
 
+    #####################
+    # gesture sequences #
+    #####################
+
+    # arguments
+    # gestures: list of (gestureName, args, kwargs) tuples
+
+    # Backends that can execute a timed path in one request override
+    # executeSequence and send sequencePath(gestures). By default
+    # gestures are replayed one by one.
+
+    def executeSequence(self, gestures):
+        for gestureName, args, kwargs in gestures:
+            getattr(self, gestureName)(*args, **kwargs)
+
+    def tapUnordered(self, positions, duration=0.0, **kwargs):
+        """Tap all positions in any order
+
+        Backends may reorder the taps to shorten movements. Returns
+        indices of positions in the order they were tapped.
+        """
+        for pos in positions:
+            self.tap(pos, duration, **kwargs)
+        return list(range(len(positions)))
+
+    def batch(self):
+        """Returns context that executes gestures made in it as one sequence
+
+        with gestureInstance.batch() as b:
+            b.tap((0.1, 0.1))
+            b.swipe((0.5, 0.9), (0.5, 0.1))
+        """
+        return Batch(self)
+
+    #########################
+    # asynchronous gestures #
+    #########################
+
+    # Gestures are queued in a CommandQueue and executed in
+    # submission order. Async variants return a Future immediately.
+
+    def submit(self, gestureName, *args, **kwargs):
+        """Queue gesture gestureName (for instance "tap"), returns Future
+        """
+        return self._commandQueue().submit(
+            getattr(self, gestureName), args, kwargs, gestureName)
+
+    def tapAsync(self, pos, duration=0.0, **kwargs):
+        return self.submit("tap", pos, duration, **kwargs)
+
+    def dragAsync(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        return self.submit("drag", beginPos, endPos, beginDuration, endDuration, **kwargs)
+
+    def swipeAsync(self, beginPos, endPos, **kwargs):
+        return self.submit("swipe", beginPos, endPos, **kwargs)
+
+    def flickAsync(self, beginPos, endPos, **kwargs):
+        return self.submit("flick", beginPos, endPos, **kwargs)
+
+    def flush(self, timeout=None):
+        """Wait until queued gestures are finished
+
+        Raises the first exception from queued gestures since the
+        previous flush.
+        """
+        queue = getattr(self, "_queue", None)
+        if queue != None:
+            queue.flush(timeout)
+
+    def cancelPending(self):
+        """Cancel queued gestures that have not been started
+        """
+        queue = getattr(self, "_queue", None)
+        if queue == None:
+            return 0
+        return queue.cancelPending()
+
+    def _commandQueue(self):
+        with _commandQueueLock:
+            if getattr(self, "_queue", None) == None:
+                self._queue = CommandQueue()
+            return self._queue
+
 
 class SwEmulation(Interface):
     """Software emulation of sending user input
@@ -174,3 +647,297 @@ class SwEmulation(Interface):
 
     def swipe(self, beginPos, endPos, **kwargs):
         self.drag(beginPos, endPos, 0.0, 0.0)
+
+
+def _dropped(conn):
+    # An idle connection is readable only if the server has closed it
+    # (or sent something unexpected), either way it cannot be reused.
+    if conn.sock == None:
+        return True
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (socket.error, ValueError):
+        return True
+
+class ConnectionPool(object):
+    """Pool of persistent HTTP/1.1 connections to one server
+
+    Connections are reused between requests, so requests do not pay
+    for TCP connection setup. A connection that fails is closed and
+    dropped from the pool.
+    """
+    def __init__(self, host, port, size=2, timeout=10.0):
+        self._host = host
+        self._port = port
+        self._size = size
+        self._timeout = timeout
+        self._idle = []
+        self._lock = threading.Lock()
+        self._stats = {"requests": 0, "connections": 0, "retries": 0}
+
+    def request(self, method, path, body=None, headers={}, timeout=None, retries=0):
+        """Send request, returns (status, response body)
+
+        Requests that fail while connecting or sending are sent again
+        on a new connection at most retries times. Once a request has
+        been sent, only idempotent requests are sent again: the server
+        may have executed a failed POST.
+        """
+        if timeout == None:
+            timeout = self._timeout
+        attempt = 0
+        while True:
+            conn = self._connection()
+            sent = False
+            try:
+                if conn.sock != None:
+                    conn.sock.settimeout(timeout)
+                else:
+                    conn.timeout = timeout
+                conn.request(method, path, body, headers)
+                sent = True
+                response = conn.getresponse()
+                data = response.read()
+            except socket.timeout:
+                # The robot may still be moving, sending again could
+                # execute the gesture twice.
+                conn.close()
+                raise
+            except (socket.error, httplib.HTTPException):
+                conn.close()
+                if attempt >= retries or (sent and method not in IDEMPOTENT_METHODS):
+                    raise
+                attempt += 1
+                with self._lock:
+                    self._stats["retries"] += 1
+                continue
+            with self._lock:
+                self._stats["requests"] += 1
+                if len(self._idle) < self._size and not response.will_close:
+                    self._idle.append(conn)
+                else:
+                    conn.close()
+            return response.status, data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn in idle:
+            conn.close()
+
+    def stats(self):
+        """Returns counts of requests, opened connections and retries
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def _connection(self):
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not _dropped(conn):
+                    return conn
+                conn.close()
+            self._stats["connections"] += 1
+        return httplib.HTTPConnection(self._host, self._port, timeout=self._timeout)
+
+
+class OptoHttp(Interface):
+    """Robot controlled over HTTP
+
+    Every gesture is a POST request with a JSON body to the gesture
+    name under the base URL, for instance {"pos": [0.5, 0.5],
+    "duration": 0.0} to /tap. Gesture sequences are sent to /path
+    as one timed path (see sequencePath). The server responds with
+    status 200 when the gesture has been executed.
+
+    robotserver.RobotServer implements the same protocol for testing
+    without a robot.
+    """
+    def __init__(self, url, timeout=10.0, retries=1, poolSize=2):
+        """Connect to a robot at url
+
+        Args:
+            url (str): base URL of the robot, "http://host:port/".
+
+            timeout (float): seconds to wait for a gesture to finish.
+                Can be overridden per gesture with timeout kwarg.
+
+            retries (int): how many times a gesture is sent again if
+                connecting or sending it fails. Gestures that reached
+                the robot are never sent again. Can be overridden per
+                gesture with retries kwarg.
+
+            poolSize (int): number of idle connections kept open.
+        """
+        parsed = urlparse.urlparse(url)
+        if parsed.scheme != "http" or not parsed.hostname:
+            raise ValueError('invalid robot URL: "%s"' % (url,))
+        self._basePath = parsed.path.rstrip("/")
+        self._timeout = timeout
+        self._retries = retries
+        self._pool = ConnectionPool(parsed.hostname, parsed.port or 80,
+                                    poolSize, timeout)
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        return self._post("tap", kwargs, pos=pos, duration=duration)
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        return self._post("drag", kwargs, beginPos=beginPos, endPos=endPos,
+                          beginDuration=beginDuration, endDuration=endDuration)
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        return self._post("swipe", kwargs, beginPos=beginPos, endPos=endPos)
+
+    def flick(self, beginPos, endPos, **kwargs):
+        return self._post("flick", kwargs, beginPos=beginPos, endPos=endPos)
+
+    def executeSequence(self, gestures):
+        path = [(t, pos[0], pos[1], pressed)
+                for t, pos, pressed in sequencePath(gestures)]
+        return self._post("path", {}, path=path)
+
+    def close(self):
+        """Close connections to the robot
+        """
+        self._pool.close()
+
+    def stats(self):
+        return self._pool.stats()
+
+    def _post(self, command, kwargs, **params):
+        timeout = kwargs.pop("timeout", self._timeout)
+        retries = kwargs.pop("retries", self._retries)
+        params.update(kwargs)
+        try:
+            status, data = self._pool.request(
+                "POST", "%s/%s" % (self._basePath, command),
+                json.dumps(params), {"Content-Type": "application/json"},
+                timeout=timeout, retries=retries)
+        except socket.timeout:
+            raise GestureTimeoutError('%s did not finish in %s s' % (command, timeout))
+        except (socket.error, httplib.HTTPException) as e:
+            raise GestureError('%s failed: %s' % (command, e))
+        if status != 200:
+            raise GestureError('%s failed: robot responded %s %s' % (
+                command, status, data.decode("utf-8", "replace")))
+        if data:
+            return json.loads(data.decode("utf-8")).get("result")
+        return None
+
+
+class Robot(Interface):
+    """Gestures executed with a robot.Interface implementation
+
+    Work area is mapped to robot coordinates with a calibration, or
+    linearly to the robot coordinates of its top-left and bottom-right
+    corners. The finger moves liftHeight above the display between
+    touches.
+    """
+    def __init__(self, robotInstance, topLeft=None, bottomRight=None, touchZ=0.0,
+                 liftHeight=5.0, hopDistance=20.0, hopHeight=1.0,
+                 calibrationInstance=None):
+        """Control robotInstance
+
+        Args:
+            robotInstance (robot.Interface instance): robot to move.
+
+            topLeft (tuple): (x, y) robot coordinates of work area
+                position (0.0, 0.0).
+
+            bottomRight (tuple): (x, y) robot coordinates of work area
+                position (1.0, 1.0).
+
+            touchZ (float): robot z coordinate of the display surface
+                if topLeft and bottomRight are given.
+
+            liftHeight (float): height of the finger above the display
+                when it moves between touches.
+
+            hopDistance (float): tapUnordered lifts the finger only
+                hopHeight between taps at most hopDistance (in
+                robot coordinates) from each other.
+
+            hopHeight (float): lift height between nearby taps.
+
+            calibrationInstance (calibration.Calibration instance):
+                robot coordinates of the display, used instead of
+                topLeft, bottomRight and touchZ.
+        """
+        if calibrationInstance == None:
+            if topLeft == None or bottomRight == None:
+                raise ValueError("calibrationInstance or topLeft and bottomRight required")
+            calibrationInstance = calibration.Calibration.fromRectangle(
+                topLeft, bottomRight, touchZ)
+        self._robot = robotInstance
+        self._calibration = calibrationInstance
+        self._liftHeight = liftHeight
+        self._hopDistance = hopDistance
+        self._hopHeight = hopHeight
+
+    def robot(self):
+        return self._robot
+
+    def calibration(self):
+        return self._calibration
+
+    def robotPos(self, pos, pressed=True):
+        """Returns robot coordinates (x, y, z) of work area position pos
+        """
+        x, y, z = self._calibration.transform(pos, "unity", "robot")
+        if not pressed:
+            z += self._liftHeight
+        return (x, y, z)
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self._executePath(gesturePath("tap", (pos, duration), kwargs))
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        self._executePath(gesturePath(
+            "drag", (beginPos, endPos, beginDuration, endDuration), kwargs))
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        self._executePath(gesturePath("swipe", (beginPos, endPos), kwargs))
+
+    def flick(self, beginPos, endPos, **kwargs):
+        self._executePath(gesturePath("flick", (beginPos, endPos), kwargs))
+
+    def executeSequence(self, gestures):
+        self._executePath(sequencePath(gestures))
+
+    def tapUnordered(self, positions, duration=0.0, **kwargs):
+        points = self._calibration.transformPoints(positions, "unity", "robot")
+        if not points:
+            return []
+        start = self._robot.position()
+        order = robot.planOrder(points, start[:2] + (points[0][2],),
+                                getattr(self._robot, "travelTime", robot.distance))
+        path = []
+        t = 0.0
+        previous = None
+        for index in order:
+            x, y, z = points[index]
+            if previous == None:
+                liftZ = z + self._liftHeight
+                path.append((t, (x, y, liftZ)))
+            else:
+                if robot.distance(previous, points[index]) <= self._hopDistance:
+                    liftZ = z + self._hopHeight
+                else:
+                    liftZ = z + self._liftHeight
+                path.append((t, previous[:2] + (liftZ,)))
+                path.append((t, (x, y, liftZ)))
+            path.append((t, (x, y, z)))
+            t += duration
+            path.append((t, (x, y, z)))
+            previous = points[index]
+        if previous != None:
+            path.append((t, previous[:2] + (previous[2] + self._liftHeight,)))
+        self._robot.execute(path)
+        return order
+
+    def _executePath(self, path):
+        points = self._calibration.transformPoints(
+            [pos for _, pos, _ in path], "unity", "robot")
+        self._robot.execute([(t, (x, y, z if pressed else z + self._liftHeight))
+                             for (t, _, pressed), (x, y, z) in zip(path, points)])
@@ -27,12 +27,53 @@
 
 # coordinate handler helpers
 
+import array
+import copy
 import math
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
 # returns pos
 def getPos(bbox, pos=(0.5, 0.5)):
     return (bbox[0][0] + pos[0] * (bbox[1][0] - bbox[0][0]), bbox[0][1] + pos[1] * (bbox[1][1] - bbox[0][1]))
 
+# returns intersection over union of two bboxes, 0.0 if they do not overlap
+def iou(bbox1, bbox2):
+    (left1, top1), (right1, bottom1) = bbox1
+    (left2, top2), (right2, bottom2) = bbox2
+    width = min(right1, right2) - max(left1, left2)
+    height = min(bottom1, bottom2) - max(top1, top2)
+    if width <= 0 or height <= 0:
+        return 0.0
+    intersection = width * height
+    union = ((right1 - left1) * (bottom1 - top1) +
+             (right2 - left2) * (bottom2 - top2) - intersection)
+    return intersection / float(union)
+
+# returns copy of element whose coordinates are relative to area, mapped
+# to the coordinate system where area is areaBbox
+def mapFromArea(element, areaBbox):
+    (left, top), (right, bottom) = areaBbox
+    width, height = right - left, bottom - top
+    def mapBbox(bbox):
+        (x1, y1), (x2, y2) = bbox
+        return ((left + x1 * width, top + y1 * height),
+                (left + x2 * width, top + y2 * height))
+    return mapElement(element, mapBbox)
+
+def mapElement(element, mapBbox):
+    """Returns copy of element with bounding box mapped with mapBbox
+    """
+    mapped = copy.copy(element)
+    mapped._setBbox(mapBbox(element.getBbox()))
+    if isinstance(element, TextRectangle) and not isinstance(element, Word):
+        object.__setattr__(mapped, "_words", tuple(
+            mapElement(word, mapBbox) for word in element.getWords()))
+    return mapped
+
 def getClockwiseArcAngle(arcAngle=360):
     return abs(arcAngle)
 
@@ -71,9 +112,12 @@ def angleDistToPos(area, beginPos, angle, distance):
     endPosY = beginPos[1] + math.sin(rad) * distanceToEdge * distance
     return (endPosX, endPosY)
 
-# all element objects are immutable
+# all element objects are immutable, attributes are set only when
+# they are created (and on fresh copies in mapElement)
 
 class Element(object):
+    __slots__ = ()
+
     def __init__(self):
         super(Element, self).__init__()
 
@@ -83,10 +127,29 @@ class Element(object):
     def getBbox(self):
         raise NotImplementedError
 
+    def __setattr__(self, name, value):
+        raise AttributeError("%s is immutable" % (self.__class__.__name__,))
+
+    def __delattr__(self, name):
+        raise AttributeError("%s is immutable" % (self.__class__.__name__,))
+
+    # slotted objects need explicit state for pickle protocols 0 and 1
+
+    def __getstate__(self):
+        return dict((name, getattr(self, name))
+                    for cls in self.__class__.__mro__
+                    for name in getattr(cls, "__slots__", ()))
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            object.__setattr__(self, name, value)
+
 class Location(Element):
+    __slots__ = ("_pos",)
+
     def __init__(self, pos):
         super(Location, self).__init__()
-        self._pos = pos
+        object.__setattr__(self, "_pos", pos)
 
     def getPos(self, pos=(0.5, 0.5)):
         return self._pos
@@ -94,10 +157,15 @@ class Location(Element):
     def getBbox(self):
         return (self._pos, self._pos)
 
+    def _setBbox(self, bbox):
+        object.__setattr__(self, "_pos", bbox[0])
+
 class Rectangle(Element):
+    __slots__ = ("_bbox",)
+
     def __init__(self, upperLeftPos, lowerRightPos):
         super(Rectangle, self).__init__()
-        self._bbox = (upperLeftPos, lowerRightPos)
+        object.__setattr__(self, "_bbox", (upperLeftPos, lowerRightPos))
 
     def getPos(self, pos=(0.5, 0.5)):
         return getPos(self._bbox, pos)
@@ -105,36 +173,232 @@ class Rectangle(Element):
     def getBbox(self):
         return self._bbox
 
+    def _setBbox(self, bbox):
+        object.__setattr__(self, "_bbox", bbox)
+
 class ImageRectangle(Rectangle):
-    def __init__(self, upperLeftPos, lowerRightPos, imageUri):
+    __slots__ = ("_imageUri", "_confidence")
+
+    def __init__(self, upperLeftPos, lowerRightPos, imageUri, confidence=None):
         super(ImageRectangle, self).__init__(upperLeftPos, lowerRightPos)
-        self._imageUri = imageUri
+        object.__setattr__(self, "_imageUri", imageUri)
+        object.__setattr__(self, "_confidence", confidence)
 
     def getImageUri(self):
         return self._imageUri
 
+    # returns match score 0.0 - 1.0, None if OIR did not report it
+    def getConfidence(self):
+        return getattr(self, "_confidence", None)
+
     def __repr__(self):
         return "%s(%s, %s, %s)" % (
             (self.__class__.__name__,) + self.getBbox() + (repr(self._imageUri),))
 
 # consequtive words that may occupy non-rectangular area (i.e. there is no guarantee that any particular position within bounding box has a word at it)
 class TextRectangle(Rectangle):
-    def __init__(self, upperLeftPos, lowerRightPos, text):
+    __slots__ = ("_text", "_words")
+
+    def __init__(self, upperLeftPos, lowerRightPos, text, words=()):
         super(TextRectangle, self).__init__(upperLeftPos, lowerRightPos)
-        self._text = text
+        object.__setattr__(self, "_text", text)
+        object.__setattr__(self, "_words", tuple(words))
 
     def getText(self):
         return self._text
 
+    # returns tuple of Word elements, empty if OCR did not report words
     def getWords(self):
-        # TODO
-        pass
+        return self._words
+
+    def __repr__(self):
+        return "%s(%s, %s, %s)" % (
+            (self.__class__.__name__,) + self.getBbox() + (repr(self._text),))
 
 # single word occupying rectangular area
 class Word(TextRectangle):
+    __slots__ = ()
+
     def __init__(self, upperLeftPos, lowerRightPos, word):
         super(Word, self).__init__(upperLeftPos, lowerRightPos, word)
 
     def getWords(self):
         return (self,)
 
+
+def _bboxOf(area):
+    # area is an Element or a bbox
+    if isinstance(area, Element):
+        return area.getBbox()
+    return area
+
+def _posOf(pos):
+    # pos is an Element or a position
+    if isinstance(pos, Element):
+        return pos.getPos()
+    return pos
+
+# tuple of elements with their bounding boxes in a contiguous float array
+# (left, top, right, bottom for each element) for fast spatial queries
+class ElementSet(tuple):
+    def __new__(cls, elements=()):
+        return super(ElementSet, cls).__new__(cls, elements)
+
+    def __init__(self, elements=()):
+        super(ElementSet, self).__init__()
+        coordinates = array.array("d")
+        for element in self:
+            (left, top), (right, bottom) = element.getBbox()
+            coordinates.extend((left, top, right, bottom))
+        self._coordinates = coordinates
+        self._array = None
+
+    def __reduce__(self):
+        return (self.__class__, (tuple(self),))
+
+    def __getslice__(self, i, j):
+        return self.__getitem__(slice(i, j))
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return self.__class__(tuple.__getitem__(self, index))
+        return tuple.__getitem__(self, index)
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, tuple.__repr__(self))
+
+    # returns bounding boxes as numpy array of shape (n, 4) if numpy
+    # is available, otherwise as array.array of 4 * n floats
+    def bboxes(self):
+        if numpy == None:
+            return self._coordinates
+        if self._array is None:
+            self._array = numpy.frombuffer(self._coordinates, dtype=float).reshape(-1, 4) \
+                if self._coordinates else numpy.zeros((0, 4))
+        return self._array
+
+    # returns elements whose bounding box is inside area
+    def within(self, area):
+        (left, top), (right, bottom) = _bboxOf(area)
+        return self._select(lambda l, t, r, b: (l >= left) & (t >= top) &
+                            (r <= right) & (b <= bottom))
+
+    # returns elements whose bounding box intersects area
+    def intersecting(self, area):
+        (left, top), (right, bottom) = _bboxOf(area)
+        return self._select(lambda l, t, r, b: (l <= right) & (r >= left) &
+                            (t <= bottom) & (b >= top))
+
+    # returns elements ordered by distance of their centers from pos
+    # (position or element)
+    def byDistance(self, pos):
+        x, y = _posOf(pos)
+        if numpy != None and len(self):
+            b = self.bboxes()
+            distances = ((b[:, 0] + b[:, 2]) / 2 - x) ** 2 + ((b[:, 1] + b[:, 3]) / 2 - y) ** 2
+            order = numpy.argsort(distances, kind="mergesort")
+        else:
+            c = self._coordinates
+            order = sorted(range(len(self)), key=lambda i: (
+                ((c[4 * i] + c[4 * i + 2]) / 2 - x) ** 2 +
+                ((c[4 * i + 1] + c[4 * i + 3]) / 2 - y) ** 2))
+        return self.__class__(tuple.__getitem__(self, i) for i in order)
+
+    # returns element nearest to pos (position or element), None if the
+    # set is empty
+    def nearest(self, pos):
+        if not self:
+            return None
+        return self.byDistance(pos)[0]
+
+    # returns elements overlapping reference (element or bbox) more than
+    # minIou intersection over union
+    def overlapping(self, reference, minIou=0.0):
+        (left, top), (right, bottom) = _bboxOf(reference)
+        area = (right - left) * (bottom - top)
+        def condition(l, t, r, b):
+            width = _minimum(r, right) - _maximum(l, left)
+            height = _minimum(b, bottom) - _maximum(t, top)
+            intersection = _maximum(width, 0.0) * _maximum(height, 0.0)
+            union = (r - l) * (b - t) + area - intersection
+            return (width > 0) & (height > 0) & (intersection > minIou * union)
+        return self._select(condition)
+
+    # returns elements right of reference (element or bbox) on the same
+    # row, nearest first. Elements on the same row overlap vertically.
+    def rightOf(self, reference):
+        (left, top), (right, bottom) = _bboxOf(reference)
+        return self._select(
+            lambda l, t, r, b: (l >= right) & (t < bottom) & (b > top),
+            lambda l, t, r, b: l - right)
+
+    def leftOf(self, reference):
+        (left, top), (right, bottom) = _bboxOf(reference)
+        return self._select(
+            lambda l, t, r, b: (r <= left) & (t < bottom) & (b > top),
+            lambda l, t, r, b: left - r)
+
+    # returns elements below reference (element or bbox) in the same
+    # column, nearest first. Elements in the same column overlap
+    # horizontally.
+    def below(self, reference):
+        (left, top), (right, bottom) = _bboxOf(reference)
+        return self._select(
+            lambda l, t, r, b: (t >= bottom) & (l < right) & (r > left),
+            lambda l, t, r, b: t - bottom)
+
+    def above(self, reference):
+        (left, top), (right, bottom) = _bboxOf(reference)
+        return self._select(
+            lambda l, t, r, b: (b <= top) & (l < right) & (r > left),
+            lambda l, t, r, b: top - b)
+
+    # returns elements in reading order: lines from top to bottom,
+    # elements in lines from left to right. Elements are on the same
+    # line if their vertical centers are closer than lineTolerance
+    # times the height of the first element of the line.
+    def readingOrder(self, lineTolerance=0.5):
+        c = self._coordinates
+        order = sorted(range(len(self)), key=lambda i: (c[4 * i + 1] + c[4 * i + 3], c[4 * i]))
+        lines = []
+        lineCenter = lineHeight = None
+        for i in order:
+            center = (c[4 * i + 1] + c[4 * i + 3]) / 2
+            if lines and abs(center - lineCenter) <= lineTolerance * lineHeight:
+                lines[-1].append(i)
+            else:
+                lines.append([i])
+                lineCenter, lineHeight = center, c[4 * i + 3] - c[4 * i + 1]
+        return self.__class__(tuple.__getitem__(self, i)
+                              for line in lines
+                              for i in sorted(line, key=lambda i: c[4 * i]))
+
+    def _select(self, condition, key=None):
+        # condition(left, top, right, bottom) and key are evaluated on
+        # numpy columns at once, or on each element without numpy.
+        # Selected elements are sorted by key if given.
+        if numpy != None and len(self):
+            b = self.bboxes()
+            columns = (b[:, 0], b[:, 1], b[:, 2], b[:, 3])
+            indices = numpy.nonzero(condition(*columns))[0]
+            if key != None:
+                keys = key(*columns)[indices]
+                indices = indices[numpy.argsort(keys, kind="mergesort")]
+        else:
+            c = self._coordinates
+            indices = [i for i in range(len(self))
+                       if condition(c[4 * i], c[4 * i + 1], c[4 * i + 2], c[4 * i + 3])]
+            if key != None:
+                indices.sort(key=lambda i: key(c[4 * i], c[4 * i + 1],
+                                               c[4 * i + 2], c[4 * i + 3]))
+        return self.__class__(tuple.__getitem__(self, i) for i in indices)
+
+def _minimum(a, b):
+    if numpy != None:
+        return numpy.minimum(a, b)
+    return min(a, b)
+
+def _maximum(a, b):
+    if numpy != None:
+        return numpy.maximum(a, b)
+    return max(a, b)
@@ -29,17 +29,271 @@
 ocr - interface for optical character recognition
 """
 
+import bisect
+import collections
+import threading
+
+import camera
 import guielements
 
+def _editDistance(s1, s2, maxDistance):
+    """Returns Levenshtein distance of s1 and s2, or maxDistance + 1
+    if the distance is greater than maxDistance
+    """
+    if abs(len(s1) - len(s2)) > maxDistance:
+        return maxDistance + 1
+    previous = range(len(s2) + 1)
+    for i, c1 in enumerate(s1):
+        current = [i + 1]
+        for j, c2 in enumerate(s2):
+            current.append(min(previous[j + 1] + 1, current[j] + 1,
+                               previous[j] + (c1 != c2)))
+        if min(current) > maxDistance:
+            return maxDistance + 1
+        previous = current
+    return previous[-1]
+
+def _inArea(element, area):
+    if area == None:
+        return True
+    x, y = element.getPos()
+    (left, top), (right, bottom) = area
+    return left <= x <= right and top <= y <= bottom
+
+class TextIndex(object):
+    """Index of words recognised on a frame
+
+    Words are grouped into lines in reading order. Texts are searched
+    from words and from consecutive words on a line with match
+    "exact", "prefix" (the last word of the text may be a prefix of a
+    recognised word) or "fuzzy" (case-insensitive, each word may have
+    up to fuzziness * length edits).
+    """
+    def __init__(self, words, fuzziness=0.25):
+        self._fuzziness = fuzziness
+        self._lines = self._groupLines(words)
+        self._positions = {} # word text -> [(line index, word index)]
+        for lineIndex, line in enumerate(self._lines):
+            for wordIndex, word in enumerate(line.getWords()):
+                self._positions.setdefault(word.getText(), []).append(
+                    (lineIndex, wordIndex))
+        self._sortedTexts = sorted(self._positions)
+
+    def _groupLines(self, words):
+        lines = []
+        for word in sorted(words, key=lambda w: w.getPos()[1]):
+            y = word.getPos()[1]
+            if lines and lines[-1][0] <= y <= lines[-1][1]:
+                lines[-1][2].append(word)
+            else:
+                (_, top), (_, bottom) = word.getBbox()
+                lines.append([top, bottom, [word]])
+        textLines = []
+        for _, _, lineWords in lines:
+            lineWords.sort(key=lambda w: w.getBbox()[0][0])
+            textLines.append(self._textRectangle(lineWords))
+        textLines.sort(key=lambda line: (line.getBbox()[0][1],
+                                         line.getBbox()[0][0]))
+        return textLines
+
+    def _textRectangle(self, words):
+        bboxes = [word.getBbox() for word in words]
+        return guielements.TextRectangle(
+            (min(b[0][0] for b in bboxes), min(b[0][1] for b in bboxes)),
+            (max(b[1][0] for b in bboxes), max(b[1][1] for b in bboxes)),
+            " ".join(word.getText() for word in words), words)
+
+    def words(self):
+        """Returns guielements.ElementSet of all words in reading order
+        """
+        return guielements.ElementSet(
+            word for line in self._lines for word in line.getWords())
+
+    def lines(self):
+        """Returns tuple of TextRectangles, one for each line
+        """
+        return tuple(self._lines)
+
+    def _wordMatches(self, text, query, match, last):
+        if match == "exact":
+            return text == query
+        elif match == "prefix":
+            return text.startswith(query) if last else text == query
+        maxDistance = int(self._fuzziness * len(query))
+        return _editDistance(text.lower(), query.lower(),
+                             maxDistance) <= maxDistance
+
+    def _candidates(self, query, match, last):
+        """Returns texts of indexed words that match query
+        """
+        if match == "exact" or (match == "prefix" and not last):
+            return [query] if query in self._positions else []
+        elif match == "prefix":
+            begin = bisect.bisect_left(self._sortedTexts, query)
+            end = bisect.bisect_left(self._sortedTexts, query + u"\uffff")
+            return self._sortedTexts[begin:end]
+        return [text for text in self._sortedTexts
+                if self._wordMatches(text, query, match, last)]
+
+    def find(self, text, match="exact", area=None):
+        """Returns tuple of elements where text was found
+
+        Single word matches are returned as Words, matches spanning
+        many words as TextRectangles that contain the words. If area
+        is given, only elements whose center is in the area are
+        returned.
+        """
+        if not match in ("exact", "prefix", "fuzzy"):
+            raise ValueError('invalid match: "%s"' % (match,))
+        queries = text.split()
+        if not queries:
+            return ()
+        results = []
+        for candidate in self._candidates(queries[0], match, len(queries) == 1):
+            for lineIndex, wordIndex in self._positions[candidate]:
+                lineWords = self._lines[lineIndex].getWords()
+                found = lineWords[wordIndex:wordIndex + len(queries)]
+                if len(found) < len(queries):
+                    continue
+                if not all(self._wordMatches(found[i].getText(), queries[i],
+                                             match, i == len(queries) - 1)
+                           for i in xrange(1, len(queries))):
+                    continue
+                if len(found) == 1:
+                    element = found[0]
+                else:
+                    element = self._textRectangle(found)
+                if _inArea(element, area):
+                    results.append(element)
+        results.sort(key=lambda e: (e.getBbox()[0][1], e.getBbox()[0][0]))
+        return tuple(results)
+
+class TextIndexCache(object):
+    """OCR backend that searches texts from cached TextIndexes
+
+    Each frame is recognised once with ocrWords of the wrapped
+    backend. The index is cached by frame digest, so searching more
+    texts from the same frame, or from an identical frame, does not
+    run OCR again.
+    """
+    def __init__(self, ocrInstance, match="exact", size=4):
+        self._ocr = ocrInstance
+        self._match = match
+        self._size = size
+        self._indexes = collections.OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    def __getstate__(self):
+        # Indexes are not shared between processes.
+        state = dict(self.__dict__)
+        state["_indexes"] = collections.OrderedDict()
+        del state["_lock"]
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def match(self):
+        return self._match
+
+    def size(self):
+        return self._size
+
+    def index(self, frame):
+        """Returns TextIndex of frame
+        """
+        key = frame.digest()
+        with self._lock:
+            if key != None and key in self._indexes:
+                self._hits += 1
+                textIndex = self._indexes.pop(key)
+                self._indexes[key] = textIndex
+                return textIndex
+            self._misses += 1
+            if isinstance(frame, camera.BufferFrame):
+                words = self._ocr.ocrWordsBuffer(frame)
+            else:
+                words = self._ocr.ocrWords(frame)
+            textIndex = TextIndex(words)
+            if key != None:
+                self._indexes[key] = textIndex
+                while len(self._indexes) > self._size:
+                    self._indexes.popitem(last=False)
+            return textIndex
+
+    def ocrLocate(self, haystack, text, area=None):
+        return self.index(haystack).find(text, self._match, area)
+
+    ocrLocateBuffer = ocrLocate
+
+    def stats(self):
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "entries": len(self._indexes)}
+
 class Interface(object):
     """API required from OCR implementations
     """
     def __init__(self):
         super(Interface, self).__init__()
 
-    def ocrLocate(self, haystackFilename, text):
+    def parameters(self):
+        """Returns dictionary of settings that affect results
+
+        Results in persistent caches are keyed by the backend class
+        and these parameters. Values must be JSON serializable.
+        """
+        return {}
+
+    def ocrLocate(self, haystack, text, area=None):
+        """Returns tuple of elements found in haystack
+
+        haystack is a camera.Frame. Name of an image file is accepted,
+        too.
+
+        If area ((left, top), (right, bottom) in unity coordinates) is
+        given, only that part of haystack is searched. Elements are
+        always returned in unity coordinates of the whole haystack.
+        """
+        raise NotImplementedError
+
+    def ocrLocateBuffer(self, haystack, text, area=None):
+        """Returns tuple of elements found in haystack
+
+        haystack is a camera.BufferFrame. Backends that read pixels
+        from memory override this. The default implementation passes
+        the frame, cropped to area, to ocrLocate. That makes the frame
+        write itself to a file if the backend asks for the file name.
+        """
+        if area == None:
+            return self.ocrLocate(haystack, text)
+        haystack, area = haystack.crop(area)
+        return tuple(guielements.mapFromArea(element, area)
+                     for element in self.ocrLocate(haystack, text))
+
+    def ocrWords(self, haystack, area=None):
+        """Returns tuple of guielements.Word, all words recognised
+        in haystack
+
+        haystack is a camera.Frame. Backends that support TextIndex
+        implement this.
+        """
         raise NotImplementedError
 
+    def ocrWordsBuffer(self, haystack, area=None):
+        """Returns tuple of guielements.Word recognised in haystack
+
+        haystack is a camera.BufferFrame, see ocrLocateBuffer.
+        """
+        if area == None:
+            return self.ocrWords(haystack)
+        haystack, area = haystack.crop(area)
+        return tuple(guielements.mapFromArea(element, area)
+                     for element in self.ocrWords(haystack))
+
 class FmbtOcr(Interface):
     """Optical character recognition from fMBT's GUITestInterface
     """
@@ -47,14 +301,44 @@ class FmbtOcr(Interface):
         super(FmbtOcr, self).__init__()
         self._gti = guiTestInterface
 
-    def ocrLocate(self, haystackFilename, text):
+    def _screenshot(self, haystack):
+        if isinstance(haystack, camera.Frame):
+            return haystack.image(self._gti, self._gti.refreshScreenshot)
+        return self._gti.refreshScreenshot(haystack)
+
+    def ocrLocate(self, haystack, text, area=None):
         results = []
-        sshot = self._gti.refreshScreenshot(haystackFilename)
+        sshot = self._screenshot(haystack)
         width, height = sshot.size()
         fwidth, fheight = float(width), float(height)
-        for guiItem in sshot.findItemsByOcr(text):
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        for guiItem in sshot.findItemsByOcr(text, area=area[0] + area[1]):
             left, top, right, bottom = guiItem.bbox()
             results.append(guielements.TextRectangle(
                 (left/fwidth, top/fheight),
                 (right/fwidth, bottom/fheight), text))
         return tuple(results)
+
+    def ocrWords(self, haystack, area=None):
+        results = []
+        sshot = self._screenshot(haystack)
+        width, height = sshot.size()
+        fwidth, fheight = float(width), float(height)
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        # dumpOcr lists recognised words first, the format of the
+        # rest of each entry depends on the OCR engine. Word positions
+        # come from GUIItems like in ocrLocate.
+        words = []
+        for entry in sshot.dumpOcr(area=area[0] + area[1]):
+            if not entry[0] in words:
+                words.append(entry[0])
+        for word in words:
+            for guiItem in sshot.findItemsByOcr(word, match=1.0,
+                                                area=area[0] + area[1]):
+                left, top, right, bottom = guiItem.bbox()
+                results.append(guielements.Word(
+                    (left/fwidth, top/fheight),
+                    (right/fwidth, bottom/fheight), word))
+        return tuple(results)
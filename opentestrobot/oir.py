@@ -29,17 +29,137 @@
 oir - interface for optical image recognition
 """
 
+import collections
+import math
+import os
+
+import camera
 import guielements
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+class NeedleCache(object):
+    """LRU cache of needles prepared by OIR backends
+
+    Entries are keyed by image file name and validated against file
+    modification time and size, so that edited images are reloaded.
+    Least recently used entries are evicted when the total size of
+    cached needles exceeds maxBytes.
+    """
+    def __init__(self, maxBytes=64 * 1024 * 1024):
+        self._maxBytes = maxBytes
+        self._entries = collections.OrderedDict()
+        self._bytes = 0
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def get(self, filename, loader, forceReload=False):
+        """Returns needle loaded from filename
+
+        Calls loader(filename) if the file is not in the cache, has
+        changed since it was loaded, or forceReload is True.
+        """
+        st = os.stat(filename)
+        fileId = (st.st_mtime, st.st_size)
+        entry = self._entries.pop(filename, None)
+        if entry != None:
+            self._bytes -= entry[2]
+            if entry[0] == fileId and not forceReload:
+                self._hits += 1
+                # needles may have grown since they were stored
+                self._store(filename, (entry[0], entry[1], _needleBytes(entry[1])))
+                return entry[1]
+        self._misses += 1
+        needle = loader(filename)
+        self._store(filename, (fileId, needle, _needleBytes(needle)))
+        return needle
+
+    def _store(self, filename, entry):
+        self._entries[filename] = entry
+        self._bytes += entry[2]
+        while self._bytes > self._maxBytes and len(self._entries) > 1:
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted[2]
+            self._evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._bytes = 0
+
+    def stats(self):
+        """Returns dictionary of cache counters
+        """
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "maxBytes": self._maxBytes}
+
+def _needleBytes(needle):
+    nbytes = getattr(needle, "nbytes", None)
+    if callable(nbytes):
+        return nbytes()
+    elif nbytes != None:
+        return nbytes
+    try:
+        return len(needle)
+    except TypeError:
+        return 0
+
 class Interface(object):
     """API required from OIR implementations
     """
     def __init__(self):
         super(Interface, self).__init__()
 
-    def oirLocate(self, haystackFilename, needleFilename):
+    def loadNeedle(self, needleFilename):
+        """Returns needle to be searched with oirLocate
+
+        Backends that decode or preprocess images override this, and
+        vision caches the returned needles in a NeedleCache. The
+        default needle is the image file name.
+        """
+        return needleFilename
+
+    def parameters(self):
+        """Returns dictionary of settings that affect results
+
+        Results in persistent caches are keyed by the backend class
+        and these parameters. Values must be JSON serializable.
+        """
+        return {}
+
+    def oirLocate(self, haystack, needle, area=None):
+        """Returns tuple of elements found in haystack
+
+        haystack is a camera.Frame. Name of an image file is accepted,
+        too. needle is returned by loadNeedle.
+
+        If area ((left, top), (right, bottom) in unity coordinates) is
+        given, only that part of haystack is searched. Elements are
+        always returned in unity coordinates of the whole haystack.
+        """
         raise NotImplementedError
 
+    def oirLocateBuffer(self, haystack, needle, area=None):
+        """Returns tuple of elements found in haystack
+
+        haystack is a camera.BufferFrame. Backends that read pixels
+        from memory override this. The default implementation passes
+        the frame, cropped to area, to oirLocate. That makes the frame
+        write itself to a file if the backend asks for the file name.
+        """
+        if area == None:
+            return self.oirLocate(haystack, needle)
+        haystack, area = haystack.crop(area)
+        return tuple(guielements.mapFromArea(element, area)
+                     for element in self.oirLocate(haystack, needle))
+
 class FmbtOir(Interface):
     """Optical image recognition from fMBT's GUITestInterface
     """
@@ -47,14 +167,328 @@ class FmbtOir(Interface):
         super(FmbtOir, self).__init__()
         self._gti = guiTestInterface
 
-    def oirLocate(self, haystackFilename, needleFilename):
+    def _screenshot(self, haystack):
+        if isinstance(haystack, camera.Frame):
+            return haystack.image(self._gti, self._gti.refreshScreenshot)
+        return self._gti.refreshScreenshot(haystack)
+
+    def oirLocate(self, haystack, needleFilename, area=None):
         results = []
-        sshot = self._gti.refreshScreenshot(haystackFilename)
+        sshot = self._screenshot(haystack)
         width, height = sshot.size()
         fwidth, fheight = float(width), float(height)
-        for guiItem in sshot.findItemsByBitmap(needleFilename):
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        for guiItem in sshot.findItemsByBitmap(needleFilename, area=area[0] + area[1]):
             left, top, right, bottom = guiItem.bbox()
             results.append(guielements.ImageRectangle(
                 (left/fwidth, top/fheight),
                 (right/fwidth, bottom/fheight), needleFilename))
         return tuple(results)
+
+def _grayArray(width, height, channels, pixels, order=(0, 1, 2)):
+    # float32 luma of interleaved 8-bit pixels
+    image = numpy.frombuffer(bytes(pixels), dtype=numpy.uint8).reshape(
+        height, width, channels)
+    return _luma(image, order)
+
+def _luma(image, order=(0, 1, 2)):
+    # image is (height, width, channels) uint8, order tells channels
+    # of red, green and blue
+    if image.shape[2] < 3:
+        return image[:, :, 0].astype(numpy.float32)
+    r, g, b = order
+    image = image.astype(numpy.float32)
+    return (image[:, :, r] * 0.299 + image[:, :, g] * 0.587 +
+            image[:, :, b] * 0.114)
+
+def _downsample(image):
+    """Returns image with half the width and height, 2x2 box filter
+    """
+    height, width = image.shape[0] // 2 * 2, image.shape[1] // 2 * 2
+    image = image[:height, :width]
+    return (image[0::2, 0::2] + image[1::2, 0::2] +
+            image[0::2, 1::2] + image[1::2, 1::2]) * 0.25
+
+def _resize(image, scale):
+    """Returns image scaled by scale, bilinear interpolation
+    """
+    height, width = image.shape
+    newHeight = max(1, int(round(height * scale)))
+    newWidth = max(1, int(round(width * scale)))
+    def samples(size, newSize):
+        coordinates = numpy.clip((numpy.arange(newSize) + 0.5) * size / float(newSize) - 0.5,
+                                 0, size - 1)
+        first = numpy.floor(coordinates).astype(int)
+        second = numpy.minimum(first + 1, size - 1)
+        return first, second, coordinates - first
+    y0, y1, fy = samples(height, newHeight)
+    x0, x1, fx = samples(width, newWidth)
+    top = image[y0][:, x0] * (1 - fx) + image[y0][:, x1] * fx
+    bottom = image[y1][:, x0] * (1 - fx) + image[y1][:, x1] * fx
+    return (top * (1 - fy)[:, None] + bottom * fy[:, None]).astype(image.dtype)
+
+def _windowSums(image, height, width):
+    # sums of image over all height x width windows, integral image,
+    # float64 because float32 sums of a frame lose the fractions
+    integral = numpy.zeros((image.shape[0] + 1, image.shape[1] + 1))
+    integral[1:, 1:] = image.cumsum(0, dtype=numpy.float64).cumsum(1)
+    return (integral[height:, width:] - integral[:-height, width:] -
+            integral[height:, :-width] + integral[:-height, :-width])
+
+def _fftSize(n):
+    # smallest 2^i * 3^j * 5^k >= n, FFT is slow on large prime sizes
+    best = 1
+    while best < n:
+        best *= 2
+    power5 = 1
+    while power5 < best:
+        power35 = power5
+        while power35 < best:
+            size = power35
+            while size < n:
+                size *= 2
+            best = min(best, size)
+            power35 *= 3
+        power5 *= 5
+    return best
+
+def matchTemplate(image, template):
+    """Returns normalized cross-correlation of template and image
+
+    Element [y, x] of the returned array is the correlation (-1.0 -
+    1.0) of template and the window of image whose top-left corner is
+    at (x, y). Cross-correlation is computed with FFT and window
+    statistics with integral images. Windows without contrast score
+    0.0, unless the template is flat, too, and of similar brightness.
+    """
+    height, width = template.shape
+    imageHeight, imageWidth = image.shape
+    if height > imageHeight or width > imageWidth:
+        return numpy.zeros((0, 0))
+    n = float(height * width)
+    sums = _windowSums(image, height, width)
+    variances = _windowSums(numpy.square(image, dtype=numpy.float64),
+                            height, width) - sums * sums / n
+    t = template - template.mean(dtype=numpy.float64)
+    tNorm = math.sqrt((t * t).sum())
+    if tNorm < 1e-6:
+        flat = (variances < n) & (abs(sums / n - template.mean()) < 4.0)
+        return flat.astype(numpy.float64)
+    shape = (_fftSize(imageHeight + height - 1), _fftSize(imageWidth + width - 1))
+    correlation = numpy.fft.irfft2(
+        numpy.fft.rfft2(image, shape) * numpy.fft.rfft2(t[::-1, ::-1], shape),
+        shape)[height - 1:imageHeight, width - 1:imageWidth]
+    scores = numpy.zeros(correlation.shape)
+    valid = variances > 1e-3 * n
+    scores[valid] = correlation[valid] / (numpy.sqrt(variances[valid]) * tNorm)
+    return numpy.clip(scores, -1.0, 1.0)
+
+def _peaks(scores, threshold, maxPeaks, minDistance):
+    """Returns up to maxPeaks (y, x, score) of best scores, at least
+    minDistance (dy, dx) apart from each other
+    """
+    ys, xs = numpy.nonzero(scores >= threshold)
+    peaks = []
+    for index in numpy.argsort(-scores[ys, xs])[:maxPeaks * 64]:
+        y, x = int(ys[index]), int(xs[index])
+        if all(abs(y - py) >= minDistance[0] or abs(x - px) >= minDistance[1]
+               for py, px, _ in peaks):
+            peaks.append((y, x, float(scores[y, x])))
+            if len(peaks) >= maxPeaks:
+                break
+    return peaks
+
+def _iou(box1, box2):
+    # boxes are (x, y, width, height)
+    left, top = max(box1[0], box2[0]), max(box1[1], box2[1])
+    right = min(box1[0] + box1[2], box2[0] + box2[2])
+    bottom = min(box1[1] + box1[3], box2[1] + box2[3])
+    if right <= left or bottom <= top:
+        return 0.0
+    intersection = float((right - left) * (bottom - top))
+    return intersection / (box1[2] * box1[3] + box2[2] * box2[3] - intersection)
+
+class PyramidNeedle(object):
+    """Needle of PyramidOir: grayscale image and its scaled versions
+
+    Versions in scales are prepared when the needle is created, so
+    that nbytes() includes them when the needle is cached.
+    """
+    def __init__(self, filename, image, scales=()):
+        self.filename = filename
+        self.image = image
+        self._scaled = {}
+        for scale in scales:
+            self.scaled(scale)
+
+    def scaled(self, scale):
+        if not scale in self._scaled:
+            if scale == 1.0:
+                self._scaled[scale] = self.image
+            else:
+                self._scaled[scale] = _resize(self.image, scale)
+        return self._scaled[scale]
+
+    def nbytes(self):
+        return sum(image.nbytes for scale, image in self._scaled.items()
+                   if scale != 1.0) + self.image.nbytes
+
+class PyramidOir(Interface):
+    """Coarse-to-fine template matching with NumPy
+
+    Images are compared as grayscale by normalized cross-correlation.
+    The needle is first matched on a downsampled level of an image
+    pyramid of the frame, where the needle is still at least
+    minNeedleSize pixels. Candidates that score at least threshold -
+    coarseMargin there are refined by matching the needle around them
+    at full resolution. Results score at least threshold, their
+    confidence (guielements.ImageRectangle.getConfidence) is the
+    score.
+
+    Needles are searched in scales from scaleRange[0] to
+    scaleRange[1], in steps of scaleStep, for icons whose size in
+    camera frames differs from the needle image.
+
+    Needle images are read with camera.readImage: PNG, PGM and PPM
+    files are supported. The float32 grayscale image of a frame and
+    its pyramid are stored in the frame, all needles searched from the
+    frame share them.
+    """
+    def __init__(self, threshold=0.9, scaleRange=(1.0, 1.0), scaleStep=0.05,
+                 minNeedleSize=8, maxLevel=4, coarseMargin=0.25, maxCandidates=16):
+        if numpy == None:
+            raise ImportError("numpy is required for PyramidOir")
+        super(PyramidOir, self).__init__()
+        self._threshold = threshold
+        self._scales = []
+        scale = scaleRange[0]
+        while scale <= scaleRange[1] + 1e-9:
+            self._scales.append(round(scale, 6))
+            scale += scaleStep
+        self._minNeedleSize = minNeedleSize
+        self._maxLevel = maxLevel
+        self._coarseMargin = coarseMargin
+        self._maxCandidates = maxCandidates
+
+    def scales(self):
+        return list(self._scales)
+
+    def parameters(self):
+        return {"threshold": self._threshold,
+                "scales": self._scales,
+                "minNeedleSize": self._minNeedleSize,
+                "maxLevel": self._maxLevel,
+                "coarseMargin": self._coarseMargin,
+                "maxCandidates": self._maxCandidates}
+
+    def loadNeedle(self, needleFilename):
+        return PyramidNeedle(needleFilename,
+                             _grayArray(*camera.readImage(needleFilename)),
+                             self._scales)
+
+    def oirLocate(self, haystack, needle, area=None):
+        if isinstance(haystack, camera.Frame):
+            image = haystack.image(
+                (PyramidOir, "gray"),
+                lambda filename: _grayArray(*camera.readImage(filename)))
+            return self._locate(image, needle, area, haystack)
+        image = _grayArray(*camera.readImage(haystack))
+        return self._locate(image, needle, area)
+
+    def oirLocateBuffer(self, haystack, needle, area=None):
+        image = haystack.image((PyramidOir, "gray"))
+        if image is None:
+            order = (2, 1, 0) if haystack.format().startswith("BGR") else (0, 1, 2)
+            image = _luma(haystack.array(), order)
+            haystack.setImage((PyramidOir, "gray"), image)
+        return self._locate(image, needle, area, haystack)
+
+    def _pyramid(self, image, level, frame=None):
+        """Returns tuple of image and its downsampled levels up to level
+
+        Levels are stored in frame, so that they are computed once for
+        all needles searched from it.
+        """
+        pyramid = None
+        if frame != None:
+            pyramid = frame.image((PyramidOir, "pyramid"))
+        if pyramid == None or not pyramid[0] is image:
+            pyramid = (image,)
+        if len(pyramid) <= level:
+            while len(pyramid) <= level:
+                pyramid += (_downsample(pyramid[-1]),)
+            if frame != None:
+                frame.setImage((PyramidOir, "pyramid"), pyramid)
+        return pyramid
+
+    def _locate(self, image, needle, area, frame=None):
+        if isinstance(needle, basestring):
+            needle = self.loadNeedle(needle)
+        frameImage = image
+        frameHeight, frameWidth = image.shape
+        offsetX, offsetY, endX, endY = 0, 0, frameWidth, frameHeight
+        if area != None:
+            (left, top), (right, bottom) = area
+            offsetX = max(0, int(math.floor(left * frameWidth)))
+            offsetY = max(0, int(math.floor(top * frameHeight)))
+            endX = int(math.ceil(right * frameWidth))
+            endY = int(math.ceil(bottom * frameHeight))
+            image = image[offsetY:endY, offsetX:endX]
+        found = [] # (score, (x, y, width, height))
+        for scale in self._scales:
+            template = needle.scaled(scale)
+            height, width = template.shape
+            if height > image.shape[0] or width > image.shape[1]:
+                continue
+            level = 0
+            while (level < self._maxLevel and
+                   min(height, width) >> (level + 1) >= self._minNeedleSize):
+                level += 1
+            if level == 0:
+                candidates = _peaks(matchTemplate(image, template), self._threshold,
+                                    self._maxCandidates, (height // 2 or 1, width // 2 or 1))
+                found.extend((score, (x, y, width, height))
+                             for y, x, score in candidates)
+                continue
+            coarseTemplate = template
+            for _ in range(level):
+                coarseTemplate = _downsample(coarseTemplate)
+            coarseHeight, coarseWidth = coarseTemplate.shape
+            # the level of the whole frame is cropped at a multiple of
+            # 1 << level, coarse positions are relative to that
+            coarseOffsetX, coarseOffsetY = offsetX >> level, offsetY >> level
+            coarseImage = self._pyramid(frameImage, level, frame)[level][
+                coarseOffsetY:(endY + (1 << level) - 1) >> level,
+                coarseOffsetX:(endX + (1 << level) - 1) >> level]
+            candidates = _peaks(matchTemplate(coarseImage, coarseTemplate),
+                                self._threshold - self._coarseMargin,
+                                self._maxCandidates,
+                                (coarseHeight // 2 or 1, coarseWidth // 2 or 1))
+            margin = (1 << level) + 1
+            for coarseY, coarseX, _ in candidates:
+                fineY = ((coarseY + coarseOffsetY) << level) - offsetY
+                fineX = ((coarseX + coarseOffsetX) << level) - offsetX
+                y0, x0 = max(0, fineY - margin), max(0, fineX - margin)
+                window = image[y0:fineY + margin + height, x0:fineX + margin + width]
+                scores = matchTemplate(window, template)
+                if scores.size == 0:
+                    continue
+                y, x = numpy.unravel_index(numpy.argmax(scores), scores.shape)
+                if scores[y, x] >= self._threshold:
+                    found.append((float(scores[y, x]),
+                                  (x0 + int(x), y0 + int(y), width, height)))
+        # best matches first, drop overlapping worse matches
+        results = []
+        kept = []
+        for score, box in sorted(found, key=lambda match: -match[0]):
+            if any(_iou(box, other) > 0.5 for other in kept):
+                continue
+            kept.append(box)
+            x, y, width, height = box
+            x, y = x + offsetX, y + offsetY
+            results.append(guielements.ImageRectangle(
+                (x / float(frameWidth), y / float(frameHeight)),
+                ((x + width) / float(frameWidth), (y + height) / float(frameHeight)),
+                needle.filename, max(0.0, min(1.0, score))))
+        return tuple(results)
@@ -0,0 +1,236 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Persistentcache -- recognition results stored on disk
+
+Results of OIR and OCR queries are stored in an SQLite database keyed
+by the digest of the frame contents, the backend and the query. Test
+runs and parallel worker processes that open the same file share the
+results: an identical screen is recognised only once.
+
+Example: share OCR results between CI runs of the same build.
+
+>>> cache = persistentcache.PersistentCache("/var/cache/otr.sqlite",
+...                                         version="fmbt-0.39")
+>>> ui.vision().setPersistentCache(cache)
+
+Results are stored as pickles. Use only cache files that are written
+by trusted processes.
+"""
+
+import binascii
+import hashlib
+import json
+import pickle
+import sqlite3
+import threading
+import time
+
+_SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS results ("
+    " key TEXT PRIMARY KEY, value BLOB, size INTEGER, accessed REAL)",
+    "CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed)",
+    "CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT)")
+
+# access times of results are updated on hits at most this often,
+# seconds, so that most hits do not write to the database
+ACCESS_RESOLUTION = 60.0
+
+class PersistentCache(object):
+    """SQLite database of recognition results
+
+    Many processes can read and write the same database. Writers wait
+    for each other at most timeout seconds. When stored results exceed
+    maxBytes, least recently used results are deleted. Access times
+    are updated at most every ACCESS_RESOLUTION seconds.
+
+    version identifies the recognition backends, for instance their
+    release. Opening a database that was written with another version
+    deletes all stored results.
+    """
+    def __init__(self, filename, maxBytes=256 * 1024 * 1024, version="",
+                 timeout=30.0):
+        self._filename = filename
+        self._maxBytes = maxBytes
+        self._version = str(version)
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._db = sqlite3.connect(filename, timeout=timeout,
+                                   isolation_level=None,
+                                   check_same_thread=False)
+        self._db.text_factory = str
+        # WAL lets readers proceed while another process writes.
+        self._db.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            for statement in _SCHEMA:
+                self._db.execute(statement)
+            row = self._db.execute(
+                "SELECT value FROM meta WHERE name = 'version'").fetchone()
+            if row == None or row[0] != self._version:
+                self._db.execute("DELETE FROM results")
+                self._db.execute(
+                    "INSERT OR REPLACE INTO meta (name, value) VALUES ('version', ?)",
+                    (self._version,))
+                self._setTotalBytes(0)
+            elif self._totalBytes() == None:
+                self._setTotalBytes(self._db.execute(
+                    "SELECT COALESCE(SUM(size), 0) FROM results").fetchone()[0])
+
+    def __getstate__(self):
+        # Each process opens its own connection.
+        return {"filename": self._filename, "maxBytes": self._maxBytes,
+                "version": self._version}
+
+    def __setstate__(self, state):
+        self.__init__(state["filename"], state["maxBytes"], state["version"])
+
+    def filename(self):
+        return self._filename
+
+    def version(self):
+        return self._version
+
+    def get(self, key, digest):
+        """Returns results stored for key and frame digest, or None
+        """
+        dbKey = self._dbKey(key, digest)
+        with self._lock:
+            row = self._db.execute("SELECT value, accessed FROM results WHERE key = ?",
+                                   (dbKey,)).fetchone()
+            if row == None:
+                self._misses += 1
+                return None
+            now = time.time()
+            if now - row[1] >= ACCESS_RESOLUTION:
+                self._db.execute("UPDATE results SET accessed = ? WHERE key = ?",
+                                 (now, dbKey))
+            self._hits += 1
+        return pickle.loads(bytes(row[0]))
+
+    def put(self, key, digest, results):
+        """Store results for key and frame digest
+        """
+        value = pickle.dumps(tuple(results), 2)
+        dbKey = self._dbKey(key, digest)
+        with self._transaction():
+            row = self._db.execute("SELECT size FROM results WHERE key = ?",
+                                   (dbKey,)).fetchone()
+            total = self._totalBytes() + len(value) - (row[0] if row else 0)
+            self._db.execute(
+                "INSERT OR REPLACE INTO results (key, value, size, accessed) "
+                "VALUES (?, ?, ?, ?)",
+                (dbKey, sqlite3.Binary(value), len(value), time.time()))
+            self._setTotalBytes(self._evict(total))
+
+    def invalidate(self):
+        """Delete all stored results
+
+        Call when recognition backends change without a version change.
+        """
+        with self._transaction():
+            self._db.execute("DELETE FROM results")
+            self._setTotalBytes(0)
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+    def stats(self):
+        """Returns dictionary of cache counters of this process and
+        the size of the database
+        """
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            nbytes = self._totalBytes()
+        return {"hits": self._hits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": entries,
+                "bytes": nbytes,
+                "maxBytes": self._maxBytes}
+
+    def _dbKey(self, key, digest):
+        digest = binascii.hexlify(digest).decode("ascii")
+        return hashlib.sha1(json.dumps([key, digest], sort_keys=True)
+                            .encode("utf-8")).hexdigest()
+
+    def _evict(self, total):
+        # called in a transaction, returns total size after evictions
+        if total <= self._maxBytes:
+            return total
+        for key, size in self._db.execute(
+                "SELECT key, size FROM results ORDER BY accessed").fetchall():
+            if total <= self._maxBytes:
+                break
+            self._db.execute("DELETE FROM results WHERE key = ?", (key,))
+            total -= size
+            self._evictions += 1
+        return total
+
+    def _totalBytes(self):
+        # size of all results, kept in meta to avoid summing on every put
+        row = self._db.execute(
+            "SELECT value FROM meta WHERE name = 'bytes'").fetchone()
+        if row == None:
+            return None
+        return int(row[0])
+
+    def _setTotalBytes(self, total):
+        self._db.execute(
+            "INSERT OR REPLACE INTO meta (name, value) VALUES ('bytes', ?)",
+            (str(total),))
+
+    def _transaction(self):
+        return _Transaction(self._db, self._lock)
+
+class _Transaction(object):
+    # Takes the write lock of the database at the beginning, so that
+    # concurrent read-modify-write sequences do not deadlock.
+    def __init__(self, db, lock):
+        self._db = db
+        self._lock = lock
+
+    def __enter__(self):
+        self._lock.acquire()
+        try:
+            self._db.execute("BEGIN IMMEDIATE")
+        except Exception:
+            self._lock.release()
+            raise
+
+    def __exit__(self, excType, excValue, traceback):
+        try:
+            if excType == None:
+                self._db.execute("COMMIT")
+            else:
+                self._db.execute("ROLLBACK")
+        finally:
+            self._lock.release()
+        return False
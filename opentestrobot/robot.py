@@ -0,0 +1,249 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Robot -- robot control module
+
+Robot positions are (x, y, z) tuples in robot coordinates
+(millimeters). z is the height above the device under test.
+gesture.Robot converts gestures in work area coordinates to robot
+movements.
+"""
+
+import math
+import threading
+import time
+
+class RobotError(Exception):
+    pass
+
+class Interface(object):
+    """API required from Robot implementations
+    """
+    def position(self):
+        """Returns current position (x, y, z)
+        """
+        raise NotImplementedError
+
+    def init(self):
+        """Move robot to initial position
+        """
+        raise NotImplementedError
+
+    def move(self, pos, relative=False):
+        """Move to pos, or by pos if relative is True
+        """
+        raise NotImplementedError
+
+    def execute(self, path):
+        """Execute timed movement along a path
+
+        Args:
+            path (list): (t, (x, y, z)) points. Moving from a point
+                to the next one takes at least the difference of
+                their times t in seconds.
+        """
+        raise NotImplementedError
+
+def travelTime(distance, acceleration, maxVelocity):
+    """Returns seconds to move distance starting and ending at rest
+
+    Robot accelerates and decelerates with constant acceleration, and
+    cruises at maxVelocity if distance is long enough to reach it.
+    """
+    if distance <= 0:
+        return 0.0
+    accelerationDistance = maxVelocity * maxVelocity / acceleration
+    if distance <= accelerationDistance:
+        return 2 * math.sqrt(distance / acceleration)
+    return 2 * maxVelocity / acceleration + (distance - accelerationDistance) / maxVelocity
+
+def distance(pos1, pos2):
+    """Returns straight line distance between positions
+    """
+    return math.sqrt(sum((c2 - c1) ** 2 for c1, c2 in zip(pos1, pos2)))
+
+def _sameDirection(pos1, pos2, pos3, tolerance=1e-6):
+    # True if the move pos1 -> pos2 continues straight to pos3
+    d1 = [c2 - c1 for c1, c2 in zip(pos1, pos2)]
+    d2 = [c3 - c2 for c2, c3 in zip(pos2, pos3)]
+    length1 = math.sqrt(sum(c * c for c in d1))
+    length2 = math.sqrt(sum(c * c for c in d2))
+    if length1 <= tolerance or length2 <= tolerance:
+        return False
+    cos = sum(c1 * c2 for c1, c2 in zip(d1, d2)) / (length1 * length2)
+    return cos >= 1 - tolerance
+
+def planOrder(points, start=None, cost=None, maxRounds=100):
+    """Returns indices of points in a short order to visit them all
+
+    The order is built with nearest neighbour heuristic from start
+    (or from the first point) and improved with 2-opt: segments of
+    the order are reversed as long as that makes the total cost
+    smaller, at most maxRounds times over the whole order.
+
+    Args:
+        points (list): positions to visit.
+
+        start (tuple): current position, or None.
+
+        cost (function): cost(pos1, pos2) of moving between
+            positions, defaults to distance.
+    """
+    if cost == None:
+        cost = distance
+    if not points:
+        return []
+    unvisited = list(range(len(points)))
+    if start == None:
+        order = [unvisited.pop(0)]
+        start = points[order[0]]
+    else:
+        order = []
+    position = start
+    while unvisited:
+        nearest = min(unvisited, key=lambda i: cost(position, points[i]))
+        unvisited.remove(nearest)
+        order.append(nearest)
+        position = points[nearest]
+
+    # 2-opt on an open path that begins at start: reversing
+    # order[i:j+1] replaces edges (before i, i) and (j, after j)
+    # with (before i, j) and (i, after j).
+    def pos(k):
+        return start if k < 0 else points[order[k]]
+    for _ in range(maxRounds):
+        improved = False
+        for i in range(len(order) - 1):
+            for j in range(i + 1, len(order)):
+                before = cost(pos(i - 1), pos(i))
+                after = cost(pos(i - 1), pos(j))
+                if j + 1 < len(order):
+                    before += cost(pos(j), pos(j + 1))
+                    after += cost(pos(i), pos(j + 1))
+                if after < before - 1e-9:
+                    order[i:j + 1] = reversed(order[i:j + 1])
+                    improved = True
+        if not improved:
+            break
+    return order
+
+class Simulated(Interface):
+    """Mock robot that keeps time instead of moving
+
+    Moves along straight lines with a trapezoidal velocity profile:
+    the robot accelerates at the beginning of a straight run of path
+    points, cruises at most at maxVelocity and stops at the end of
+    the run. Lifting and lowering the finger are moves along z.
+
+    elapsed() returns the simulated time of all movements. If
+    timeScale is greater than 0, movements also sleep their simulated
+    time multiplied by timeScale.
+    """
+    def __init__(self, acceleration=2000.0, maxVelocity=300.0,
+                 homePosition=(0.0, 0.0, 10.0), timeScale=0.0):
+        """Create a simulated robot
+
+        Args:
+            acceleration (float): mm/s^2.
+
+            maxVelocity (float): mm/s.
+
+            homePosition (tuple): initial position (x, y, z).
+
+            timeScale (float): real seconds slept per simulated second.
+        """
+        self._acceleration = float(acceleration)
+        self._maxVelocity = float(maxVelocity)
+        self._homePosition = tuple(homePosition)
+        self._timeScale = timeScale
+        self._lock = threading.Lock()
+        self._position = self._homePosition
+        self._elapsed = 0.0
+        self._distance = 0.0
+        self._moves = 0
+
+    def position(self):
+        return self._position
+
+    def init(self):
+        self.move(self._homePosition)
+
+    def move(self, pos, relative=False):
+        if relative:
+            pos = tuple(c + d for c, d in zip(self._position, pos))
+        self.execute([(0.0, tuple(pos))])
+
+    def execute(self, path):
+        with self._lock:
+            runStartTime = path[0][0] if path else 0.0
+            run = []
+            for t, pos in path:
+                pos = tuple(float(c) for c in pos)
+                if len(pos) != 3:
+                    raise RobotError("invalid robot position: %s" % (pos,))
+                if run and not _sameDirection(
+                        run[-2][1] if len(run) > 1 else self._position,
+                        run[-1][1], pos):
+                    self._executeRun(runStartTime, run)
+                    runStartTime = run[-1][0]
+                    run = []
+                run.append((t, pos))
+            if run:
+                self._executeRun(runStartTime, run)
+
+    def travelTime(self, pos1, pos2):
+        """Returns seconds to move from pos1 to pos2 and stop
+        """
+        return travelTime(distance(pos1, pos2),
+                          self._acceleration, self._maxVelocity)
+
+    def elapsed(self):
+        """Returns simulated seconds spent in movements
+        """
+        return self._elapsed
+
+    def stats(self):
+        """Returns simulated time, travelled distance and number of moves
+        """
+        return {"elapsed": self._elapsed, "distance": self._distance,
+                "moves": self._moves}
+
+    def _executeRun(self, startTime, run):
+        # Move through a straight run of points without stopping,
+        # take at least the time between startTime and the last point.
+        t, endPos = run[-1]
+        moved = distance(self._position, endPos)
+        arrival = self._elapsed + max(self.travelTime(self._position, endPos),
+                                      t - startTime)
+        if self._timeScale > 0:
+            time.sleep((arrival - self._elapsed) * self._timeScale)
+        self._position = endPos
+        self._elapsed = arrival
+        self._distance += moved
+        if moved > 0:
+            self._moves += 1
@@ -0,0 +1,160 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Robotserver -- stand-in for an HTTP controlled robot
+
+Serves the protocol of gesture.OptoHttp and simulates how long
+gestures take on a robot, so that HTTP gesture backends can be
+tested and benchmarked without hardware.
+
+Run a server in port 8080:
+
+$ python robotserver.py 8080
+"""
+
+import gesture
+import json
+import robot
+import threading
+import time
+
+try:
+    import BaseHTTPServer
+    import SocketServer
+except ImportError:
+    import http.server as BaseHTTPServer
+    import socketserver as SocketServer
+
+class _Handler(BaseHTTPServer.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        server = self.server.robotServer
+        command = self.path.rstrip("/").rsplit("/", 1)[-1]
+        length = int(self.headers.get("Content-Length", 0))
+        try:
+            params = json.loads(self.rfile.read(length).decode("utf-8") or "{}")
+            server._execute(command, params)
+        except (ValueError, KeyError, TypeError,
+                gesture.GestureError, robot.RobotError) as e:
+            self._respond(400, {"error": str(e)})
+        else:
+            self._respond(200, {"result": None})
+
+    def _respond(self, status, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+class _Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+class RobotServer(object):
+    """HTTP server that simulates a robot
+
+    Gestures are executed one at a time with gesture.Robot on a
+    robot.Simulated instance, so they take the same simulated time as
+    with a local robot. Each gesture is delayed by its simulated
+    duration multiplied by timeScale, 0.0 responds immediately.
+    """
+    def __init__(self, host="127.0.0.1", port=0, robotInstance=None,
+                 topLeft=(0.0, 0.0), bottomRight=(60.0, 120.0), timeScale=1.0):
+        """Serve at host:port
+
+        Args:
+            robotInstance (robot.Simulated instance): simulated robot,
+                a new one by default.
+
+            topLeft, bottomRight (tuple): robot coordinates of the
+                work area corners, see gesture.Robot.
+
+            timeScale (float): real seconds slept per simulated second.
+        """
+        self._server = _Server((host, port), _Handler)
+        self._server.robotServer = self
+        self._robot = robotInstance or robot.Simulated()
+        self._gestures = gesture.Robot(self._robot, topLeft, bottomRight)
+        self._timeScale = timeScale
+        self._lock = threading.Lock()
+        self._thread = None
+        self.commands = []
+        self.simulatedTime = 0.0
+
+    def robot(self):
+        return self._robot
+
+    def url(self):
+        host, port = self._server.server_address[:2]
+        return "http://%s:%s/" % (host, port)
+
+    def start(self):
+        """Serve in a background thread, returns self
+        """
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+        if self._thread != None:
+            self._thread.join()
+            self._thread = None
+
+    def serveForever(self):
+        self._server.serve_forever()
+
+    def _execute(self, command, params):
+        with self._lock:
+            startTime = self._robot.elapsed()
+            if command == "path":
+                self._gestures._executePath([(t, (x, y), pressed)
+                                             for t, x, y, pressed in params["path"]])
+            elif command in ("tap", "drag", "swipe", "flick"):
+                getattr(self._gestures, command)(**params)
+            else:
+                raise ValueError('unknown command "%s"' % (command,))
+            seconds = self._robot.elapsed() - startTime
+            self.commands.append((command, params))
+            self.simulatedTime += seconds
+            if self._timeScale > 0:
+                time.sleep(seconds * self._timeScale)
+
+if __name__ == "__main__":
+    import sys
+    server = RobotServer(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8080)
+    print("Robot simulator listening at %s" % (server.url(),))
+    server.serveForever()
@@ -0,0 +1,260 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Safety -- safe operation regions of the work area
+
+Regions are rectangles ((left, top), (right, bottom)) in work area
+coordinates. The finger may touch the device only outside forbidden
+regions and, if allowed regions are given, inside them.
+
+Example: never touch the power button area, wrap a gesture backend.
+
+>>> regions = safety.SafetyRegions(forbidden=[((0.9, 0.4), (1.0, 0.6))])
+>>> g = safety.SafeGesture(gesture.OptoHttp("http://192.168.33.99:8080/"), regions)
+"""
+
+import json
+import math
+
+import gesture
+
+class SafetyError(gesture.GestureError):
+    pass
+
+def _segmentInterval(p1, p2, bbox):
+    # Liang-Barsky: returns (t0, t1) of segment p1 + t * (p2 - p1),
+    # 0 <= t <= 1, inside bbox, or None if the segment misses it.
+    (left, top), (right, bottom) = bbox
+    t0, t1 = 0.0, 1.0
+    for delta, distance in ((p1[0] - p2[0], p1[0] - left),
+                            (p2[0] - p1[0], right - p1[0]),
+                            (p1[1] - p2[1], p1[1] - top),
+                            (p2[1] - p1[1], bottom - p1[1])):
+        if delta == 0:
+            if distance < 0:
+                return None
+            continue
+        t = distance / delta
+        if delta < 0:
+            if t > t1:
+                return None
+            t0 = max(t0, t)
+        else:
+            if t < t0:
+                return None
+            t1 = min(t1, t)
+    return t0, t1
+
+class SafetyRegions(object):
+    """Forbidden and allowed regions with a grid index
+
+    Regions are stored in the cells of a uniform grid that their
+    bounding boxes overlap. Checking a point looks up one cell,
+    checking a segment the cells the segment passes through.
+    """
+    def __init__(self, forbidden=(), allowed=(), cellSize=0.05):
+        self._forbidden = [self._bbox(region) for region in forbidden]
+        self._allowed = [self._bbox(region) for region in allowed]
+        self._cellSize = float(cellSize)
+        self._cells = {}
+        for kind, regions in (("forbidden", self._forbidden),
+                              ("allowed", self._allowed)):
+            for region in regions:
+                (left, top), (right, bottom) = region
+                for cx in range(self._cell(left), self._cell(right) + 1):
+                    for cy in range(self._cell(top), self._cell(bottom) + 1):
+                        self._cells.setdefault((cx, cy), ([], []))[
+                            kind == "allowed"].append(region)
+
+    @classmethod
+    def fromDict(cls, config):
+        """Returns regions from {"forbidden": [...], "allowed": [...]}
+        """
+        return cls(config.get("forbidden", ()), config.get("allowed", ()),
+                   config.get("cellSize", 0.05))
+
+    @classmethod
+    def load(cls, filename):
+        """Returns regions from a JSON file
+        """
+        with open(filename) as f:
+            return cls.fromDict(json.load(f))
+
+    def forbidden(self):
+        return list(self._forbidden)
+
+    def allowed(self):
+        return list(self._allowed)
+
+    def isSafePoint(self, pos):
+        forbidden, allowed = self._cells.get(
+            (self._cell(pos[0]), self._cell(pos[1])), ((), ()))
+        for (left, top), (right, bottom) in forbidden:
+            if left <= pos[0] <= right and top <= pos[1] <= bottom:
+                return False
+        if not self._allowed:
+            return True
+        for (left, top), (right, bottom) in allowed:
+            if left <= pos[0] <= right and top <= pos[1] <= bottom:
+                return True
+        return False
+
+    def isSafeSegment(self, beginPos, endPos):
+        """Returns True if the finger can move from beginPos to endPos
+        touching only safe positions
+        """
+        forbidden, allowed = set(), set()
+        for cell in self._segmentCells(beginPos, endPos):
+            cellForbidden, cellAllowed = self._cells.get(cell, ((), ()))
+            forbidden.update(cellForbidden)
+            allowed.update(cellAllowed)
+        for region in forbidden:
+            if _segmentInterval(beginPos, endPos, region) != None:
+                return False
+        if not self._allowed:
+            return True
+        # the union of allowed parts of the segment must cover it
+        intervals = sorted(interval for interval in
+                           (_segmentInterval(beginPos, endPos, region)
+                            for region in allowed)
+                           if interval != None)
+        covered = 0.0
+        for t0, t1 in intervals:
+            if t0 > covered + 1e-12:
+                return False
+            covered = max(covered, t1)
+        return covered >= 1.0 - 1e-12
+
+    def checkPath(self, path):
+        """Raise SafetyError if pressed points or moves of path are unsafe
+
+        path is a list of (time, (x, y), pressed) points, see
+        gesture.gesturePath.
+        """
+        previous = None
+        for _, pos, pressed in path:
+            if pressed:
+                if previous == None:
+                    if not self.isSafePoint(pos):
+                        raise SafetyError("unsafe touch at %s" % (pos,))
+                elif not self.isSafeSegment(previous, pos):
+                    raise SafetyError("unsafe move from %s to %s" % (previous, pos))
+                previous = pos
+            else:
+                previous = None
+
+    def _bbox(self, region):
+        (x1, y1), (x2, y2) = region
+        return ((float(min(x1, x2)), float(min(y1, y2))),
+                (float(max(x1, x2)), float(max(y1, y2))))
+
+    def _cell(self, coordinate):
+        return int(math.floor(coordinate / self._cellSize))
+
+    def _segmentCells(self, beginPos, endPos):
+        # Grid traversal (Amanatides-Woo) of cells the segment touches.
+        cx, cy = self._cell(beginPos[0]), self._cell(beginPos[1])
+        endCell = (self._cell(endPos[0]), self._cell(endPos[1]))
+        cells = [(cx, cy)]
+        dx, dy = endPos[0] - beginPos[0], endPos[1] - beginPos[1]
+        stepX = 1 if dx > 0 else -1
+        stepY = 1 if dy > 0 else -1
+        if dx != 0:
+            nextX = (cx + (stepX > 0)) * self._cellSize
+            tMaxX, tDeltaX = (nextX - beginPos[0]) / dx, self._cellSize / abs(dx)
+        else:
+            tMaxX, tDeltaX = float("inf"), float("inf")
+        if dy != 0:
+            nextY = (cy + (stepY > 0)) * self._cellSize
+            tMaxY, tDeltaY = (nextY - beginPos[1]) / dy, self._cellSize / abs(dy)
+        else:
+            tMaxY, tDeltaY = float("inf"), float("inf")
+        # Run until endCell rather than t = 1.0: rounding errors in
+        # tMax would skip the last cell. Axes that are already at
+        # endCell are not stepped.
+        while (cx, cy) != endCell:
+            if cx != endCell[0] and (tMaxX < tMaxY or cy == endCell[1]):
+                cx += stepX
+                tMaxX += tDeltaX
+            else:
+                cy += stepY
+                tMaxY += tDeltaY
+            cells.append((cx, cy))
+        return cells
+
+class SafeGesture(gesture.Interface):
+    """Gesture backend that checks gestures before executing them
+
+    Wraps another gesture backend. Gestures that would touch unsafe
+    regions raise SafetyError unless they are given bypassSafety=True.
+    Gesture sequences are checked completely before any of the
+    gestures is executed.
+    """
+    def __init__(self, gestureInstance, safetyRegions):
+        self._gesture = gestureInstance
+        self._regions = safetyRegions
+
+    def safetyRegions(self):
+        return self._regions
+
+    def check(self, gestureName, args=(), kwargs={}):
+        """Raise SafetyError if gesture is unsafe
+        """
+        if kwargs.get("bypassSafety", False):
+            return
+        self._regions.checkPath(gesture.gesturePath(gestureName, args, kwargs))
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self.check("tap", (pos, duration), kwargs)
+        return self._gesture.tap(pos, duration, **kwargs)
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        self.check("drag", (beginPos, endPos, beginDuration, endDuration), kwargs)
+        return self._gesture.drag(beginPos, endPos, beginDuration, endDuration, **kwargs)
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        self.check("swipe", (beginPos, endPos), kwargs)
+        return self._gesture.swipe(beginPos, endPos, **kwargs)
+
+    def flick(self, beginPos, endPos, **kwargs):
+        self.check("flick", (beginPos, endPos), kwargs)
+        return self._gesture.flick(beginPos, endPos, **kwargs)
+
+    def rotate(self, centerPos, beginPos, arcAngle=360, **kwargs):
+        self.check("rotate", (centerPos, beginPos, arcAngle), kwargs)
+        return self._gesture.rotate(centerPos, beginPos, arcAngle, **kwargs)
+
+    def tapUnordered(self, positions, duration=0.0, **kwargs):
+        for pos in positions:
+            self.check("tap", (pos, duration), kwargs)
+        return self._gesture.tapUnordered(positions, duration, **kwargs)
+
+    def executeSequence(self, gestures):
+        for gestureName, args, kwargs in gestures:
+            self.check(gestureName, args, kwargs)
+        return self._gesture.executeSequence(gestures)
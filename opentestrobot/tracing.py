@@ -0,0 +1,305 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Tracing -- timing spans of UserInteraction, vision and gesture calls
+
+Each UserInteraction call produces a tree of spans: capturing frames,
+recognition, sleeping between polls and gestures. Finished span trees
+are passed to sinks. Tracing is disabled while there are no sinks,
+then span() returns a shared no-op span.
+
+Example: print how long recognition takes in tapImage calls.
+
+>>> histogram = tracing.HistogramSink()
+>>> tracing.addSink(histogram)
+>>> ui.tapImage("ok.png")
+>>> print histogram.summary()["vision.recognize"]
+"""
+
+import functools
+import json
+import threading
+import time
+
+_sinks = []
+_sinksLock = threading.Lock()
+_local = threading.local()
+
+class Span(object):
+    """Named, tagged time interval with child spans
+    """
+    __slots__ = ("name", "tags", "startTime", "endTime", "children", "_parent")
+
+    def __init__(self, name, tags, parent):
+        self.name = name
+        self.tags = tags
+        self.startTime = time.time()
+        self.endTime = None
+        self.children = []
+        self._parent = parent
+
+    def setTag(self, key, value):
+        self.tags[key] = value
+
+    def duration(self):
+        if self.endTime == None:
+            return time.time() - self.startTime
+        return self.endTime - self.startTime
+
+    def walk(self):
+        """Yields this span and its descendants, parents first
+        """
+        yield self
+        for child in self.children:
+            for span in child.walk():
+                yield span
+
+    def toDict(self):
+        return {"name": self.name, "tags": self.tags,
+                "start": self.startTime, "duration": self.duration(),
+                "children": [child.toDict() for child in self.children]}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        if excType != None:
+            self.tags["error"] = excType.__name__
+        self.endTime = time.time()
+        _local.current = self._parent
+        if self._parent == None:
+            _emit(self)
+        return False
+
+    def __repr__(self):
+        return "<Span %s %.6f s %r>" % (self.name, self.duration(), self.tags)
+
+class _NullSpan(object):
+    """Span used while tracing is disabled
+    """
+    __slots__ = ()
+
+    def setTag(self, key, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        return False
+
+_NULL_SPAN = _NullSpan()
+
+def enabled():
+    return bool(_sinks)
+
+def span(name, **tags):
+    """Returns context manager that times a span
+
+    Spans started inside another span in the same thread are its
+    children. Root spans are passed to sinks when they end.
+    """
+    if not _sinks:
+        return _NULL_SPAN
+    parent = getattr(_local, "current", None)
+    newSpan = Span(name, tags, parent)
+    if parent != None:
+        parent.children.append(newSpan)
+    _local.current = newSpan
+    return newSpan
+
+def currentSpan():
+    """Returns innermost open span of this thread, a no-op span if
+    there is none
+    """
+    return getattr(_local, "current", None) or _NULL_SPAN
+
+def traced(name=None, tagArgs=()):
+    """Decorator that runs the function in a span
+
+    Values of arguments named in tagArgs are added to tags, and the
+    length of the return value, if it has one, as tag "results".
+    """
+    def decorator(func):
+        spanName = name or func.__name__
+        argNames = func.__code__.co_varnames[:func.__code__.co_argcount]
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _sinks:
+                return func(*args, **kwargs)
+            tags = {}
+            for argName in tagArgs:
+                if argName in kwargs:
+                    tags[argName] = kwargs[argName]
+                elif argName in argNames and argNames.index(argName) < len(args):
+                    tags[argName] = args[argNames.index(argName)]
+            with span(spanName, **tags) as s:
+                result = func(*args, **kwargs)
+                if hasattr(result, "__len__"):
+                    s.setTag("results", len(result))
+                return result
+        wrapper.__wrapped__ = func
+        return wrapper
+    return decorator
+
+class TracedProxy(object):
+    """Calls methods of obj in spans named prefix.methodName
+    """
+    def __init__(self, obj, prefix):
+        self._obj = obj
+        self._prefix = prefix
+
+    def __getattr__(self, attr):
+        method = getattr(self._obj, attr)
+        spanName = "%s.%s" % (self._prefix, attr)
+        def wrapper(*args, **kwargs):
+            with span(spanName):
+                return method(*args, **kwargs)
+        return wrapper
+
+def proxy(obj, prefix):
+    """Returns TracedProxy of obj if tracing is enabled, otherwise obj
+    """
+    if not _sinks:
+        return obj
+    return TracedProxy(obj, prefix)
+
+def addSink(sink):
+    with _sinksLock:
+        _sinks.append(sink)
+
+def removeSink(sink):
+    with _sinksLock:
+        if sink in _sinks:
+            _sinks.remove(sink)
+
+def clearSinks():
+    with _sinksLock:
+        del _sinks[:]
+
+def _emit(rootSpan):
+    for sink in list(_sinks):
+        sink.emit(rootSpan)
+
+class HistogramSink(object):
+    """Collects durations of spans by name into histograms
+
+    Bucket boundaries grow geometrically from minDuration by factor.
+    """
+    def __init__(self, minDuration=1e-5, factor=2.0, bucketCount=32):
+        self._bounds = [minDuration * factor ** i for i in range(bucketCount)]
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    def emit(self, rootSpan):
+        with self._lock:
+            for s in rootSpan.walk():
+                duration = s.duration()
+                stats = self._stats.get(s.name)
+                if stats == None:
+                    stats = self._stats[s.name] = {
+                        "count": 0, "total": 0.0, "min": duration,
+                        "max": duration, "buckets": [0] * (len(self._bounds) + 1)}
+                stats["count"] += 1
+                stats["total"] += duration
+                stats["min"] = min(stats["min"], duration)
+                stats["max"] = max(stats["max"], duration)
+                stats["buckets"][self._bucket(duration)] += 1
+
+    def percentile(self, name, percent):
+        """Returns upper bound of the bucket containing percentile
+        """
+        with self._lock:
+            stats = self._stats.get(name)
+            if stats == None:
+                return None
+            limit = stats["count"] * percent / 100.0
+            count = 0
+            for index, bucketCount in enumerate(stats["buckets"]):
+                count += bucketCount
+                if count >= limit and bucketCount:
+                    if index < len(self._bounds):
+                        return min(self._bounds[index], stats["max"])
+                    return stats["max"]
+            return stats["max"]
+
+    def summary(self):
+        """Returns span name -> count, total, mean, min, max, p50, p90, p99
+        """
+        with self._lock:
+            names = list(self._stats)
+        summary = {}
+        for name in names:
+            stats = self._stats[name]
+            summary[name] = {
+                "count": stats["count"], "total": stats["total"],
+                "mean": stats["total"] / stats["count"],
+                "min": stats["min"], "max": stats["max"],
+                "p50": self.percentile(name, 50),
+                "p90": self.percentile(name, 90),
+                "p99": self.percentile(name, 99)}
+        return summary
+
+    def reset(self):
+        with self._lock:
+            self._stats = {}
+
+    def _bucket(self, duration):
+        for index, bound in enumerate(self._bounds):
+            if duration <= bound:
+                return index
+        return len(self._bounds)
+
+class JsonLinesSink(object):
+    """Writes each span tree as a JSON object on its own line
+    """
+    def __init__(self, fileObj):
+        """Write to fileObj, a file object or a file name
+        """
+        if isinstance(fileObj, basestring):
+            fileObj = open(fileObj, "a")
+        self._file = fileObj
+        self._lock = threading.Lock()
+
+    def emit(self, rootSpan):
+        line = json.dumps(rootSpan.toDict(), default=repr)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+class CallbackSink(object):
+    """Calls callback(rootSpan) for each span tree
+    """
+    def __init__(self, callback):
+        self._callback = callback
+
+    def emit(self, rootSpan):
+        self._callback(rootSpan)
@@ -49,7 +49,12 @@ taking screenshots and synthesizing user events.
 >>> ui.tapImage("homescreen-browser.png")
 """
 
+import inspect
+import time
+
 from guielements import *
+import tracing
+import vision
 
 class UserInteraction(object):
     """UserInteraction provides convenience API on top of gesture and vision
@@ -77,6 +82,12 @@ class UserInteraction(object):
         self._gesture = gestureInstance
         self._locateTimeout = locateTimeout
 
+    def vision(self):
+        return self._vision
+
+    def gesture(self):
+        return self._gesture
+
     # confirmed methods
 
     ###########################
@@ -90,6 +101,8 @@ class UserInteraction(object):
     # pos:           position to tap within target area (entire work area for tapPos)
     # duration:      minimum time to hold between press and release, 0.0 indicates ordinary tap
     # locateTimeout: time to poll the system before giving up if item to be located is not found
+    # area:          element within which image or text is searched, entire work area by default
+    # near:          element; tap the occurrence of text nearest to it (see locateText)
 
     # kwargs recommendations
     # bypassSafety: bool; ignore safety restrictions in movement area
@@ -97,24 +110,30 @@ class UserInteraction(object):
     # fingerRadius: float; finger radius in millimeters
     # touchAngle
 
+    @tracing.traced("UserInteraction.tap")
     def tap(self, pos, duration=0.0, **kwargs):
-        return self._gesture.tap(pos, duration, **kwargs)
+        return self._syncGesture().tap(pos, duration, **kwargs)
+
+    # taps positions in the order the gesture backend finds fastest,
+    # returns indices of positions in the order they were tapped
+    @tracing.traced("UserInteraction.tapUnordered")
+    def tapUnordered(self, positions, duration=0.0, **kwargs):
+        return self._syncGesture().tapUnordered(positions, duration, **kwargs)
 
     def tapElement(self, element=WORK_AREA, pos=(0.5, 0.5), duration=0.0, **kwargs):
         return self.tap(element.getPos(pos), duration, **kwargs)
 
-    def tapImage(self, imageUri, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, **kwargs):
-        # TODO: split kwargs to locateImage and tap
-        locations = self.locateImage(imageUri, locateTimeout)
-        if not locations:
-            raise ImageNotRecognizedError(imageUri)
-        return self._gesture.tap(locations[0].getPos(), duration)
+    @tracing.traced("UserInteraction.tapImage", ("imageUri",))
+    def tapImage(self, imageUri, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        element = self._locateImageElement(imageUri, locateTimeout, area, **locateKwargs)
+        return self._syncGesture().tap(element.getPos(pos), duration, **gestureKwargs)
 
-    def tapText(self, text, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, **kwargs):
-        locations = self.locateText(text, locateTimeout)
-        if not locations:
-            raise TextNotRecognizedError(text)
-        return self._gesture.tap(locations[0].getPos(), duration)
+    @tracing.traced("UserInteraction.tapText", ("text",))
+    def tapText(self, text, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, area=None, near=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        element = self._locateTextElement(text, locateTimeout, area, near, **locateKwargs)
+        return self._syncGesture().tap(element.getPos(pos), duration, **gestureKwargs)
 
     ###########################################
     # drag gestures                           #
@@ -135,6 +154,7 @@ class UserInteraction(object):
     # beginDuration: minimum duration to hold between press and move
     # endDuration:   minimum duration to hold between move and release
     # locateTimeout: time to poll the system before giving up if item to be located is not found
+    # area:          element within which images or texts are searched, entire work area by default
 
     # kwargs recommendations
     # bypassSafety: bool; ignore safety restrictions in movement area
@@ -142,17 +162,28 @@ class UserInteraction(object):
     # fingerRadius: float; finger radius in millimeters
     # dragDuration: duration of move
 
+    @tracing.traced("UserInteraction.drag")
     def drag(self, beginPos, endPos, beginDuration=0.25, endDuration=0.25, **kwargs):
-        self._gesture.drag(beginPos, endPos, beginDuration, endDuration, **kwargs)
+        self._syncGesture().drag(beginPos, endPos, beginDuration, endDuration, **kwargs)
 
     def dragElement(self, beginElement=WORK_AREA, endElement=WORK_AREA, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, beginDuration=0.0, endDuration=0.0, **kwargs):
         raise NotImplementedError
 
-    def dragImage(self, beginImageUri, endImageUri=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, beginDuration=0.0, endDuration=0.0, locateTimeout=None, **kwargs):
-        raise NotImplementedError
+    @tracing.traced("UserInteraction.dragImage", ("beginImageUri", "endImageUri"))
+    def dragImage(self, beginImageUri, endImageUri=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, beginDuration=0.0, endDuration=0.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        beginPos, endPos = self._gesturePositions(
+            self._locateImageElement, beginImageUri, endImageUri,
+            beginPos, endPos, angle, distance, locateTimeout, area, **locateKwargs)
+        return self._syncGesture().drag(beginPos, endPos, beginDuration, endDuration, **gestureKwargs)
 
-    def dragText(self, beginText, endText=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, beginDuration=0.0, endDuration=0.0, locateTimeout=None, **kwargs):
-        raise NotImplementedError
+    @tracing.traced("UserInteraction.dragText", ("beginText", "endText"))
+    def dragText(self, beginText, endText=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, beginDuration=0.0, endDuration=0.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        beginPos, endPos = self._gesturePositions(
+            self._locateTextElement, beginText, endText,
+            beginPos, endPos, angle, distance, locateTimeout, area, **locateKwargs)
+        return self._syncGesture().drag(beginPos, endPos, beginDuration, endDuration, **gestureKwargs)
 
 
     #############################################
@@ -172,6 +203,7 @@ class UserInteraction(object):
     # angle:         direction of swipe gesture, if given pre-empts parameters for end position
     # distance:      distance to swipe as proportion of distance from begin towards edge of work area, effective only if angle is given
     # locateTimeout: time to poll the system before giving up if item to be located is not found
+    # area:          element within which images or texts are searched, entire work area by default
 
     # kwargs recommendations
     # bypassSafety: bool; ignore safety restrictions in movement area
@@ -179,22 +211,28 @@ class UserInteraction(object):
     # fingerRadius: float; finger radius in millimeters
     # dragDuration: duration of move
 
+    @tracing.traced("UserInteraction.swipe")
     def swipe(self, beginPos, endPos, **kwargs):
-        return self._gesture.swipe(beginPos, endPos, **kwargs)
+        return self._syncGesture().swipe(beginPos, endPos, **kwargs)
 
     def swipeElement(self, beginElement=WORK_AREA, endElement=WORK_AREA, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, **kwargs):
         raise NotImplementedError
 
-    def swipeImage(self, beginImageUri, endImageUri=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, locateTimeout=None, **kwargs):
-        raise NotImplementedError
-
-    def swipeText(self, beginText, endText=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, locateTimeout=None, **kwargs):
-        locations = self.locateText(beginText, locateTimeout)
-        if not locations:
-            raise TextNotRecognizedError(beginText)
-        if angle != None:
-            endPos = angleDistToPos(UserInteraction.WORK_AREA, locations[0].getPos(), angle, distance)
-        return self._gesture.swipe(locations[0].getPos(), endPos)
+    @tracing.traced("UserInteraction.swipeImage", ("beginImageUri", "endImageUri"))
+    def swipeImage(self, beginImageUri, endImageUri=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        beginPos, endPos = self._gesturePositions(
+            self._locateImageElement, beginImageUri, endImageUri,
+            beginPos, endPos, angle, distance, locateTimeout, area, **locateKwargs)
+        return self._syncGesture().swipe(beginPos, endPos, **gestureKwargs)
+
+    @tracing.traced("UserInteraction.swipeText", ("beginText", "endText"))
+    def swipeText(self, beginText, endText=None, beginPos=(0.5, 0.5), endPos=(0.5, 0.5), angle=None, distance=1.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        beginPos, endPos = self._gesturePositions(
+            self._locateTextElement, beginText, endText,
+            beginPos, endPos, angle, distance, locateTimeout, area, **locateKwargs)
+        return self._syncGesture().swipe(beginPos, endPos, **gestureKwargs)
 
     ############################################
     # flick gestures                           #
@@ -265,24 +303,319 @@ class UserInteraction(object):
     # text:        text to be located
     # locateTimeout: time to poll the system before giving up if item to be located is not found
     # forceReload: image must be reloaded from scratch without caches
+    # area:        element within which image or text is searched, entire work area by default
 
     # rotated images may be found depending on implementation
 
     # kwargs recommendations
     # <namespace>_confidence: implementation-specific confidence of match
 
-    # returns tuple of elements
-    def locateImage(self, imageUri, locateTimeout=None, forceReload=False, **kwargs):
+    # returns guielements.ElementSet
+    @tracing.traced("UserInteraction.locateImage", ("imageUri",))
+    def locateImage(self, imageUri, locateTimeout=None, forceReload=False, area=None, **kwargs):
         if locateTimeout == None:
             locateTimeout = self._locateTimeout
         return self._vision.locateImage(imageUri, locateTimeout,
-                                        forceReload, **kwargs)
+                                        forceReload, area=area, **kwargs)
+
+    # near: element; text is first searched from the frame where the
+    #       latest locate found items if the screen has not changed
+    #       since, and results are ordered by distance from near
 
-    # returns tuple of elements
-    def locateText(self, text, locateTimeout=None, **kwargs):
+    # returns guielements.ElementSet
+    @tracing.traced("UserInteraction.locateText", ("text",))
+    def locateText(self, text, locateTimeout=None, area=None, near=None, **kwargs):
         if locateTimeout == None:
             locateTimeout = self._locateTimeout
-        return self._vision.locateText(text, locateTimeout, **kwargs)
+        if near == None:
+            return self._vision.locateText(text, locateTimeout, area=area,
+                                           **kwargs)
+        results = ()
+        if self._vision.lastFrame() != None:
+            results = self._vision.locateText(
+                text, area=area, frame=self._vision.currentFrame(), **kwargs)
+        if not results:
+            results = self._vision.locateText(text, locateTimeout, area=area,
+                                              **kwargs)
+        return results.byDistance(near)
+
+    # returns guielements.ElementSet of all words within area in the
+    # frame where the latest locate found items if the screen has not
+    # changed since, otherwise in a new frame
+    @tracing.traced("UserInteraction.words")
+    def words(self, area=None):
+        return self._vision.words(self._vision.currentFrame(), area)
+
+    # imageUris: images to be located
+    # texts:     texts to be located
+
+    # all images and texts are searched from the same frame
+
+    # returns vision.MultiLocateResult, true if any image or text was found
+    @tracing.traced("UserInteraction.locateAny", ("imageUris", "texts"))
+    def locateAny(self, imageUris=(), texts=(), locateTimeout=None, forceReload=False, area=None, **kwargs):
+        if locateTimeout == None:
+            locateTimeout = self._locateTimeout
+        return self._vision.locateAny(imageUris, texts, locateTimeout,
+                                      forceReload, area=area, **kwargs)
+
+    # returns vision.MultiLocateResult, true if all images and texts were found
+    @tracing.traced("UserInteraction.locateAll", ("imageUris", "texts"))
+    def locateAll(self, imageUris=(), texts=(), locateTimeout=None, forceReload=False, area=None, **kwargs):
+        if locateTimeout == None:
+            locateTimeout = self._locateTimeout
+        return self._vision.locateAll(imageUris, texts, locateTimeout,
+                                      forceReload, area=area, **kwargs)
+
+    #########################
+    # asynchronous gestures #
+    #########################
+
+    # Async variants queue the gesture and return a gesture.Future
+    # immediately, so that, for instance, the next item can be
+    # located while the robot moves. Queued gestures are executed in
+    # order. Synchronous gestures wait for queued gestures first.
+    # Exceptions from queued gestures are raised by their futures and
+    # by the next waitGestures or synchronous gesture.
+
+    def tapAsync(self, pos, duration=0.0, **kwargs):
+        return self._gesture.tapAsync(pos, duration, **kwargs)
+
+    @tracing.traced("UserInteraction.tapImageAsync", ("imageUri",))
+    def tapImageAsync(self, imageUri, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        element = self._locateImageElement(imageUri, locateTimeout, area, **locateKwargs)
+        return self._gesture.tapAsync(element.getPos(pos), duration, **gestureKwargs)
+
+    @tracing.traced("UserInteraction.tapTextAsync", ("text",))
+    def tapTextAsync(self, text, pos=(0.5, 0.5), duration=0.0, locateTimeout=None, area=None, **kwargs):
+        locateKwargs, gestureKwargs = _splitKwargs(kwargs)
+        element = self._locateTextElement(text, locateTimeout, area, **locateKwargs)
+        return self._gesture.tapAsync(element.getPos(pos), duration, **gestureKwargs)
+
+    def dragAsync(self, beginPos, endPos, beginDuration=0.25, endDuration=0.25, **kwargs):
+        return self._gesture.dragAsync(beginPos, endPos, beginDuration, endDuration, **kwargs)
+
+    def swipeAsync(self, beginPos, endPos, **kwargs):
+        return self._gesture.swipeAsync(beginPos, endPos, **kwargs)
+
+    # waits until queued gestures are finished
+    def waitGestures(self, timeout=None):
+        self._gesture.flush(timeout)
+
+    # cancels queued gestures that have not been started, returns their number
+    def cancelGestures(self):
+        return self._gesture.cancelPending()
+
+    #########################
+    # screen change waiting #
+    #########################
+
+    # arguments
+    # timeout:   maximum time to wait
+    # threshold: maximum difference (0.0 - 1.0) of frames considered unchanged
+    # area:      element within which changes are watched, entire work area by default
+
+    # returns True if screen became stable within timeout, otherwise False
+    @tracing.traced("UserInteraction.waitStable")
+    def waitStable(self, timeout, threshold=0.002, area=None, settle=None):
+        return self._vision.waitStable(timeout, threshold, area, settle)
+
+    # returns True if screen changed within timeout, otherwise False
+    @tracing.traced("UserInteraction.waitChange")
+    def waitChange(self, area=None, timeout=0, threshold=0.002):
+        return self._vision.waitChange(area, timeout, threshold)
+
+    ############
+    # pipeline #
+    ############
+
+    # arguments
+    # steps:           list of Step
+    # changeThreshold: maximum frame difference (0.0 - 1.0) to reuse items located during the previous gesture
+
+    # Executes steps in order. While the gesture of a step is running,
+    # items of the next step are located from the newest frame. If the
+    # screen has not changed when the gesture finishes, the next
+    # gesture is executed at once, otherwise its items are located
+    # again. Raises exceptions like the corresponding methods.
+
+    # returns PipelineReport
+    @tracing.traced("UserInteraction.runPipeline")
+    def runPipeline(self, steps, changeThreshold=0.002):
+        report = PipelineReport()
+        startTime = time.time()
+        self._syncGesture()
+        plan = None
+        for index, step in enumerate(steps):
+            stepStartTime = time.time()
+            prelocated = plan != None
+            if plan != None:
+                planFrame, gestureCall = plan
+                if (planFrame != None and vision.frameDifference(
+                        planFrame, self._vision.frame()) > changeThreshold):
+                    prelocated = False
+            if not prelocated:
+                gestureCall = self._planStep(step)
+            gestureStartTime = time.time()
+            gestureArgs, gestureKwargs = gestureCall
+            future = self._gesture.submit(_PIPELINE_GESTURES[step.methodName],
+                                          *gestureArgs, **gestureKwargs)
+            plan = None
+            if index + 1 < len(steps):
+                nextStep = steps[index + 1]
+                try:
+                    gestureCall = self._planStep(nextStep, locateTimeout=0)
+                    if nextStep.methodName in ("tap", "drag", "swipe"):
+                        plan = (None, gestureCall)
+                    else:
+                        plan = (self._vision.lastFrame(), gestureCall)
+                except (ImageNotRecognizedError, TextNotRecognizedError):
+                    pass
+            try:
+                future.result()
+            except Exception:
+                self._gesture.cancelPending()
+                self._gesture.flush()
+                raise
+            endTime = time.time()
+            report.steps.append({
+                "step": step,
+                "latency": endTime - stepStartTime,
+                "locateTime": gestureStartTime - stepStartTime,
+                "gestureTime": endTime - gestureStartTime,
+                "prelocated": prelocated})
+        report.totalTime = time.time() - startTime
+        return report
+
+    # returns (gesture args, gesture kwargs) of the step, items are
+    # located with locateTimeout if given, otherwise with the step's
+    # locateTimeout
+    def _planStep(self, step, locateTimeout=None):
+        method = getattr(self, step.methodName).__func__
+        method = getattr(method, "__wrapped__", method)
+        p = inspect.getcallargs(method, self, *step.args, **step.kwargs)
+        if locateTimeout != None:
+            p["locateTimeout"] = locateTimeout
+        locateKwargs, gestureKwargs = _splitKwargs(p["kwargs"])
+        name = step.methodName
+        if name == "tap":
+            return (p["pos"], p["duration"]), p["kwargs"]
+        elif name in ("drag", "swipe"):
+            if name == "drag":
+                return (p["beginPos"], p["endPos"], p["beginDuration"], p["endDuration"]), p["kwargs"]
+            return (p["beginPos"], p["endPos"]), p["kwargs"]
+        elif name in ("tapImage", "tapText"):
+            if name == "tapImage":
+                element = self._locateImageElement(p["imageUri"], p["locateTimeout"], p["area"], **locateKwargs)
+            else:
+                element = self._locateTextElement(p["text"], p["locateTimeout"], p["area"], p["near"], **locateKwargs)
+            return (element.getPos(p["pos"]), p["duration"]), gestureKwargs
+        if name.endswith("Image"):
+            locateElement, beginItem, endItem = self._locateImageElement, p["beginImageUri"], p["endImageUri"]
+        else:
+            locateElement, beginItem, endItem = self._locateTextElement, p["beginText"], p["endText"]
+        beginPos, endPos = self._gesturePositions(
+            locateElement, beginItem, endItem, p["beginPos"], p["endPos"],
+            p["angle"], p["distance"], p["locateTimeout"], p["area"], **locateKwargs)
+        if name.startswith("drag"):
+            return (beginPos, endPos, p["beginDuration"], p["endDuration"]), gestureKwargs
+        return (beginPos, endPos), gestureKwargs
+
+    # returns gesture instance after queued gestures are finished
+    def _syncGesture(self):
+        with tracing.span("gesture.flush"):
+            self._gesture.flush()
+        return tracing.proxy(self._gesture, "gesture")
+
+    # helpers for gestures on located items
+
+    def _locateImageElement(self, imageUri, locateTimeout, area, **kwargs):
+        locations = self.locateImage(imageUri, locateTimeout, area=area, **kwargs)
+        if not locations:
+            raise ImageNotRecognizedError(imageUri)
+        return locations[0]
+
+    def _locateTextElement(self, text, locateTimeout, area, near=None, **kwargs):
+        locations = self.locateText(text, locateTimeout, area=area, near=near, **kwargs)
+        if not locations:
+            raise TextNotRecognizedError(text)
+        return locations[0]
+
+    # returns begin and end positions in work area for drag, swipe
+    # and flick variants that locate their begin and end items
+    def _gesturePositions(self, locateElement, beginItem, endItem, beginPos, endPos, angle, distance, locateTimeout, area, **kwargs):
+        beginPos = locateElement(beginItem, locateTimeout, area, **kwargs).getPos(beginPos)
+        if angle != None:
+            endPos = angleDistToPos(UserInteraction.WORK_AREA, beginPos, angle, distance)
+        elif endItem != None:
+            endPos = locateElement(endItem, locateTimeout, area, **kwargs).getPos(endPos)
+        return beginPos, endPos
+
+# splits kwargs of gestures on located items to (locate kwargs, gesture
+# kwargs): <namespace>_name kwargs are for locating, others for the gesture
+def _splitKwargs(kwargs):
+    locateKwargs, gestureKwargs = {}, {}
+    for name, value in kwargs.items():
+        if "_" in name:
+            locateKwargs[name] = value
+        else:
+            gestureKwargs[name] = value
+    return locateKwargs, gestureKwargs
+
+class Step(object):
+    """Step of UserInteraction.runPipeline
+
+    Step("tapImage", "ok.png", locateTimeout=5) represents call
+    ui.tapImage("ok.png", locateTimeout=5).
+    """
+    def __init__(self, methodName, *args, **kwargs):
+        if not methodName in _PIPELINE_GESTURES:
+            raise ValueError('unsupported pipeline step: "%s"' % (methodName,))
+        self.methodName = methodName
+        self.args = args
+        self.kwargs = kwargs
+
+    def __repr__(self):
+        return "%s(%s)" % (self.__class__.__name__, ", ".join(
+            [repr(self.methodName)] + [repr(arg) for arg in self.args] +
+            ["%s=%r" % item for item in sorted(self.kwargs.items())]))
+
+# step method -> gesture it executes
+_PIPELINE_GESTURES = {
+    "tap": "tap", "tapImage": "tap", "tapText": "tap",
+    "drag": "drag", "dragImage": "drag", "dragText": "drag",
+    "swipe": "swipe", "swipeImage": "swipe", "swipeText": "swipe",
+}
+
+class PipelineReport(object):
+    """Timing of UserInteraction.runPipeline
+
+    steps is a list of dictionaries, one for each step:
+    * step: the Step
+    * latency: seconds from the end of the previous gesture to the end
+      of the gesture of this step
+    * locateTime: seconds spent locating items after the previous
+      gesture had finished
+    * gestureTime: seconds from submitting the gesture to its end
+    * prelocated: True if items were located while the previous
+      gesture was running and the screen did not change after that
+    """
+    def __init__(self):
+        self.steps = []
+        self.totalTime = 0.0
+
+    def throughput(self):
+        """Returns steps per second
+        """
+        if self.totalTime <= 0:
+            return 0.0
+        return len(self.steps) / self.totalTime
+
+    def __repr__(self):
+        return "%s(%s steps, %.3f s, %.2f steps/s)" % (
+            self.__class__.__name__, len(self.steps), self.totalTime,
+            self.throughput())
 
 class OpentestrobotError(Exception):
     pass
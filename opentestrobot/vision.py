@@ -29,11 +29,343 @@
 
 """
 
+import collections
+import hashlib
+import json
+import os
+import threading
 import urlparse
 import camera
+import guielements
 import oir
 import ocr
 import time
+import tracing
+
+# tried in this order when an image URI has no extension
+IMAGE_EXTENSIONS = (".png", ".jpg", ".ppm", ".pgm")
+
+def frameDifference(frame1, frame2, area=None):
+    """Returns how much frames differ, 0.0 (same) - 1.0 (inverted)
+
+    Frames are compared by their downsampled thumbnails. If either
+    frame does not have pixels available, returns 0.0 if the frames
+    are identical and 1.0 otherwise.
+    """
+    thumbnail1 = frame1.thumbnail(area=area)
+    thumbnail2 = frame2.thumbnail(area=area)
+    if thumbnail1 == None or thumbnail2 == None:
+        digest = frame1.digest()
+        if digest != None and digest == frame2.digest():
+            return 0.0
+        return 1.0
+    return (sum(abs(v1 - v2) for v1, v2 in zip(thumbnail1, thumbnail2)) /
+            (255.0 * len(thumbnail1)))
+
+def perceptualHash(frame, area=None, hashSize=8):
+    """Returns difference hash of frame as an integer, or None
+
+    Each of the hashSize * hashSize bits tells if a thumbnail pixel
+    is darker than its right neighbour. Similar looking frames have
+    hashes with few differing bits. Returns None if pixels of the
+    frame are not available.
+    """
+    columns = hashSize + 1
+    thumbnail = frame.thumbnail((columns, hashSize), area)
+    if thumbnail == None:
+        return None
+    value = 0
+    for row in xrange(hashSize):
+        offset = row * columns
+        for column in xrange(offset, offset + hashSize):
+            value = (value << 1) | (thumbnail[column] < thumbnail[column + 1])
+    return value
+
+class ResultCache(object):
+    """LRU cache of recognition results by screen fingerprint
+
+    By default fingerprints are frame digests, and stored results are
+    returned only for identical frames.
+
+    If tolerance is given, fingerprints are perceptual hashes of the
+    searched area of a frame, and a query on a frame whose
+    fingerprint differs from a stored one in at most tolerance bits
+    returns the stored results. Small changes, like an item of a few
+    pixels appearing, disappearing or moving, may not change the
+    fingerprint at all, so stored results may point to items that
+    are no longer there. Frames without pixels are fingerprinted by
+    their digest, and match only identical frames.
+
+    Empty results are stored only by frame digest: a small item that
+    appears on the screen may change the fingerprint too little to
+    be noticed, so it would never be found while polling.
+    """
+    def __init__(self, size=256, tolerance=None, hashSize=8):
+        self._size = size
+        self._tolerance = tolerance
+        self._hashSize = hashSize
+        self._entries = collections.OrderedDict()
+        self._fingerprints = {} # query key -> set of stored fingerprints
+        self._hits = 0
+        self._nearHits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def fingerprint(self, frame, area=None):
+        """Returns fingerprint of area of frame, or None
+        """
+        if self._tolerance == None:
+            return frame.digest()
+        value = perceptualHash(frame, area, self._hashSize)
+        if value == None:
+            return frame.digest()
+        return value
+
+    def get(self, key, fingerprint, digest=None):
+        """Returns results stored for key and a matching fingerprint,
+        or empty results stored for key and digest, or None
+        """
+        entry = self._entries.pop((key, fingerprint), None)
+        if entry == None and digest != None and digest != fingerprint:
+            entry = self._entries.pop((key, digest), None)
+            if entry != None:
+                fingerprint = digest
+        if entry == None and isinstance(fingerprint, (int, long)) and self._tolerance > 0:
+            nearest, nearestDistance = None, self._tolerance + 1
+            for stored in self._fingerprints.get(key, ()):
+                if isinstance(stored, (int, long)):
+                    distance = bin(stored ^ fingerprint).count("1")
+                    if distance < nearestDistance:
+                        nearest, nearestDistance = stored, distance
+            if nearest != None:
+                fingerprint = nearest
+                entry = self._entries.pop((key, fingerprint))
+                self._nearHits += 1
+        if entry == None:
+            self._misses += 1
+            return None
+        self._hits += 1
+        self._entries[(key, fingerprint)] = entry
+        return entry
+
+    def put(self, key, fingerprint, results):
+        """Store results for key and fingerprint
+
+        Empty results must be stored with frame digest as fingerprint,
+        they are ignored with perceptual hashes.
+        """
+        if not results and isinstance(fingerprint, (int, long)):
+            return
+        self._entries.pop((key, fingerprint), None)
+        self._entries[(key, fingerprint)] = results
+        self._fingerprints.setdefault(key, set()).add(fingerprint)
+        while len(self._entries) > self._size:
+            (evictedKey, evictedFingerprint), _ = self._entries.popitem(last=False)
+            fingerprints = self._fingerprints[evictedKey]
+            fingerprints.discard(evictedFingerprint)
+            if not fingerprints:
+                del self._fingerprints[evictedKey]
+            self._evictions += 1
+
+    def clear(self):
+        self._entries.clear()
+        self._fingerprints.clear()
+
+    def stats(self):
+        """Returns dictionary of cache counters
+
+        nearHits counts hits whose fingerprint was not identical.
+        """
+        return {"hits": self._hits,
+                "nearHits": self._nearHits,
+                "misses": self._misses,
+                "evictions": self._evictions,
+                "entries": len(self._entries),
+                "size": self._size,
+                "tolerance": self._tolerance,
+                "hashSize": self._hashSize}
+
+def _backendName(backend):
+    """Returns name that identifies recognition backend in persistent
+    caches
+    """
+    if isinstance(backend, ocr.TextIndexCache):
+        return "TextIndex(%s, %s)" % (backend.match(), _backendName(backend._ocr))
+    name = "%s.%s" % (backend.__class__.__module__, backend.__class__.__name__)
+    parameters = getattr(backend, "parameters", dict)()
+    if parameters:
+        name += json.dumps(parameters, sort_keys=True)
+    return name
+
+def _storeResults(stores, results):
+    """Store results in (cache, key, fingerprint, digest) stores
+
+    Empty results are stored by digest only, see ResultCache.
+    """
+    for cache, key, fingerprint, digest in stores:
+        if results:
+            cache.put(key, fingerprint, results)
+        elif digest != None:
+            cache.put(key, digest, results)
+
+class SerialExecutor(object):
+    """Executor that runs queries one by one in the calling thread
+    """
+    def map(self, func, iterable):
+        return [func(item) for item in iterable]
+
+def _runTask(task):
+    # Module level function, process pools cannot pickle bound methods.
+    backend, methodName, args = task
+    return getattr(backend, methodName)(*args)
+
+def _mergeElements(resultLists, maxIou=0.5):
+    """Returns tuple of elements in resultLists without duplicates
+
+    Elements found on overlapping parts of tiles are duplicates if
+    their bounding boxes overlap more than maxIou.
+    """
+    merged = []
+    for results in resultLists:
+        for element in results:
+            bbox = element.getBbox()
+            for mergedElement in merged:
+                if (mergedElement.__class__ == element.__class__ and
+                    guielements.iou(mergedElement.getBbox(), bbox) > maxIou):
+                    break
+            else:
+                merged.append(element)
+    return tuple(merged)
+
+class MultiLocateResult(object):
+    """Results of locateAny and locateAll
+
+    All results are from the same frame. The result is true if the
+    locate call found what it was looking for: any of the queries for
+    locateAny, all of them for locateAll.
+    """
+    def __init__(self, frame, imageResults, textResults, requireAll):
+        self._frame = frame
+        self._imageResults = imageResults
+        self._textResults = textResults
+        self._requireAll = requireAll
+
+    def __nonzero__(self):
+        found = [bool(elements) for _, elements in
+                 self._imageResults + self._textResults]
+        if self._requireAll:
+            return all(found)
+        return any(found)
+
+    __bool__ = __nonzero__
+
+    def frame(self):
+        """Returns the frame where images and texts were searched
+        """
+        return self._frame
+
+    def images(self):
+        """Returns dictionary imageUri -> ElementSet
+        """
+        return dict(self._imageResults)
+
+    def texts(self):
+        """Returns dictionary text -> ElementSet
+        """
+        return dict(self._textResults)
+
+    def matched(self):
+        """Returns (imageUris, texts) that were found, in query order
+        """
+        return ([imageUri for imageUri, elements in self._imageResults
+                 if elements],
+                [text for text, elements in self._textResults if elements])
+
+    def __repr__(self):
+        return "%s(images=%r, texts=%r)" % (
+            self.__class__.__name__, self._imageResults, self._textResults)
+
+class FrameRingBuffer(object):
+    """Bounded buffer of the latest captured frames
+
+    Frames are stored with their capture timestamps, oldest first.
+    When the buffer is full (depth frames or maxBytes bytes), the drop
+    policy decides which frame goes: "oldest" drops the oldest frame
+    in the buffer, "newest" drops the incoming frame.
+    """
+    def __init__(self, depth=4, dropPolicy="oldest", maxBytes=None):
+        if not dropPolicy in ("oldest", "newest"):
+            raise ValueError('invalid drop policy: "%s"' % (dropPolicy,))
+        self._depth = max(1, depth)
+        self._dropPolicy = dropPolicy
+        self._maxBytes = maxBytes
+        self._frames = collections.deque()
+        self._bytes = 0
+        self._captured = 0
+        self._dropped = 0
+        self._error = None
+        self._cond = threading.Condition()
+
+    def put(self, frame):
+        """Add frame to the buffer, returns False if frame was dropped
+        """
+        frameBytes = frame.nbytes()
+        with self._cond:
+            self._captured += 1
+            while self._frames and (
+                    len(self._frames) >= self._depth or
+                    (self._maxBytes != None and
+                     self._bytes + frameBytes > self._maxBytes)):
+                if self._dropPolicy == "newest":
+                    self._dropped += 1
+                    return False
+                self._bytes -= self._frames.popleft()[1]
+                self._dropped += 1
+            self._frames.append((frame, frameBytes))
+            self._bytes += frameBytes
+            self._cond.notify_all()
+        return True
+
+    def setError(self, error):
+        """Make waiting and future latest() calls raise error
+        """
+        with self._cond:
+            self._error = error
+            self._cond.notify_all()
+
+    def latest(self, timeout=None):
+        """Returns the newest frame
+
+        Waits for the first frame at most timeout seconds (forever if
+        None). Returns None if there is no frame after the timeout.
+        """
+        with self._cond:
+            if not self._frames and self._error == None:
+                self._cond.wait(timeout)
+            if self._error != None:
+                raise self._error
+            if self._frames:
+                return self._frames[-1][0]
+            return None
+
+    def frames(self):
+        """Returns list of buffered frames, oldest first
+        """
+        with self._cond:
+            return [frame for frame, _ in self._frames]
+
+    def stats(self):
+        """Returns dictionary of buffer occupancy and counters
+        """
+        with self._cond:
+            return {"depth": self._depth,
+                    "dropPolicy": self._dropPolicy,
+                    "maxBytes": self._maxBytes,
+                    "frames": len(self._frames),
+                    "bytes": self._bytes,
+                    "captured": self._captured,
+                    "dropped": self._dropped,
+                    "timestamps": [f.timestamp() for f, _ in self._frames]}
 
 class Interface(object):
     """API required from Vision implementations
@@ -42,9 +374,24 @@ class Interface(object):
     """
     def __init__(self, cameraInstance=None, oirInstance=None, ocrInstance=None):
         super(Interface, self).__init__()
+        self._textIndex = None
+        self._calibration = None
+        self._resultCache = None
+        self._persistentCache = None
+        self._needleDigests = {}
+        self.setNeedleCache()
         self.setCamera(cameraInstance)
         self.setOir(oirInstance)
         self.setOcr(ocrInstance)
+        self.setPollInterval()
+        self.setChangeThreshold()
+        self._lastLocateStats = {}
+        self._lastFrame = None
+        self._frameBuffer = None
+        self._captureThread = None
+        self._captureStop = None
+        self.setExecutor(SerialExecutor())
+        self.setTiling()
 
     def setCamera(self, cameraInstance):
         self._camera = cameraInstance
@@ -53,42 +400,737 @@ class Interface(object):
 
     def setOir(self, oirInstance):
         self._oir = oirInstance
+        # needles are prepared by the backend for itself
+        self._needleCache.clear()
+        self._clearResultCache()
 
     def setOcr(self, ocrInstance):
         self._ocr = ocrInstance
+        self._clearResultCache()
+        if self._textIndex != None:
+            self.setTextIndex(True, self._textIndex.match(),
+                              self._textIndex.size())
 
-    def locateImage(self, imageUri, locateTimeout=0, forceReload=False, **kwargs):
-        if self._cameraFrameOutput == "filename":
-            return self._locate(self._camera.frame,
-                                lambda frame: self._oir.oirLocate(frame, imageUri),
-                                locateTimeout, **kwargs)
+    def setCalibration(self, calibrationInstance):
+        """Map between camera frames and the display of the device
+
+        When a camera sees the display as a part of its frames, set
+        calibration.Calibration with cameraCorners and cameraSize.
+        Search areas are then mapped to frame coordinates before
+        recognition and results back to work area coordinates.
+        """
+        self._calibration = calibrationInstance
+        self._clearResultCache()
+
+    def calibration(self):
+        return self._calibration
+
+    def setTextIndex(self, enabled=True, match="exact", size=4):
+        """Search texts from a per-frame index of recognised words
+
+        When enabled, each frame is recognised once with the ocrWords
+        method of the OCR backend, and locateText searches texts from
+        the resulting ocr.TextIndex. Indexes of size latest frames are
+        cached, so searching many texts from an unchanged screen
+        runs OCR only once.
+
+        Args:
+            enabled (bool): use text index.
+
+            match (str): "exact", "prefix" or "fuzzy", see
+                ocr.TextIndex.
+
+            size (int): number of cached indexes.
+        """
+        if enabled:
+            self._textIndex = ocr.TextIndexCache(self._ocr, match, size)
         else:
-            raise Exception('unsupported camera frame output: "%s"' %
-                            self._cameraFrameOutput)
+            self._textIndex = None
+        self._clearResultCache()
 
-    def locateText(self, text, locateTimeout=0, forceReload=False, **kwargs):
-        if self._cameraFrameOutput == "filename":
-            return self._locate(self._camera.frame,
-                                lambda frame: self._ocr.ocrLocate(frame, text),
-                                locateTimeout, **kwargs)
+    def textIndex(self):
+        """Returns ocr.TextIndex of the newest frame
+        """
+        if self._textIndex == None:
+            return ocr.TextIndexCache(self._ocr, size=0).index(self._newFrame())
+        return self._textIndex.index(self._newFrame())
+
+    def textIndexStats(self):
+        """Returns hit and miss counters of the text index cache
+        """
+        if self._textIndex == None:
+            return {}
+        return self._textIndex.stats()
+
+    def setResultCache(self, enabled=True, size=256, tolerance=None, hashSize=8):
+        """Reuse results of queries on screens that were seen before
+
+        When enabled, results of each image and text query are stored
+        with a fingerprint of the frame, see ResultCache. Searching
+        the same image or text on a frame with a matching fingerprint
+        returns the stored results without running OIR or OCR.
+        Replaces the current cache with an empty one.
+
+        Args:
+            enabled (bool): use result cache.
+
+            size (int): maximum number of stored results.
+
+            tolerance (int): match perceptual hashes of the searched
+                area that differ in at most tolerance bits. The
+                default, None, matches only identical frames. Even 0
+                does not tell apart screens that differ in small
+                details, like a checkbox or a spinner, so use only if
+                such screens can share results.
+
+            hashSize (int): perceptual hashes have hashSize * hashSize
+                bits. Larger sizes tell apart smaller changes.
+        """
+        if enabled:
+            self._resultCache = ResultCache(size, tolerance, hashSize)
+        else:
+            self._resultCache = None
+
+    def resultCacheStats(self):
+        """Returns hit, miss and eviction counters of the result cache
+        """
+        if self._resultCache == None:
+            return {}
+        return self._resultCache.stats()
+
+    def setPersistentCache(self, persistentCache):
+        """Share results of queries on identical frames through disk
+
+        persistentCache is a persistentcache.PersistentCache, or None
+        to stop using it. Results are looked up by the digest of the
+        frame, the backend and the query, after the result cache.
+        """
+        self._persistentCache = persistentCache
+
+    def persistentCache(self):
+        return self._persistentCache
+
+    def _clearResultCache(self):
+        # stored results are valid only for the same backends
+        if self._resultCache != None:
+            self._resultCache.clear()
+
+    def setNeedleCache(self, maxBytes=64 * 1024 * 1024):
+        """Set memory budget for needles prepared by the OIR backend
+
+        Replaces the current cache with an empty one.
+        """
+        self._needleCache = oir.NeedleCache(maxBytes)
+
+    def needleCacheStats(self):
+        """Returns hit, miss and eviction counters of the needle cache
+        """
+        return self._needleCache.stats()
+
+    def setExecutor(self, executor):
+        """Set executor that runs OIR and OCR queries
+
+        Executor is an object with map(func, iterable) method that
+        returns list of results in order, for instance
+        multiprocessing.pool.ThreadPool or multiprocessing.Pool.
+        Queries of locateAny, locateAll and tiled queries are run in
+        parallel with a pool. Process pools require that OIR and OCR
+        backends can be pickled, which is not the case with fMBT
+        backends: use a thread pool with them.
+        """
+        self._executor = executor
+
+    def executor(self):
+        return self._executor
+
+    def setTiling(self, rows=1, columns=1, overlap=0.1):
+        """Split every OIR and OCR query into tiles
+
+        Each query is run separately on rows x columns overlapping
+        tiles of the frame, and the results are merged. Use with a
+        parallel executor to use more cores for a single query.
+
+        Args:
+            rows, columns (int): number of tiles, 1 x 1 disables
+                tiling.
+
+            overlap (float): how much tiles extend to neighbouring
+                tiles, proportion of tile width and height. Images and
+                texts larger than the overlap may be missed on tile
+                borders.
+        """
+        self._tiling = (rows, columns, overlap)
+
+    def setChangeThreshold(self, threshold=0.0):
+        """Set how much a frame must change to be searched again
+
+        When polling in locateImage and locateText, frames whose
+        frameDifference to the last searched frame is at most
+        threshold are not searched. Frames that are not identical are
+        always searched with threshold 0.0.
+        """
+        self._changeThreshold = threshold
+
+    def waitStable(self, timeout, threshold=0.002, area=None, settle=None):
+        """Wait until the screen stops changing
+
+        Args:
+            timeout (float): maximum time to wait in seconds.
+
+            threshold (float): screen is stable when frameDifference
+                of frames to the first frame of a stable period is at
+                most threshold.
+
+            area (guielements.Element): optional, watch only this
+                part of the screen.
+
+            settle (float): seconds the screen must stay stable, at
+                least one poll interval, which is the default. A
+                camera may deliver the same frame twice in the middle
+                of an animation.
+
+        Returns True if the screen became stable within timeout,
+        otherwise False.
+        """
+        if area != None:
+            area = area.getBbox()
+        if settle == None:
+            settle = self._pollMinInterval
+        stableSince = [None, None] # first frame and time of stable period
+        def stable(previous, frame):
+            if stableSince[0] == None:
+                stableSince[:] = [previous, time.time()]
+            if frameDifference(stableSince[0], frame, area) > threshold:
+                stableSince[:] = [frame, time.time()]
+                return False
+            return time.time() - stableSince[1] >= settle
+        return self._waitFrames(timeout, stable)
+
+    def waitChange(self, area=None, timeout=0, threshold=0.002):
+        """Wait until the screen changes
+
+        Args:
+            area (guielements.Element): optional, watch only this
+                part of the screen.
+
+            timeout (float): maximum time to wait in seconds.
+
+            threshold (float): screen has changed when frameDifference
+                of the first and a later frame is greater than
+                threshold.
+
+        Returns True if the screen changed within timeout, otherwise
+        False.
+        """
+        if area != None:
+            area = area.getBbox()
+        firstFrame = []
+        def changed(previous, frame):
+            if not firstFrame:
+                firstFrame.append(previous)
+            return frameDifference(firstFrame[0], frame, area) > threshold
+        return self._waitFrames(timeout, changed)
+
+    def _waitFrames(self, timeout, doneFunc):
+        """Poll frames until doneFunc(previousFrame, frame) is true
+        """
+        endTime = time.time() + timeout
+        previous = self._newFrame()
+        while True:
+            pollStartTime = time.time()
+            frame = self._newFrame()
+            if frame is not previous and doneFunc(previous, frame):
+                return True
+            previous = frame
+            currentTime = time.time()
+            if currentTime >= endTime:
+                return False
+            sleepTime = min(pollStartTime + max(self._pollMinInterval, 1e-3),
+                            endTime) - currentTime
+            if sleepTime > 0:
+                with tracing.span("vision.sleep"):
+                    time.sleep(sleepTime)
+
+    def setPollInterval(self, minInterval=0.05, maxInterval=1.0, backoff=2.0):
+        """Set the polling schedule of locateImage and locateText
+
+        Args:
+            minInterval (float): minimum time in seconds from the
+                beginning of a poll to the beginning of the next one.
+
+            maxInterval (float): upper limit for the poll interval
+                when backing off.
+
+            backoff (float): the interval is multiplied by this
+                after every poll that saw an unchanged frame. The
+                interval returns to minInterval when the frame
+                changes. 1.0 disables backoff.
+        """
+        self._pollMinInterval = minInterval
+        self._pollMaxInterval = max(minInterval, maxInterval)
+        self._pollBackoff = backoff
+
+    def pollInterval(self):
+        """Returns (minInterval, maxInterval, backoff)
+        """
+        return (self._pollMinInterval, self._pollMaxInterval,
+                self._pollBackoff)
+
+    def startCapture(self, depth=4, dropPolicy="oldest", maxBytes=None,
+                     interval=0.0):
+        """Start capturing frames in a background thread
+
+        While capturing, locateImage and locateText search the newest
+        captured frame instead of waiting for the camera. The camera
+        must allow reading frames from another thread.
+
+        Args:
+            depth (int): maximum number of frames in the buffer.
+
+            dropPolicy (str): "oldest" or "newest", see
+                FrameRingBuffer.
+
+            maxBytes (int): optional, maximum total size of buffered
+                frames.
+
+            interval (float): minimum time in seconds between
+                starting two captures. 0.0 captures as fast as the
+                camera delivers frames.
+        """
+        self.stopCapture()
+        self._frameBuffer = FrameRingBuffer(depth, dropPolicy, maxBytes)
+        self._captureStop = threading.Event()
+        self._captureThread = threading.Thread(
+            target=self._captureLoop,
+            args=(self._frameBuffer, self._captureStop, interval))
+        self._captureThread.daemon = True
+        self._captureThread.start()
+
+    def stopCapture(self):
+        """Stop background capture started with startCapture
+
+        The frame buffer remains available through frameBuffer()
+        until capture is started again.
+        """
+        if self._captureThread != None:
+            self._captureStop.set()
+            self._captureThread.join()
+            self._captureThread = None
+
+    def frameBuffer(self):
+        """Returns FrameRingBuffer of background capture, or None
+        """
+        return self._frameBuffer
+
+    def _captureLoop(self, frameBuffer, stopEvent, interval):
+        while not stopEvent.is_set():
+            captureStartTime = time.time()
+            try:
+                frameBuffer.put(self._cameraFrame())
+            except Exception as e:
+                frameBuffer.setError(e)
+                return
+            sleepTime = captureStartTime + interval - time.time()
+            if sleepTime > 0:
+                stopEvent.wait(sleepTime)
+
+    def locateStats(self):
+        """Returns statistics of the latest locateImage/locateText call
+
+        Returned dictionary contains:
+        * polls: number of frames captured
+        * framesSkipped: number of frames identical to the previously
+          searched frame, recognition was not run on them
+        * captureTime: seconds spent waiting for frames
+        * recognitionTime: seconds spent in OIR/OCR
+        * sleepTime: seconds spent sleeping between polls
+        * totalTime: duration of the call
+        """
+        return dict(self._lastLocateStats)
+
+    def locateImage(self, imageUri, locateTimeout=0, forceReload=False,
+                    area=None, frame=None, **kwargs):
+        """Locate image
+
+        If area (guielements.Element) is given, only that part of
+        frames is searched. If frame (camera.Frame) is given, only it
+        is searched instead of polling new frames. Returns
+        guielements.ElementSet of elements in unity coordinates of
+        the whole work area.
+        """
+        queries = [self._imageQuery(imageUri, forceReload, area)]
+        newFrameFunc, locateTimeout = self._frameSource(frame, locateTimeout)
+        return self._locate(newFrameFunc,
+                            lambda frame: self._recognize(frame, queries)[0],
+                            locateTimeout, **kwargs)
+
+    def locateText(self, text, locateTimeout=0, forceReload=False,
+                   area=None, frame=None, **kwargs):
+        """Locate text
+
+        If area (guielements.Element) is given, only that part of
+        frames is searched. If frame (camera.Frame) is given, only it
+        is searched instead of polling new frames; with text index
+        enabled, an already indexed frame is not recognised again.
+        Returns guielements.ElementSet of elements in unity
+        coordinates of the whole work area.
+        """
+        queries = [self._textQuery(text, area)]
+        newFrameFunc, locateTimeout = self._frameSource(frame, locateTimeout)
+        return self._locate(newFrameFunc,
+                            lambda frame: self._recognize(frame, queries)[0],
+                            locateTimeout, **kwargs)
+
+    def words(self, frame=None, area=None):
+        """Returns guielements.ElementSet of all words in frame
+
+        Searches the newest frame if frame is not given. If area
+        (guielements.Element) is given, returns words within it.
+        """
+        if frame == None:
+            frame = self._newFrame()
+        if self._textIndex != None:
+            words = self._textIndex.index(frame).words()
+        elif self._cameraFrameOutput == "buffer":
+            words = self._ocr.ocrWordsBuffer(frame)
+        else:
+            words = self._ocr.ocrWords(frame)
+        words = self._toWorkArea([words])[0]
+        if area != None:
+            words = words.within(area)
+        return words
+
+    def locateAny(self, imageUris=(), texts=(), locateTimeout=0,
+                  forceReload=False, area=None, **kwargs):
+        """Locate images and texts until any of them is found
+
+        All images and texts are searched from the same frame on each
+        poll.
+
+        Returns MultiLocateResult, which is true if any image or text
+        was found.
+        """
+        return self._locateMany(imageUris, texts, False, locateTimeout,
+                                forceReload, area, **kwargs)
+
+    def locateAll(self, imageUris=(), texts=(), locateTimeout=0,
+                  forceReload=False, area=None, **kwargs):
+        """Locate images and texts until all of them are found
+
+        All images and texts are searched from the same frame on each
+        poll.
+
+        Returns MultiLocateResult, which is true if every image and
+        text was found.
+        """
+        return self._locateMany(imageUris, texts, True, locateTimeout,
+                                forceReload, area, **kwargs)
+
+    def _locateMany(self, imageUris, texts, requireAll, locateTimeout,
+                    forceReload, area, **kwargs):
+        queries = ([self._imageQuery(imageUri, forceReload, area)
+                    for imageUri in imageUris] +
+                   [self._textQuery(text, area) for text in texts])
+        def locateFunc(frame):
+            results = self._recognize(frame, queries)
+            return MultiLocateResult(
+                frame,
+                zip(imageUris, results[:len(imageUris)]),
+                zip(texts, results[len(imageUris):]),
+                requireAll)
+        return self._locate(self._newFrame, locateFunc, locateTimeout,
+                            **kwargs)
+
+    def _imageQuery(self, imageUri, forceReload, area=None):
+        """Returns query (backend, method name, needle, area, key) for
+        imageUri
+
+        key identifies the image by its contents in result caches.
+        """
+        filename = self._imageFilename(imageUri)
+        if os.path.isfile(filename):
+            needle = self._needleCache.get(filename, self._oir.loadNeedle, forceReload)
+            key = ("image", self._needleDigest(filename))
+        else:
+            # Not a local file, the backend may still find it, like
+            # fMBT from its bitmap path.
+            needle = self._oir.loadNeedle(filename)
+            key = ("image", filename)
+        if area != None:
+            area = area.getBbox()
+        if self._cameraFrameOutput == "buffer":
+            return (self._oir, "oirLocateBuffer", needle, area, key)
+        return (self._oir, "oirLocate", needle, area, key)
+
+    def _needleDigest(self, filename):
+        """Returns hex digest of the contents of an image file
+        """
+        st = os.stat(filename)
+        fileId = (filename, st.st_mtime, st.st_size)
+        if not fileId in self._needleDigests:
+            self._needleDigests[fileId] = hashlib.md5(
+                open(filename, "rb").read()).hexdigest()
+        return self._needleDigests[fileId]
+
+    def _textQuery(self, text, area=None):
+        """Returns query (backend, method name, text, area, key) for text
+        """
+        if area != None:
+            area = area.getBbox()
+        key = ("text", text)
+        if self._textIndex != None:
+            return (self._textIndex, "ocrLocate", text, area, key)
+        if self._cameraFrameOutput == "buffer":
+            return (self._ocr, "ocrLocateBuffer", text, area, key)
+        return (self._ocr, "ocrLocate", text, area, key)
+
+    def _recognize(self, frame, queries):
+        """Returns list of results of queries on frame
+
+        Results found in the result cache or the persistent cache are
+        returned as such, other queries are split into tiles, if
+        tiling is set, and executed with the executor.
+        """
+        tasks = []
+        tileCounts = []
+        cached = {} # query index -> results from a cache
+        cacheStores = {} # query index -> where to store computed results
+        fingerprints = {}
+        for index, (backend, methodName, arg, area, key) in enumerate(queries):
+            if self._calibration != None:
+                area = self._calibration.transformBbox(
+                    area or ((0.0, 0.0), (1.0, 1.0)), "unity", "frame")
+            results, cacheStores[index] = self._cachedResults(
+                frame, backend, methodName, area, key, fingerprints)
+            if results != None:
+                cached[index] = results
+                tileCounts.append(0)
+                continue
+            tiles = self._tiles(area)
+            tileCounts.append(len(tiles))
+            for tile in tiles:
+                if tile == None:
+                    tasks.append((backend, methodName, (frame, arg)))
+                else:
+                    tasks.append((backend, methodName, (frame, arg, tile)))
+        if len(tasks) == 1:
+            taskResults = [_runTask(tasks[0])]
+        elif tasks:
+            taskResults = self._executor.map(_runTask, tasks)
+        results = []
+        first = 0
+        for index, tileCount in enumerate(tileCounts):
+            if index in cached:
+                results.append(cached[index])
+                continue
+            if tileCount == 1:
+                results.append(taskResults[first])
+            else:
+                results.append(_mergeElements(
+                    taskResults[first:first + tileCount]))
+            first += tileCount
+            _storeResults(cacheStores[index], tuple(results[-1]))
+        return self._toWorkArea(results)
+
+    def _cachedResults(self, frame, backend, methodName, area, key, fingerprints):
+        """Returns (results, stores) for a query on frame
+
+        results are found from the result cache or the persistent
+        cache, or None. stores lists (cache, key, fingerprint, digest)
+        of caches where results of the query should be stored, see
+        _storeResults. fingerprints caches fingerprints of areas of
+        frame.
+        """
+        stores = []
+        if self._resultCache != None:
+            if not area in fingerprints:
+                fingerprints[area] = self._resultCache.fingerprint(frame, area)
+            fingerprint = fingerprints[area]
+            if fingerprint != None:
+                cacheKey = (methodName, key, area)
+                digest = frame.digest()
+                results = self._resultCache.get(cacheKey, fingerprint, digest)
+                if results != None:
+                    return results, []
+                stores.append((self._resultCache, cacheKey, fingerprint, digest))
+        if self._persistentCache != None:
+            digest = frame.digest()
+            if digest != None:
+                cacheKey = (_backendName(backend), methodName, key, area)
+                results = self._persistentCache.get(cacheKey, digest)
+                if results != None:
+                    _storeResults(stores, results)
+                    return results, []
+                stores.append((self._persistentCache, cacheKey, digest, digest))
+        return None, stores
+
+    def _toWorkArea(self, results):
+        """Returns results of recognition as ElementSets in work area
+        coordinates
+        """
+        if self._calibration != None:
+            def mapBbox(bbox):
+                return self._calibration.transformBbox(bbox, "frame", "unity")
+            return [guielements.ElementSet(guielements.mapElement(element, mapBbox)
+                                           for element in result) for result in results]
+        return [guielements.ElementSet(result) for result in results]
+
+    def _tiles(self, area=None):
+        """Returns list of areas of tiles that cover area
+
+        Returns [area] if tiling is off.
+        """
+        rows, columns, overlap = self._tiling
+        if rows * columns <= 1:
+            return [area]
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        (areaLeft, areaTop), (areaRight, areaBottom) = area
+        tileWidth = (areaRight - areaLeft) / columns
+        tileHeight = (areaBottom - areaTop) / rows
+        tiles = []
+        for row in xrange(rows):
+            for column in xrange(columns):
+                left = areaLeft + (column - overlap) * tileWidth
+                top = areaTop + (row - overlap) * tileHeight
+                right = areaLeft + (column + 1 + overlap) * tileWidth
+                bottom = areaTop + (row + 1 + overlap) * tileHeight
+                tiles.append(((max(areaLeft, left), max(areaTop, top)),
+                              (min(areaRight, right), min(areaBottom, bottom))))
+        return tiles
+
+    def _imageFilename(self, imageUri):
+        """Returns name of the file that imageUri refers to
+
+        Extension can be left out from file names and file URIs,
+        IMAGE_EXTENSIONS are tried in order. If there is no such local
+        file, returns the name as given, for backends that search
+        images from their own paths.
+        """
+        scheme, _, path, _, _, _ = urlparse.urlparse(imageUri)
+        if scheme == "file":
+            imageUri = path
+        elif len(scheme) > 1:
+            raise ValueError('unsupported image URI: "%s"' % (imageUri,))
+        for extension in ("",) + IMAGE_EXTENSIONS:
+            if os.path.isfile(imageUri + extension):
+                return imageUri + extension
+        return imageUri
+
+    def frame(self):
+        """Returns the newest frame from the camera
+        """
+        return self._newFrame()
+
+    def lastFrame(self):
+        """Returns the frame searched by the latest locate call
+        """
+        return self._lastFrame
+
+    def currentFrame(self):
+        """Returns the frame searched by the latest locate call if the
+        screen has not changed since (see setChangeThreshold),
+        otherwise the newest frame
+
+        Searching the last frame again reuses its text index and
+        cached results.
+        """
+        frame = self._newFrame()
+        if self._lastFrame != None and self._frameUnchanged(self._lastFrame, frame):
+            return self._lastFrame
+        return frame
+
+    def _frameSource(self, frame, locateTimeout):
+        """Returns (newFrameFunc, locateTimeout) for locating from
+        frame, or from new frames if frame is None
+        """
+        if frame == None:
+            return self._newFrame, locateTimeout
+        return (lambda: frame), 0
+
+    def _newFrame(self):
+        """Returns the newest camera.Frame
+        """
+        if self._captureThread != None:
+            return self._frameBuffer.latest()
+        return self._cameraFrame()
+
+    def _cameraFrame(self):
+        """Returns a new camera.Frame from the camera
+        """
+        if self._cameraFrameOutput in ("frame", "buffer"):
+            return self._camera.frame()
+        elif self._cameraFrameOutput == "filename":
+            return camera.Frame(self._camera.frame())
         else:
             raise Exception('unsupported camera frame output: "%s"' %
                             self._cameraFrameOutput)
 
-    def _locate(self, newFrameFileFunc, locateFunc, locateTimeout, **kwargs):
+    def _frameUnchanged(self, lastFrame, frame):
+        if frame is lastFrame:
+            return True
+        digest = frame.digest()
+        if digest != None and digest == lastFrame.digest():
+            return True
+        return (self._changeThreshold > 0 and
+                frameDifference(lastFrame, frame) <= self._changeThreshold)
+
+    def _locate(self, newFrameFunc, locateFunc, locateTimeout, **kwargs):
+        with tracing.span("vision.locate") as locateSpan:
+            results = self._pollLocate(newFrameFunc, locateFunc, locateTimeout)
+            locateSpan.setTag("polls", self._lastLocateStats["polls"])
+            locateSpan.setTag("framesSkipped", self._lastLocateStats["framesSkipped"])
+            if hasattr(results, "__len__"):
+                locateSpan.setTag("results", len(results))
+            else:
+                locateSpan.setTag("found", bool(results))
+        return results
+
+    def _pollLocate(self, newFrameFunc, locateFunc, locateTimeout):
         if locateTimeout == None:
             locateTimeout = 0
         startTime = time.time()
-        currentTime = startTime
         endTime = startTime + locateTimeout
+        interval = self._pollMinInterval
         results = ()
+        lastFrame = None
+        stats = {"polls": 0, "framesSkipped": 0, "captureTime": 0.0,
+                 "recognitionTime": 0.0, "sleepTime": 0.0}
 
-        while currentTime <= endTime:
-            results = locateFunc(newFrameFileFunc())
-            if results:
-                break
+        while True:
+            pollStartTime = time.time()
+            with tracing.span("vision.capture"):
+                frame = newFrameFunc()
+            unchanged = (lastFrame != None and
+                         self._frameUnchanged(lastFrame, frame))
+            recognitionStartTime = time.time()
+            stats["polls"] += 1
+            stats["captureTime"] += recognitionStartTime - pollStartTime
+            if unchanged:
+                # Nothing changed since the last search, back off.
+                stats["framesSkipped"] += 1
+                interval = min(interval * self._pollBackoff,
+                               self._pollMaxInterval)
+            else:
+                lastFrame = frame
+                with tracing.span("vision.recognize"):
+                    results = locateFunc(frame)
+                stats["recognitionTime"] += time.time() - recognitionStartTime
+                if results:
+                    break
+                interval = self._pollMinInterval
             currentTime = time.time()
+            if currentTime >= endTime:
+                break
+            sleepTime = min(pollStartTime + interval, endTime) - currentTime
+            if sleepTime > 0:
+                with tracing.span("vision.sleep"):
+                    time.sleep(sleepTime)
+                stats["sleepTime"] += sleepTime
 
+        stats["totalTime"] = time.time() - startTime
+        self._lastLocateStats = stats
+        self._lastFrame = lastFrame
         return results
 
 
@@ -0,0 +1,483 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+"""
+Benchmark -- offline benchmarks of the locate and gesture hot paths
+
+Runs UserInteraction on synthetic GRAY8 screens served from memory, so
+no camera, robot or fMBT is needed. Screens contain square icons of
+distinct gray values on a noisy background; MarkerOir and MarkerOcr
+find them by scanning rows, so recognition time grows with the frame
+size like with real backends.
+
+Results are printed as JSON. Compare results of two commits:
+
+$ python -m tests.benchmark --output before.json
+$ python -m tests.benchmark --output after.json
+$ python -m tests.benchmark --compare before.json after.json
+"""
+
+import json
+import optparse
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import opentestrobot
+
+from opentestrobot import camera, gesture, guielements, ocr, oir
+from opentestrobot.userinteraction import Step
+
+try:
+    import tracemalloc
+except ImportError:
+    tracemalloc = None
+
+try:
+    xrange
+except NameError:
+    xrange = range
+
+FORMAT_VERSION = 1
+
+ICON_SIZE = 16
+
+RESOLUTIONS = ((480, 800), (1080, 1920), (2160, 3840))
+
+NEEDLE_COUNTS = (1, 8, 32)
+
+def syntheticScreen(width, height, needleCount, seed=0):
+    """Returns (pixels, icon positions) of a GRAY8 screen
+
+    Background is noise of values 128-255. Icon k (1 <= k <=
+    needleCount) is a ICON_SIZE x ICON_SIZE square of value k, icons
+    are placed on a grid so that they do not overlap. Positions are
+    top-left corners in pixels.
+    """
+    rnd = random.Random(seed)
+    noise = bytearray(rnd.randint(128, 255) for _ in xrange(4096))
+    pixels = bytearray(width * height)
+    for y in xrange(height):
+        offset = (y * 7919) % len(noise)
+        row = (noise[offset:] + noise[:offset]) * (width // len(noise) + 1)
+        pixels[y * width:(y + 1) * width] = row[:width]
+    columns = max(1, width // (2 * ICON_SIZE))
+    cells = list(xrange(columns * max(1, height // (2 * ICON_SIZE))))
+    rnd.shuffle(cells)
+    if needleCount > len(cells):
+        raise ValueError("%s icons do not fit on %sx%s screen" %
+                         (needleCount, width, height))
+    positions = {}
+    for marker, cell in zip(xrange(1, needleCount + 1), cells):
+        x, y = (cell % columns) * 2 * ICON_SIZE, (cell // columns) * 2 * ICON_SIZE
+        for row in xrange(y, y + ICON_SIZE):
+            pixels[row * width + x:row * width + x + ICON_SIZE] = \
+                bytearray([marker]) * ICON_SIZE
+        positions[marker] = (x, y)
+    return pixels, positions
+
+def _findMarkers(haystack, markers, area=None):
+    """Returns list of (marker, bbox) of icons in a GRAY8 BufferFrame
+    """
+    width, height = haystack.size()
+    if area == None:
+        area = ((0.0, 0.0), (1.0, 1.0))
+    (left, top), (right, bottom) = area
+    x1, x2 = int(left * width), min(width, int(right * width) + 1)
+    patterns = [(marker, bytes(bytearray([marker]) * ICON_SIZE))
+                for marker in markers]
+    found = []
+    previous = set()
+    for y in xrange(int(top * height), min(height, int(bottom * height) + 1)):
+        row = haystack.row(y).tobytes()
+        current = set()
+        for marker, pattern in patterns:
+            x = row.find(pattern, x1, x2)
+            while x >= 0:
+                current.add((marker, x))
+                if not (marker, x) in previous:
+                    found.append((marker, (
+                        (x / float(width), y / float(height)),
+                        ((x + ICON_SIZE) / float(width),
+                         (y + ICON_SIZE) / float(height)))))
+                x = row.find(pattern, x + ICON_SIZE, x2)
+        previous = current
+    return found
+
+class MarkerOir(oir.Interface):
+    """OIR that finds icons of syntheticScreen
+
+    Needle files contain the gray value of the icon.
+    """
+    def loadNeedle(self, needleFilename):
+        return bytearray(open(needleFilename, "rb").read(1))[0]
+
+    def oirLocate(self, haystack, needle, area=None):
+        raise NotImplementedError("MarkerOir reads frame buffers only")
+
+    def oirLocateBuffer(self, haystack, needle, area=None):
+        return tuple(guielements.ImageRectangle(topLeft, bottomRight, needle)
+                     for _, (topLeft, bottomRight)
+                     in _findMarkers(haystack, [needle], area))
+
+class MarkerOcr(ocr.Interface):
+    """OCR that reads icon k of syntheticScreen as word "icon<k>"
+    """
+    def __init__(self, needleCount):
+        super(MarkerOcr, self).__init__()
+        self._markers = range(1, needleCount + 1)
+
+    def ocrLocateBuffer(self, haystack, text, area=None):
+        if not text.startswith("icon") or not text[4:].isdigit():
+            return ()
+        return tuple(guielements.TextRectangle(topLeft, bottomRight, text)
+                     for _, (topLeft, bottomRight)
+                     in _findMarkers(haystack, [int(text[4:])], area))
+
+    def ocrWordsBuffer(self, haystack, area=None):
+        return tuple(guielements.Word(topLeft, bottomRight, "icon%s" % (marker,))
+                     for marker, (topLeft, bottomRight)
+                     in _findMarkers(haystack, self._markers, area))
+
+class ScreenSource(camera.BufferSource):
+    """Camera that shows syntheticScreens
+
+    If changing is True, every frame is a new buffer with one pixel
+    flipped, so frames are never identical.
+    """
+    def __init__(self, width, height, needleCount, changing=False):
+        self._pixels, self.positions = syntheticScreen(width, height, needleCount)
+        self._changing = changing
+        self.frames = 0
+        super(ScreenSource, self).__init__(self._grab, width, height, format="GRAY8")
+
+    def _grab(self):
+        self.frames += 1
+        if not self._changing:
+            return self._pixels
+        pixels = bytearray(self._pixels)
+        pixels[-1] = 128 + self.frames % 128
+        return pixels
+
+class NullGesture(gesture.Interface):
+    """Gesture backend that executes gestures instantly
+    """
+    def __init__(self):
+        self.taps = 0
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self.taps += 1
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        pass
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        pass
+
+class Benchmark(object):
+    """Runs benchmarks and collects their results
+    """
+    def __init__(self, resolutions=RESOLUTIONS, needleCounts=NEEDLE_COUNTS,
+                 repeat=5, pollDuration=0.5, scriptLength=20):
+        self._resolutions = resolutions
+        self._needleCounts = needleCounts
+        self._repeat = repeat
+        self._pollDuration = pollDuration
+        self._scriptLength = scriptLength
+        self._dir = tempfile.mkdtemp(prefix="opentestrobot-benchmark-")
+        self.results = []
+
+    def close(self):
+        shutil.rmtree(self._dir)
+
+    def needle(self, marker):
+        filename = os.path.join(self._dir, "icon%s.png" % (marker,))
+        if not os.path.isfile(filename):
+            open(filename, "wb").write(bytes(bytearray([marker])))
+        return filename
+
+    def ui(self, width, height, needleCount, changing=False):
+        screen = ScreenSource(width, height, needleCount, changing)
+        v = opentestrobot.vision.Interface(screen, MarkerOir(), MarkerOcr(needleCount))
+        return opentestrobot.UserInteraction(v, NullGesture()), screen
+
+    def run(self):
+        for width, height in self._resolutions:
+            self.memoryPerFrame(width, height)
+            self.pollRate(width, height)
+            self.oirBackends(width, height)
+            for needleCount in self._needleCounts:
+                self.latency(width, height, needleCount)
+                self.script(width, height, needleCount)
+        return self.results
+
+    def report(self):
+        return {"formatVersion": FORMAT_VERSION,
+                "time": time.time(),
+                "commit": _gitCommit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "results": self.results}
+
+    def _add(self, name, params, metrics):
+        result = {"benchmark": name, "params": params}
+        result.update(metrics)
+        self.results.append(result)
+        return result
+
+    def latency(self, width, height, needleCount):
+        """Seconds per tapImage, tapText and locateText of the last icon
+        """
+        ui, _ = self.ui(width, height, needleCount)
+        needle = self.needle(needleCount)
+        text = "icon%s" % (needleCount,)
+        calls = (("tapImage", lambda: ui.tapImage(needle)),
+                 ("tapText", lambda: ui.tapText(text)),
+                 ("locateText", lambda: ui.locateText(text)))
+        params = {"width": width, "height": height, "needles": needleCount}
+        for name, call in calls:
+            call() # warm up needle cache
+            durations = []
+            for _ in xrange(self._repeat):
+                startTime = time.time()
+                call()
+                durations.append(time.time() - startTime)
+            self._add(name, params, _durationStats(durations))
+
+    def pollRate(self, width, height):
+        """Polls per second of a locate that does not find anything
+
+        Unchanged frames are skipped after comparing digests, changing
+        frames are recognised on every poll.
+        """
+        for changing in (False, True):
+            ui, _ = self.ui(width, height, 1, changing)
+            v = ui.vision()
+            v.setPollInterval(0.0, 0.0, 1.0)
+            v.locateImage(self.needle(2), locateTimeout=self._pollDuration)
+            stats = v.locateStats()
+            self._add("poll", {"width": width, "height": height,
+                               "changing": changing},
+                      {"pollsPerSecond": stats["polls"] / stats["totalTime"],
+                       "polls": stats["polls"],
+                       "framesSkipped": stats["framesSkipped"],
+                       "captureTime": stats["captureTime"],
+                       "recognitionTime": stats["recognitionTime"]})
+
+    def memoryPerFrame(self, width, height, frames=8):
+        """Bytes per frame held by the capture buffer
+
+        allocatedPerFrame, measured with tracemalloc, is available
+        on Python 3 only.
+        """
+        ui, _ = self.ui(width, height, 1, changing=True)
+        v = ui.vision()
+        allocated = None
+        if tracemalloc != None:
+            tracemalloc.start()
+        try:
+            buffer = opentestrobot.vision.FrameRingBuffer(depth=frames)
+            for _ in xrange(frames):
+                buffer.put(v.frame())
+            if tracemalloc != None:
+                allocated = tracemalloc.get_traced_memory()[0] / float(frames)
+        finally:
+            if tracemalloc != None:
+                tracemalloc.stop()
+        stats = buffer.stats()
+        self._add("memory", {"width": width, "height": height},
+                  {"bytesPerFrame": stats["bytes"] / float(stats["frames"]),
+                   "allocatedPerFrame": allocated})
+
+    def oirBackends(self, width, height):
+        """Seconds per oirLocate of an icon with available OIR backends
+
+        The needle is cut from the screen with some background around
+        the icon. PyramidOir needs numpy, FmbtOir needs fMBT.
+        fullResolution is PyramidOir without downsampled levels.
+        """
+        screen = ScreenSource(width, height, 1)
+        frame = screen.frame()
+        x, y = screen.positions[1]
+        border = ICON_SIZE // 2
+        x1, y1 = max(0, x - border), max(0, y - border)
+        x2, y2 = min(width, x + ICON_SIZE + border), min(height, y + ICON_SIZE + border)
+        needleFilename = os.path.join(self._dir, "oir-%sx%s.pgm" % (width, height))
+        f = open(needleFilename, "wb")
+        f.write(("P5\n%d %d\n255\n" % (x2 - x1, y2 - y1)).encode("ascii"))
+        for row in xrange(y1, y2):
+            f.write(frame.row(row).tobytes()[x1:x2])
+        f.close()
+        for name, backend, methodName, haystack in _oirBackends(frame):
+            needle = backend.loadNeedle(needleFilename)
+            locate = getattr(backend, methodName)
+            found = len(locate(haystack, needle))
+            durations = []
+            for _ in xrange(self._repeat):
+                startTime = time.time()
+                locate(haystack, needle)
+                durations.append(time.time() - startTime)
+            metrics = _durationStats(durations)
+            metrics["found"] = found
+            self._add("oir", {"width": width, "height": height,
+                              "backend": name}, metrics)
+
+    def script(self, width, height, needleCount):
+        """Steps per second of a script that taps icons in turn
+
+        The same steps are run one call at a time and with runPipeline.
+        """
+        ui, _ = self.ui(width, height, needleCount)
+        steps = [Step("tapImage", self.needle(i % needleCount + 1))
+                 for i in xrange(self._scriptLength)]
+        params = {"width": width, "height": height, "needles": needleCount,
+                  "steps": len(steps)}
+        startTime = time.time()
+        for step in steps:
+            getattr(ui, step.methodName)(*step.args, **step.kwargs)
+        elapsed = time.time() - startTime
+        self._add("script", params, {"stepsPerSecond": len(steps) / elapsed,
+                                     "totalTime": elapsed})
+        report = ui.runPipeline(steps)
+        self._add("pipeline", params, {"stepsPerSecond": report.throughput(),
+                                       "totalTime": report.totalTime})
+
+def _oirBackends(frame):
+    """Returns (name, backend, method name, haystack) of available
+    OIR backends
+    """
+    backends = []
+    if oir.numpy != None:
+        backends.append(("pyramid", oir.PyramidOir(), "oirLocateBuffer", frame))
+        # the same matching without the coarse pyramid levels
+        backends.append(("fullResolution", oir.PyramidOir(maxLevel=0),
+                         "oirLocateBuffer", frame))
+    try:
+        import fmbtgti
+    except ImportError:
+        pass
+    else:
+        backends.append(("fmbt", oir.FmbtOir(fmbtgti.GUITestInterface()),
+                         "oirLocate", camera.Frame(frame.filename())))
+    return backends
+
+def _durationStats(durations):
+    durations = sorted(durations)
+    return {"count": len(durations),
+            "min": durations[0],
+            "median": durations[len(durations) // 2],
+            "mean": sum(durations) / len(durations),
+            "max": durations[-1]}
+
+def _gitCommit():
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "HEAD"], stderr=open(os.devnull, "w"),
+            cwd=os.path.dirname(os.path.abspath(__file__))).decode("ascii").strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def _key(result):
+    return (result["benchmark"], tuple(sorted(result["params"].items())))
+
+def compare(before, after):
+    """Returns list of (benchmark, params, metric, before, after, ratio)
+
+    Compares numeric metrics of results that have the same benchmark
+    name and parameters in both reports.
+    """
+    beforeResults = dict((_key(r), r) for r in before["results"])
+    rows = []
+    for result in after["results"]:
+        old = beforeResults.get(_key(result))
+        if old == None:
+            continue
+        for metric in sorted(result):
+            if metric in ("benchmark", "params"):
+                continue
+            oldValue, newValue = old.get(metric), result[metric]
+            if not isinstance(oldValue, (int, float)) or not isinstance(newValue, (int, float)):
+                continue
+            ratio = newValue / float(oldValue) if oldValue else None
+            rows.append((result["benchmark"], result["params"], metric,
+                         oldValue, newValue, ratio))
+    return rows
+
+def _parseResolution(value):
+    width, height = value.lower().split("x")
+    return int(width), int(height)
+
+def main(argv):
+    parser = optparse.OptionParser(
+        usage="%prog [options]\n       %prog --compare BEFORE.json AFTER.json")
+    parser.add_option("-o", "--output", help="write results to file")
+    parser.add_option("-r", "--resolutions",
+                      default=",".join("%sx%s" % r for r in RESOLUTIONS),
+                      help="comma separated WIDTHxHEIGHT list")
+    parser.add_option("-n", "--needles",
+                      default=",".join(str(n) for n in NEEDLE_COUNTS),
+                      help="comma separated icon counts")
+    parser.add_option("--repeat", type="int", default=5,
+                      help="calls per latency measurement")
+    parser.add_option("--poll-duration", type="float", default=0.5,
+                      help="seconds of polling per poll measurement")
+    parser.add_option("--compare", action="store_true",
+                      help="compare two result files")
+    options, args = parser.parse_args(argv[1:])
+
+    if options.compare:
+        if len(args) != 2:
+            parser.error("--compare needs two result files")
+        before, after = [json.load(open(filename)) for filename in args]
+        for name, params, metric, old, new, ratio in compare(before, after):
+            print("%-10s %-50s %-16s %12.6g %12.6g %s" % (
+                name, json.dumps(params, sort_keys=True), metric, old, new,
+                "%.3f" % (ratio,) if ratio != None else "-"))
+        return 0
+
+    benchmark = Benchmark(
+        [_parseResolution(r) for r in options.resolutions.split(",")],
+        [int(n) for n in options.needles.split(",")],
+        options.repeat, options.poll_duration)
+    try:
+        benchmark.run()
+    finally:
+        benchmark.close()
+    output = json.dumps(benchmark.report(), indent=2, sort_keys=True)
+    if options.output:
+        open(options.output, "w").write(output + "\n")
+    else:
+        print(output)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,69 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+import json
+import unittest
+
+from tests import benchmark
+
+class TestBenchmark(unittest.TestCase):
+    def testMarkersAreFound(self):
+        ui, screen = benchmark.Benchmark().ui(128, 96, 3)
+        x, y = screen.positions[2]
+        words = ui.vision().words()
+        self.assertEqual(sorted(w.getText() for w in words),
+                         ["icon1", "icon2", "icon3"])
+        icon2 = ui.locateText("icon2")
+        self.assertEqual(len(icon2), 1)
+        self.assertEqual(icon2[0].getBbox(),
+                         ((x / 128.0, y / 96.0),
+                          ((x + benchmark.ICON_SIZE) / 128.0,
+                           (y + benchmark.ICON_SIZE) / 96.0)))
+
+    def testRunAndCompare(self):
+        b = benchmark.Benchmark(resolutions=[(128, 96)], needleCounts=[2],
+                                repeat=1, pollDuration=0.01, scriptLength=3)
+        try:
+            b.run()
+        finally:
+            b.close()
+        report = json.loads(json.dumps(b.report()))
+        names = set(r["benchmark"] for r in report["results"])
+        self.assertTrue(set(["memory", "poll", "tapImage", "tapText", "locateText",
+                             "script", "pipeline"]) <= names, names)
+        for result in report["results"]:
+            if result["benchmark"] == "oir":
+                self.assertEqual(result["found"], 1, result)
+        memory = [r for r in report["results"] if r["benchmark"] == "memory"][0]
+        self.assertEqual(memory["bytesPerFrame"], 128 * 96)
+        rows = benchmark.compare(report, report)
+        self.assertTrue(rows)
+        for row in rows:
+            self.assertTrue(row[-1] in (None, 1.0), row)
+
+if __name__ == "__main__":
+    unittest.main()
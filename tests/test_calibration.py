@@ -0,0 +1,131 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import os
+import tempfile
+import unittest
+
+from opentestrobot import calibration, gesture, robot, vision
+from tests.test_vision import FileCamera
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# display rotated by 90 degrees and seen in perspective by the camera
+ROBOT_CORNERS = [(70.0, 20.0, 1.0), (70.0, 140.0, 1.0), (10.0, 20.0, 3.0), (10.0, 140.0, 3.0)]
+CAMERA_CORNERS = [(110.0, 40.0), (690.0, 60.0), (100.0, 1250.0), (700.0, 1240.0)]
+
+class TestCalibration(unittest.TestCase):
+    def setUp(self):
+        self.calibration = calibration.Calibration(
+            ROBOT_CORNERS, CAMERA_CORNERS, cameraSize=(800, 1300),
+            locations={"power": (0.0, 50.0, 5.0)})
+
+    def testCorners(self):
+        for unityPos, robotPos, cameraPos in zip(
+                calibration.UNITY_CORNERS, ROBOT_CORNERS, CAMERA_CORNERS):
+            for value, expected in zip(
+                    self.calibration.transform(unityPos, "unity", "robot"), robotPos):
+                self.assertAlmostEqual(value, expected)
+            for value, expected in zip(
+                    self.calibration.transform(cameraPos, "camera", "unity"), unityPos):
+                self.assertAlmostEqual(value, expected)
+        self.assertEqual(self.calibration.transform((0.5, 0.5), "unity", "robot"),
+                         (40.0, 80.0, 2.0))
+
+    def testBatchMatchesSinglePoints(self):
+        points = [(0.1 * i, 0.05 * i) for i in range(10)]
+        batch = self.calibration.transformPoints(points, "camera", "robot")
+        for point, mapped in zip(points, batch):
+            expected = self.calibration.transform(point, "camera", "robot")
+            for value1, value2 in zip(mapped, expected):
+                self.assertAlmostEqual(value1, value2)
+
+    @unittest.skipIf(numpy == None, "numpy not available")
+    def testNumpyBatch(self):
+        points = numpy.array([(0.0, 0.0), (0.5, 0.5), (1.0, 1.0)])
+        mapped = self.calibration.transformPoints(points, "unity", "robot")
+        self.assertEqual(mapped.shape, (3, 3))
+        self.assertAlmostEqual(mapped[1][2], 2.0)
+
+    def testAccuracy(self):
+        self.assertAlmostEqual(self.calibration.accuracy()["robot"], 0.0)
+        self.assertFalse("camera" in self.calibration.accuracy())
+        # perspective camera corners are not a parallelogram
+        calibration.Calibration(ROBOT_CORNERS, CAMERA_CORNERS, tolerance=1.0)
+        skewed = ROBOT_CORNERS[:3] + [(12.0, 140.0, 3.0)]
+        self.assertRaises(calibration.CalibrationError, calibration.Calibration,
+                          skewed, CAMERA_CORNERS, tolerance=1.0)
+        crossed = CAMERA_CORNERS[:2] + CAMERA_CORNERS[3:] + CAMERA_CORNERS[2:3]
+        self.assertRaises(calibration.CalibrationError, calibration.Calibration,
+                          ROBOT_CORNERS, crossed, tolerance=1.0)
+
+    def testSaveAndLoad(self):
+        fd, filename = tempfile.mkstemp(suffix=".json")
+        os.close(fd)
+        try:
+            self.calibration.save(filename)
+            loaded = calibration.Calibration.load(filename)
+        finally:
+            os.remove(filename)
+        self.assertEqual(loaded.location("power"), (0.0, 50.0, 5.0))
+        self.assertEqual(loaded.transform((320, 500), "camera", "robot"),
+                         self.calibration.transform((320, 500), "camera", "robot"))
+
+    def testGestureRobot(self):
+        simulated = robot.Simulated()
+        g = gesture.Robot(simulated, calibrationInstance=self.calibration, liftHeight=4.0)
+        g.tap((0.5, 0.5))
+        self.assertEqual(simulated.position(), (40.0, 80.0, 6.0))
+
+class CornerOir(object):
+    """Finds a 10x10 pixel needle at the top-left corner of the display"""
+    def loadNeedle(self, filename):
+        return filename
+
+    def oirLocate(self, haystack, needle, area=None):
+        from opentestrobot import guielements
+        return (guielements.Rectangle((110 / 800.0, 40 / 1300.0),
+                                      (120 / 800.0, 50 / 1300.0)),)
+
+class TestVisionCalibration(unittest.TestCase):
+    def testResultsInDisplayCoordinates(self):
+        cam = FileCamera(["frame"])
+        try:
+            v = vision.Interface(cam, CornerOir())
+            v.setCalibration(calibration.Calibration(
+                ROBOT_CORNERS, CAMERA_CORNERS, cameraSize=(800, 1300)))
+            results = v.locateImage(cam.needle("needle"))
+        finally:
+            cam.close()
+        (left, top), (right, bottom) = results[0].getBbox()
+        self.assertAlmostEqual(left, 0.0, places=3)
+        self.assertAlmostEqual(top, 0.0, places=3)
+        self.assertTrue(0.0 < right < 0.1 and 0.0 < bottom < 0.1)
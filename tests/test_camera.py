@@ -0,0 +1,102 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import os
+import tempfile
+import unittest
+
+import opentestrobot
+from opentestrobot import camera, guielements, oir
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+def _bgraFrame(padding=0):
+    # 2x2 frame: red, green / blue, white, rows padded with garbage
+    pixels = bytearray(b"\x00\x00\xff\x00" b"\x00\xff\x00\x00" + b"\x11" * padding +
+                       b"\xff\x00\x00\x00" b"\xff\xff\xff\x00" + b"\x22" * padding)
+    return camera.BufferFrame(pixels, 2, 2, 8 + padding, "BGRA8888")
+
+class BufferOir(oir.Interface):
+    def oirLocate(self, haystack, needleFilename):
+        raise AssertionError("file based entry point called")
+
+    def loadNeedle(self, needleFilename):
+        return open(needleFilename, "rb").read()
+
+    def oirLocateBuffer(self, haystack, needle):
+        if haystack.row(0).tobytes() == needle:
+            return (guielements.ImageRectangle((0, 0), (1, 1), needle),)
+        return ()
+
+class TestBufferFrame(unittest.TestCase):
+    def testDigestIgnoresPadding(self):
+        self.assertEqual(_bgraFrame(0).digest(), _bgraFrame(3).digest())
+
+    def testTooSmallBuffer(self):
+        self.assertRaises(ValueError, camera.BufferFrame,
+                          bytearray(11), 2, 2, None, "RGB888")
+
+    def testFilenameFallback(self):
+        frame = _bgraFrame(3)
+        filename = frame.filename()
+        self.assertEqual(open(filename, "rb").read(),
+                         b"P6\n2 2\n255\n"
+                         b"\xff\x00\x00" b"\x00\xff\x00"
+                         b"\x00\x00\xff" b"\xff\xff\xff")
+        del frame
+        self.assertFalse(os.path.exists(filename))
+
+    def testThumbnail(self):
+        frame = _bgraFrame(3)
+        self.assertEqual(frame.thumbnail((2, 2)), (76, 149, 29, 255))
+        self.assertEqual(frame.thumbnail((1, 1), ((0.5, 0.5), (1.0, 1.0))),
+                         (255,))
+        self.assertEqual(camera.Frame("missing").thumbnail(), None)
+
+    @unittest.skipIf(numpy == None, "numpy is not available")
+    def testArray(self):
+        array = _bgraFrame(3).array()
+        self.assertEqual(array.shape, (2, 2, 4))
+        self.assertEqual(list(array[1, 0]), [0xff, 0, 0, 0])
+
+    def testLocateFromBufferSource(self):
+        pixels = bytearray(b"abcdef")
+        v = opentestrobot.vision.Interface(
+            camera.BufferSource(lambda: pixels, 2, 1), BufferOir())
+        fd, needle = tempfile.mkstemp(suffix=".png")
+        try:
+            os.write(fd, b"abcdef")
+            os.close(fd)
+            self.assertEqual(len(v.locateImage(needle)), 1)
+            pixels[0] = ord("x")
+            self.assertEqual(v.locateImage(needle), ())
+        finally:
+            os.remove(needle)
@@ -0,0 +1,250 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import socket
+import threading
+import time
+import unittest
+
+import opentestrobot
+from opentestrobot import gesture, robotserver
+
+class SlowGesture(gesture.Interface):
+    def __init__(self):
+        self.events = []
+        self.release = threading.Event()
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self.release.wait()
+        if pos == "fail":
+            raise ValueError("tap failed")
+        self.events.append(("tap", pos))
+        return pos
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        self.events.append(("swipe", beginPos, endPos))
+
+class ScriptedServer(object):
+    """Serves one request per connection, then closes the connection
+
+    Each action is "respond" (200 OK with keep-alive) or "drop" (close
+    without a response).
+    """
+    def __init__(self, actions):
+        self.actions = list(actions)
+        self.requests = []
+        self._socket = socket.socket()
+        self._socket.bind(("127.0.0.1", 0))
+        self._socket.listen(5)
+        self.port = self._socket.getsockname()[1]
+        self._thread = threading.Thread(target=self._serve)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def _serve(self):
+        for action in self.actions:
+            conn, _ = self._socket.accept()
+            data = b""
+            while b"\r\n\r\n" not in data:
+                data += conn.recv(4096)
+            self.requests.append(data.split(b" ", 1)[0])
+            if action == "respond":
+                conn.sendall(b"HTTP/1.1 200 OK\r\nContent-Length: 2\r\n"
+                             b"Connection: keep-alive\r\n\r\nok")
+            conn.close()
+
+    def close(self):
+        self._socket.close()
+
+class TestCommandQueue(unittest.TestCase):
+    def setUp(self):
+        self.gesture = SlowGesture()
+
+    def tearDown(self):
+        self.gesture.release.set()
+
+    def testOrder(self):
+        futures = [self.gesture.tapAsync((0.1, 0.1)),
+                   self.gesture.swipeAsync((0.1, 0.1), (0.9, 0.9)),
+                   self.gesture.tapAsync((0.2, 0.2))]
+        self.assertFalse(futures[0].done())
+        self.assertRaises(gesture.GestureTimeoutError,
+                          futures[2].result, 0.01)
+        self.gesture.release.set()
+        self.assertEqual(futures[2].result(5.0), (0.2, 0.2))
+        self.gesture.flush()
+        self.assertEqual(self.gesture.events,
+                         [("tap", (0.1, 0.1)),
+                          ("swipe", (0.1, 0.1), (0.9, 0.9)),
+                          ("tap", (0.2, 0.2))])
+
+    def testCancel(self):
+        first = self.gesture.tapAsync((0.1, 0.1))
+        second = self.gesture.tapAsync((0.2, 0.2))
+        third = self.gesture.tapAsync((0.3, 0.3))
+        self.assertTrue(second.cancel())
+        self.gesture.release.set()
+        self.gesture.flush(5.0)
+        self.assertFalse(first.cancel())
+        self.assertRaises(gesture.CancelledError, second.result)
+        self.assertEqual(self.gesture.events,
+                         [("tap", (0.1, 0.1)), ("tap", (0.3, 0.3))])
+
+    def testErrorCancelsQueue(self):
+        failing = self.gesture.tapAsync("fail")
+        queued = self.gesture.tapAsync((0.2, 0.2))
+        self.gesture.release.set()
+        self.assertRaises(ValueError, failing.result, 5.0)
+        self.assertRaises(gesture.CancelledError, queued.result, 5.0)
+        self.assertTrue(self.gesture.tapAsync((0.3, 0.3)).cancelled())
+        self.assertRaises(ValueError, self.gesture.flush)
+        # error has been reported, queue accepts gestures again
+        self.assertEqual(self.gesture.tapAsync((0.4, 0.4)).result(5.0),
+                         (0.4, 0.4))
+
+    def testSynchronousGestureWaitsForQueue(self):
+        ui = opentestrobot.UserInteraction(None, self.gesture)
+        ui.tapAsync((0.1, 0.1))
+        threading.Timer(0.05, self.gesture.release.set).start()
+        ui.swipe((0.5, 0.5), (0.6, 0.6))
+        self.assertEqual(self.gesture.events,
+                         [("tap", (0.1, 0.1)),
+                          ("swipe", (0.5, 0.5), (0.6, 0.6))])
+
+class SequenceGesture(SlowGesture):
+    def __init__(self):
+        SlowGesture.__init__(self)
+        self.release.set()
+        self.sequences = []
+
+    def executeSequence(self, gestures):
+        self.sequences.append(gesture.sequencePath(gestures))
+
+class TestSequence(unittest.TestCase):
+    def testBatchReplaysLocally(self):
+        g = SlowGesture()
+        g.release.set()
+        with g.batch() as b:
+            b.tap((0.1, 0.1))
+            b.swipe((0.1, 0.1), (0.9, 0.9))
+            self.assertEqual(g.events, [])
+        self.assertEqual(g.events, [("tap", (0.1, 0.1)),
+                                    ("swipe", (0.1, 0.1), (0.9, 0.9))])
+
+    def testBatchSendsOneSequence(self):
+        g = SequenceGesture()
+        with g.batch() as b:
+            b.tap((0.1, 0.1), 0.5)
+            b.drag((0.1, 0.1), (0.5, 0.1), dragDuration=1.0)
+        self.assertEqual(len(g.sequences), 1)
+        self.assertEqual(g.sequences[0],
+                         [(0.0, (0.1, 0.1), False),
+                          (0.0, (0.1, 0.1), True),
+                          (0.5, (0.1, 0.1), True),
+                          (0.5, (0.1, 0.1), False),
+                          (0.5, (0.1, 0.1), True),
+                          (1.5, (0.5, 0.1), True),
+                          (1.5, (0.5, 0.1), False)])
+
+    def testCoalesceContinuousMoves(self):
+        path = gesture.coalescePath([
+            (0.0, (0.0, 0.0), True),
+            (1.0, (0.5, 0.0), True),
+            (2.0, (1.0, 0.0), True),
+            (3.0, (1.0, 1.0), True)])
+        self.assertEqual(path, [(0.0, (0.0, 0.0), True),
+                                (2.0, (1.0, 0.0), True),
+                                (3.0, (1.0, 1.0), True)])
+
+    def testSmoothSwipe(self):
+        path = gesture.gesturePath("swipe", ((0.0, 0.0), (1.0, 0.0)))
+        xs = [pos[0] for _, pos, pressed in path if pressed]
+        self.assertEqual(len(xs), gesture.SMOOTH_STEPS + 1)
+        steps = [x2 - x1 for x1, x2 in zip(xs, xs[1:])]
+        # slow begin and end
+        self.assertTrue(steps[0] < steps[len(steps) // 2] > steps[-1])
+
+class TestOptoHttp(unittest.TestCase):
+    def setUp(self):
+        self.server = robotserver.RobotServer(timeScale=0.0).start()
+        self.robot = gesture.OptoHttp(self.server.url())
+
+    def tearDown(self):
+        self.robot.close()
+        self.server.stop()
+
+    def testConnectionIsReused(self):
+        for i in range(5):
+            self.robot.tap((0.1 * i, 0.5))
+        self.robot.swipe((0.1, 0.5), (0.9, 0.5))
+        self.assertEqual([c for c, _ in self.server.commands],
+                         ["tap"] * 5 + ["swipe"])
+        self.assertEqual(self.server.commands[1][1],
+                         {"pos": [0.1, 0.5], "duration": 0.0})
+        self.assertEqual(self.robot.stats()["connections"], 1)
+        self.assertEqual(self.robot.stats()["requests"], 6)
+
+    def testSequenceIsOneRequest(self):
+        with self.robot.batch() as b:
+            b.tap((0.1, 0.1))
+            b.tap((0.2, 0.2))
+        self.assertEqual([c for c, _ in self.server.commands], ["path"])
+        self.assertTrue(self.server.simulatedTime > 0)
+
+    def testErrors(self):
+        self.assertRaises(gesture.GestureError, self.robot._post, "jump", {})
+        self.server._timeScale = 10.0
+        self.assertRaises(gesture.GestureTimeoutError,
+                          self.robot.tap, (0.0, 0.0), 1.0, timeout=0.05)
+
+class TestConnectionPool(unittest.TestCase):
+    def request(self, actions, method, retries):
+        self.server = ScriptedServer(actions)
+        self.pool = gesture.ConnectionPool("127.0.0.1", self.server.port, timeout=2.0)
+        return self.pool.request(method, "/tap", b"{}", retries=retries)
+
+    def tearDown(self):
+        self.pool.close()
+        self.server.close()
+
+    def testSentPostIsNotRetried(self):
+        self.assertRaises((socket.error, gesture.httplib.HTTPException),
+                          self.request, ["drop", "respond"], "POST", 1)
+        self.assertEqual(self.server.requests, [b"POST"])
+        self.assertEqual(self.pool.stats()["retries"], 0)
+
+    def testIdempotentRequestIsRetried(self):
+        self.assertEqual(self.request(["drop", "respond"], "GET", 1), (200, b"ok"))
+        self.assertEqual(self.server.requests, [b"GET", b"GET"])
+        self.assertEqual(self.pool.stats()["retries"], 1)
+
+    def testClosedIdleConnectionIsNotReused(self):
+        self.assertEqual(self.request(["respond", "respond"], "POST", 0), (200, b"ok"))
+        time.sleep(0.05)
+        self.assertEqual(self.pool.request("POST", "/tap", b"{}"), (200, b"ok"))
+        self.assertEqual(self.pool.stats()["connections"], 2)
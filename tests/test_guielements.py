@@ -0,0 +1,87 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import copy
+import pickle
+import unittest
+
+from opentestrobot import guielements
+
+def _word(text, left, top, right, bottom):
+    return guielements.Word((left, top), (right, bottom), text)
+
+class TestElements(unittest.TestCase):
+    def testImmutable(self):
+        word = _word("OK", 0.1, 0.1, 0.2, 0.2)
+        self.assertRaises(AttributeError, setattr, word, "_text", "Cancel")
+        self.assertRaises(AttributeError, setattr, word, "color", "red")
+        self.assertFalse(hasattr(word, "__dict__"))
+
+    def testCopyAndPickle(self):
+        text = guielements.TextRectangle((0.1, 0.1), (0.5, 0.2), "OK now",
+                                         [_word("OK", 0.1, 0.1, 0.2, 0.2)])
+        for protocol in (0, 2):
+            loaded = pickle.loads(pickle.dumps(text, protocol))
+            self.assertEqual(loaded.getBbox(), text.getBbox())
+            self.assertEqual(loaded.getWords()[0].getText(), "OK")
+        mapped = guielements.mapFromArea(text, ((0.0, 0.0), (0.5, 0.5)))
+        self.assertEqual(mapped.getBbox(), ((0.05, 0.05), (0.25, 0.1)))
+        self.assertEqual(text.getBbox(), ((0.1, 0.1), (0.5, 0.2)))
+        self.assertEqual(copy.copy(text).getText(), "OK now")
+
+class TestElementSet(unittest.TestCase):
+    def setUp(self):
+        self.elements = guielements.ElementSet([
+            _word("message?", 0.32, 0.31, 0.6, 0.35),
+            _word("OK", 0.2, 0.8, 0.3, 0.84),
+            _word("Delete", 0.1, 0.3, 0.3, 0.34),
+            _word("Cancel", 0.6, 0.81, 0.8, 0.85)])
+
+    def texts(self, elements):
+        return [element.getText() for element in elements]
+
+    def testTuple(self):
+        self.assertEqual(len(self.elements), 4)
+        self.assertEqual(self.elements, tuple(self.elements))
+        self.assertTrue(isinstance(self.elements[1:], guielements.ElementSet))
+        self.assertFalse(guielements.ElementSet())
+        self.assertEqual(len(self.elements.bboxes()), 4 * 4 if guielements.numpy == None else 4)
+        self.assertEqual(self.texts(pickle.loads(pickle.dumps(self.elements))),
+                         self.texts(self.elements))
+
+    def testQueries(self):
+        bottom = guielements.Rectangle((0.0, 0.5), (1.0, 1.0))
+        self.assertEqual(self.texts(self.elements.within(bottom)), ["OK", "Cancel"])
+        self.assertEqual(self.texts(self.elements.within(((0.0, 0.0), (0.7, 1.0)))),
+                         ["message?", "OK", "Delete"])
+        self.assertEqual(self.texts(self.elements.intersecting(((0.0, 0.0), (0.7, 1.0)))),
+                         ["message?", "OK", "Delete", "Cancel"])
+        self.assertEqual(self.elements.nearest((0.9, 0.9)).getText(), "Cancel")
+        self.assertEqual(guielements.ElementSet().nearest((0.5, 0.5)), None)
+        self.assertEqual(self.texts(self.elements.readingOrder()),
+                         ["Delete", "message?", "OK", "Cancel"])
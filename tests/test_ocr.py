@@ -0,0 +1,126 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import unittest
+
+from opentestrobot import camera, guielements, ocr
+
+def _word(text, left, top, right, bottom):
+    return guielements.Word((left, top), (right, bottom), text)
+
+WORDS = [
+    _word("Cancel", 0.6, 0.81, 0.8, 0.85),
+    _word("Delete", 0.1, 0.3, 0.3, 0.34),
+    _word("message?", 0.32, 0.31, 0.6, 0.35),
+    _word("OK", 0.2, 0.8, 0.3, 0.84),
+    _word("Delivered", 0.1, 0.5, 0.4, 0.54),
+]
+
+class TestTextIndex(unittest.TestCase):
+    def setUp(self):
+        self.index = ocr.TextIndex(WORDS)
+
+    def testLines(self):
+        self.assertEqual([line.getText() for line in self.index.lines()],
+                         ["Delete message?", "Delivered", "OK Cancel"])
+        self.assertEqual([w.getText() for w in self.index.words()],
+                         ["Delete", "message?", "Delivered", "OK", "Cancel"])
+
+    def testExact(self):
+        self.assertEqual(self.index.find("OK"), (WORDS[3],))
+        self.assertEqual(self.index.find("ok"), ())
+        phrase = self.index.find("Delete message?")
+        self.assertEqual(len(phrase), 1)
+        self.assertEqual(phrase[0].getWords(), (WORDS[1], WORDS[2]))
+        self.assertEqual(phrase[0].getBbox(), ((0.1, 0.3), (0.6, 0.35)))
+        self.assertEqual(self.index.find("Delete OK"), ())
+
+    def testPrefix(self):
+        self.assertEqual(self.index.find("Del", "prefix"),
+                         (WORDS[1], WORDS[4]))
+        self.assertEqual(len(self.index.find("Delete mess", "prefix")), 1)
+        self.assertEqual(self.index.find("De message?", "prefix"), ())
+
+    def testFuzzy(self):
+        self.assertEqual(self.index.find("cance1", "fuzzy"), (WORDS[0],))
+        self.assertEqual(self.index.find("delete messaqe?", "fuzzy")[0].getText(),
+                         "Delete message?")
+        self.assertEqual(self.index.find("Dialog", "fuzzy"), ())
+
+    def testArea(self):
+        bottom = ((0.0, 0.7), (1.0, 1.0))
+        self.assertEqual(self.index.find("Cancel", area=bottom), (WORDS[0],))
+        self.assertEqual(self.index.find("Delete", area=bottom), ())
+
+class FakeGuiItem(object):
+    def __init__(self, bbox):
+        self._bbox = bbox
+
+    def bbox(self):
+        return self._bbox
+
+class FakeScreenshot(object):
+    """fMBT Screenshot with words at pixel bounding boxes
+    """
+    def __init__(self, words):
+        self.words = words
+        self.areas = []
+
+    def size(self):
+        return (200, 100)
+
+    def dumpOcr(self, area=None):
+        self.areas.append(area)
+        return [(word, "engine specific") for word, _ in self.words]
+
+    def findItemsByOcr(self, text, match=None, area=None):
+        self.areas.append(area)
+        return [FakeGuiItem(bbox) for word, bbox in self.words
+                if word == text and match == 1.0]
+
+class FakeGuiTestInterface(object):
+    def __init__(self, screenshot):
+        self.screenshot = screenshot
+
+    def refreshScreenshot(self, filename=None):
+        return self.screenshot
+
+class TestFmbtOcr(unittest.TestCase):
+    def testOcrWords(self):
+        sshot = FakeScreenshot([("OK", (40, 80, 60, 84)),
+                                ("Cancel", (120, 81, 160, 85)),
+                                ("OK", (40, 10, 60, 14))])
+        fmbtOcr = ocr.FmbtOcr(FakeGuiTestInterface(sshot))
+        words = fmbtOcr.ocrWords("screenshot.png", ((0.0, 0.5), (1.0, 1.0)))
+        self.assertEqual([(w.getText(), w.getBbox()) for w in words],
+                         [("OK", ((0.2, 0.8), (0.3, 0.84))),
+                          ("OK", ((0.2, 0.1), (0.3, 0.14))),
+                          ("Cancel", ((0.6, 0.81), (0.8, 0.85)))])
+        self.assertEqual(set(sshot.areas), set([(0.0, 0.5, 1.0, 1.0)]))
+        index = ocr.TextIndexCache(fmbtOcr).index(camera.Frame("screenshot.png"))
+        self.assertEqual(len(index.find("OK")), 2)
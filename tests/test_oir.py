@@ -0,0 +1,258 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+import os
+import random
+import shutil
+import struct
+import tempfile
+import unittest
+import zlib
+
+import opentestrobot
+
+from opentestrobot import camera, oir
+
+moduleDir = os.path.dirname(__file__)
+
+def _pngChunk(chunkType, data):
+    return (struct.pack(">I", len(data)) + chunkType + data +
+            struct.pack(">I", zlib.crc32(chunkType + data) & 0xffffffff))
+
+def _paeth(a, b, c):
+    p = a + b - c
+    pa, pb, pc = abs(p - a), abs(p - b), abs(p - c)
+    if pa <= pb and pa <= pc:
+        return a
+    elif pb <= pc:
+        return b
+    return c
+
+def writePng(filename, width, height, colorType, rows, bitDepth=8, palette=None):
+    """Write PNG, row y is filtered with filter type y % 5
+    """
+    channels = {0: 1, 2: 3, 3: 1, 4: 2, 6: 4}[colorType]
+    bpp = max(1, channels * bitDepth // 8)
+    data = bytearray()
+    prior = bytearray(len(rows[0]))
+    for y, row in enumerate(rows):
+        filterType = y % 5
+        data.append(filterType)
+        for i, value in enumerate(row):
+            left = row[i - bpp] if i >= bpp else 0
+            upLeft = prior[i - bpp] if i >= bpp else 0
+            predictor = (0, left, prior[i], (left + prior[i]) >> 1,
+                         _paeth(left, prior[i], upLeft))[filterType]
+            data.append((value - predictor) & 0xff)
+        prior = row
+    png = (camera.PNG_SIGNATURE +
+           _pngChunk(b"IHDR", struct.pack(">IIBBBBB", width, height, bitDepth,
+                                          colorType, 0, 0, 0)))
+    if palette != None:
+        png += _pngChunk(b"PLTE", bytes(palette))
+    png += _pngChunk(b"IDAT", zlib.compress(bytes(data)))
+    png += _pngChunk(b"IEND", b"")
+    open(filename, "wb").write(png)
+
+class TestReadImage(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "image.png")
+        rnd = random.Random(1)
+        self.pixels = bytearray(rnd.randint(0, 255) for _ in range(6 * 5 * 4))
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _rows(self, rowBytes):
+        return [self.pixels[y * rowBytes:(y + 1) * rowBytes] for y in range(5)]
+
+    def testColorTypes(self):
+        for colorType, channels in ((0, 1), (2, 3), (4, 2), (6, 4)):
+            writePng(self.filename, 6, 5, colorType, self._rows(6 * channels))
+            self.assertEqual(camera.readImage(self.filename),
+                             (6, 5, channels, self.pixels[:6 * 5 * channels]))
+
+    def testPaletteAndBitDepths(self):
+        # 4-bit palette indices 0-15, two pixels per byte
+        palette = bytearray(range(48))
+        rows = self._rows(3)
+        writePng(self.filename, 6, 5, 3, rows, bitDepth=4, palette=palette)
+        width, height, channels, pixels = camera.readImage(self.filename)
+        self.assertEqual((width, height, channels), (6, 5, 3))
+        first = self.pixels[0]
+        self.assertEqual(pixels[:6], palette[3 * (first >> 4):3 * (first >> 4) + 3] +
+                         palette[3 * (first & 15):3 * (first & 15) + 3])
+        # 1-bit gray is scaled to 0 and 255
+        writePng(self.filename, 6, 5, 0, [bytearray([0xa4])] * 5, bitDepth=1)
+        self.assertEqual(camera.readImage(self.filename)[3][:6],
+                         bytearray([255, 0, 255, 0, 0, 255]))
+        # 16-bit samples are reduced to their high byte
+        writePng(self.filename, 3, 5, 0, self._rows(6), bitDepth=16)
+        self.assertEqual(camera.readImage(self.filename)[3][:3], self.pixels[0:6:2])
+
+    def testPnm(self):
+        frame = camera.BufferFrame(self.pixels[:6 * 5 * 3], 6, 5, None, "RGB888")
+        self.assertEqual(camera.readImage(frame.filename()),
+                         (6, 5, 3, self.pixels[:6 * 5 * 3]))
+        open(self.filename, "wb").write(b"P5\n# comment\n2 1\n255\n\x01\x02")
+        self.assertEqual(camera.readImage(self.filename), (2, 1, 1, bytearray(b"\x01\x02")))
+
+    def testRepositoryImage(self):
+        width, height, channels, pixels = camera.readImage(
+            os.path.join(moduleDir, "images", "nexus-s-dial.png"))
+        self.assertEqual((width, height), (480, 800))
+        self.assertEqual(len(pixels), width * height * channels)
+
+    @unittest.skipIf(camera.numpy == None, "numpy is not available")
+    def testNumpyUnfilterMatchesPurePython(self):
+        # all five filter types, with and without Average and Paeth rows
+        for colorType, rows in ((2, 5), (6, 5), (0, 3)):
+            channels = {0: 1, 2: 3, 6: 4}[colorType]
+            writePng(self.filename, 6, rows, colorType,
+                     self._rows(6 * channels)[:rows])
+            decoded = camera.readImage(self.filename)
+            camera.numpy, numpy = None, camera.numpy
+            try:
+                self.assertEqual(camera.readImage(self.filename), decoded)
+            finally:
+                camera.numpy = numpy
+
+    def testUnsupported(self):
+        open(self.filename, "wb").write(b"GIF89a")
+        self.assertRaises(ValueError, camera.readImage, self.filename)
+
+@unittest.skipIf(oir.numpy == None, "numpy is not available")
+class TestPyramidOir(unittest.TestCase):
+    def setUp(self):
+        numpy = oir.numpy
+        self.dir = tempfile.mkdtemp()
+        # smooth texture: random 40x30 image scaled to 320x240
+        rnd = numpy.random.RandomState(2)
+        self.screen = oir._resize(rnd.uniform(0, 255, (30, 40)), 8.0)
+        self.needleFile = self._writeNeedle(self.screen[60:92, 100:140])
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _writeNeedle(self, image):
+        filename = os.path.join(self.dir, "needle%s.png" % (len(os.listdir(self.dir)),))
+        gray = oir.numpy.clip(image, 0, 255).astype(oir.numpy.uint8)
+        writePng(filename, gray.shape[1], gray.shape[0], 0,
+                 [bytearray(row.tobytes()) for row in gray])
+        return filename
+
+    def _vision(self, image, pyramidOir):
+        pixels = bytearray(oir.numpy.clip(image, 0, 255).astype(oir.numpy.uint8).tobytes())
+        height, width = image.shape
+        return opentestrobot.vision.Interface(
+            camera.BufferSource(lambda: pixels, width, height, None, "GRAY8"), pyramidOir)
+
+    def _pixelBboxes(self, results, size=(320, 240)):
+        return [tuple(int(round(c * s)) for corner in e.getBbox()
+                      for c, s in zip(corner, size)) for e in results]
+
+    def testExactMatch(self):
+        v = self._vision(self.screen, oir.PyramidOir())
+        results = v.locateImage(self.needleFile)
+        self.assertEqual(self._pixelBboxes(results), [(100, 60, 140, 92)])
+        self.assertTrue(results[0].getConfidence() > 0.99)
+        self.assertEqual(results[0].getImageUri(), self.needleFile)
+
+    def testCoarseLevelMatchesFullResolution(self):
+        for x, y in ((101, 61), (37, 150), (279, 207)):
+            needleFile = self._writeNeedle(self.screen[y:y + 32, x:x + 40])
+            for maxLevel in (0, 4):
+                v = self._vision(self.screen, oir.PyramidOir(maxLevel=maxLevel))
+                self.assertEqual(self._pixelBboxes(v.locateImage(needleFile))[:1],
+                                 [(x, y, x + 40, y + 32)])
+
+    def testArea(self):
+        screen = self.screen.copy()
+        screen[150:182, 200:240] = self.screen[60:92, 100:140]
+        v = self._vision(screen, oir.PyramidOir())
+        self.assertEqual(sorted(self._pixelBboxes(v.locateImage(self.needleFile))),
+                         [(100, 60, 140, 92), (200, 150, 240, 182)])
+        bottomRight = opentestrobot.guielements.Rectangle((0.5, 0.5), (1.0, 1.0))
+        self.assertEqual(self._pixelBboxes(v.locateImage(self.needleFile, area=bottomRight)),
+                         [(200, 150, 240, 182)])
+
+    def testOddAreaOffset(self):
+        # area that does not begin at a multiple of the coarse level size
+        area = opentestrobot.guielements.Rectangle((97 / 320.0, 55 / 240.0), (1.0, 1.0))
+        v = self._vision(self.screen, oir.PyramidOir(maxLevel=2))
+        self.assertEqual(self._pixelBboxes(v.locateImage(self.needleFile, area=area)),
+                         [(100, 60, 140, 92)])
+
+    def testPyramidIsStoredInFrame(self):
+        pyramidOir = oir.PyramidOir()
+        frame = self._vision(self.screen, None).frame()
+        needle = pyramidOir.loadNeedle(self.needleFile)
+        pyramidOir.oirLocateBuffer(frame, needle)
+        pyramid = frame.image((oir.PyramidOir, "pyramid"))
+        self.assertEqual(len(pyramid), 3)
+        self.assertTrue(pyramid[0] is frame.image((oir.PyramidOir, "gray")))
+        self.assertEqual([level.dtype for level in pyramid], [oir.numpy.float32] * 3)
+        self.assertEqual(needle.image.dtype, oir.numpy.float32)
+        pyramidOir.oirLocateBuffer(frame, needle, ((0.5, 0.5), (1.0, 1.0)))
+        self.assertTrue(frame.image((oir.PyramidOir, "pyramid")) is pyramid)
+
+    def testScaleRange(self):
+        screen = self.screen.copy()
+        enlarged = oir._resize(self.screen[60:92, 100:140], 1.25)
+        screen[120:160, 180:230] = enlarged
+        needleFile = self._writeNeedle(self.screen[60:92, 100:140])
+        found = oir.PyramidOir(scaleRange=(0.9, 1.3), scaleStep=0.05).oirLocateBuffer(
+            self._vision(screen, None).frame(), oir.PyramidOir().loadNeedle(needleFile))
+        self.assertTrue((180, 120, 230, 160) in self._pixelBboxes(found), found)
+        self.assertEqual(
+            oir.PyramidOir(scaleRange=(0.9, 1.3), scaleStep=0.1).scales(),
+            [0.9, 1.0, 1.1, 1.2, 1.3])
+
+    def testNeedleSizeIncludesScales(self):
+        needle = oir.PyramidOir(scaleRange=(0.9, 1.1), scaleStep=0.1).loadNeedle(
+            self.needleFile)
+        self.assertTrue(needle.nbytes() > 2.5 * needle.image.nbytes)
+
+    def testParametersKeyPersistentCache(self):
+        names = [opentestrobot.vision._backendName(oir.PyramidOir(threshold=threshold))
+                 for threshold in (0.9, 0.9, 0.8)]
+        self.assertEqual(names[0], names[1])
+        self.assertNotEqual(names[0], names[2])
+
+    def testRepositoryImages(self):
+        # the call button that fMBT taps at (239, 751)
+        pyramidOir = oir.PyramidOir()
+        results = pyramidOir.oirLocate(
+            camera.Frame(os.path.join(moduleDir, "images", "nexus-s-dial.png")),
+            pyramidOir.loadNeedle(os.path.join(moduleDir, "images", "call.png")))
+        self.assertEqual(len(results), 1)
+        x, y = results[0].getPos()
+        self.assertEqual((int(x * 480), int(y * 800)), (239, 750))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,162 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentestrobot
+
+from opentestrobot import guielements, persistentcache
+
+def _writeResults(args):
+    filename, worker, count = args
+    cache = persistentcache.PersistentCache(filename)
+    for i in range(count):
+        cache.put(("text", "w%s-%s" % (worker, i)), b"frame",
+                  [guielements.Word((0.0, 0.0), (0.1, 0.1), "w%s" % (i,))])
+    cache.close()
+    return count
+
+class TestPersistentCache(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.filename = os.path.join(self.dir, "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def _word(self, text):
+        return guielements.Word((0.1, 0.2), (0.3, 0.4), text)
+
+    def testSharedBetweenInstances(self):
+        writer = persistentcache.PersistentCache(self.filename)
+        reader = persistentcache.PersistentCache(self.filename)
+        writer.put(("text", "OK"), b"\x01\x02", [self._word("OK")])
+        results = reader.get(("text", "OK"), b"\x01\x02")
+        self.assertEqual([(w.getText(), w.getBbox()) for w in results],
+                         [("OK", ((0.1, 0.2), (0.3, 0.4)))])
+        self.assertEqual(reader.get(("text", "OK"), b"\x01\x03"), None)
+        self.assertEqual(reader.get(("text", "Cancel"), b"\x01\x02"), None)
+        stats = reader.stats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]),
+                         (1, 2, 1))
+        writer.close()
+        reader.close()
+
+    def testVersionChangeInvalidates(self):
+        cache = persistentcache.PersistentCache(self.filename, version="1")
+        cache.put(("text", "OK"), b"frame", [self._word("OK")])
+        cache.close()
+        cache = persistentcache.PersistentCache(self.filename, version="1")
+        self.assertNotEqual(cache.get(("text", "OK"), b"frame"), None)
+        cache.close()
+        cache = persistentcache.PersistentCache(self.filename, version="2")
+        self.assertEqual(cache.get(("text", "OK"), b"frame"), None)
+        cache.put(("text", "OK"), b"frame", [self._word("OK")])
+        cache.invalidate()
+        self.assertEqual(cache.stats()["entries"], 0)
+        cache.close()
+
+    def testEviction(self):
+        cache = persistentcache.PersistentCache(self.filename)
+        cache.put(("text", "0"), b"frame", [self._word("0")])
+        entryBytes = cache.stats()["bytes"]
+        cache.close()
+        cache = persistentcache.PersistentCache(self.filename,
+                                                maxBytes=int(2.5 * entryBytes))
+        cache.put(("text", "1"), b"frame", [self._word("1")])
+        resolution = persistentcache.ACCESS_RESOLUTION
+        persistentcache.ACCESS_RESOLUTION = 0.0
+        try:
+            cache.get(("text", "0"), b"frame")
+        finally:
+            persistentcache.ACCESS_RESOLUTION = resolution
+        cache.put(("text", "2"), b"frame", [self._word("2")])
+        self.assertEqual(cache.stats()["entries"], 2)
+        self.assertEqual(cache.stats()["evictions"], 1)
+        self.assertNotEqual(cache.get(("text", "0"), b"frame"), None)
+        self.assertEqual(cache.get(("text", "1"), b"frame"), None)
+        cache.close()
+
+    def testHitsDoNotWrite(self):
+        cache = persistentcache.PersistentCache(self.filename)
+        cache.put(("text", "OK"), b"frame", [self._word("OK")])
+        changes = cache._db.total_changes
+        for _ in range(10):
+            self.assertNotEqual(cache.get(("text", "OK"), b"frame"), None)
+        self.assertEqual(cache._db.total_changes, changes)
+        cache.close()
+
+    def testTotalBytes(self):
+        cache = persistentcache.PersistentCache(self.filename, maxBytes=1000)
+        for i in range(20):
+            cache.put(("text", str(i % 7)), b"frame", [self._word("w" * i)])
+        other = persistentcache.PersistentCache(self.filename, maxBytes=1000)
+        other.put(("text", "other"), b"frame", [self._word("other")])
+        nbytes = cache._db.execute("SELECT SUM(size) FROM results").fetchone()[0]
+        self.assertTrue(cache.stats()["evictions"] > 0)
+        self.assertTrue(nbytes <= 1000)
+        self.assertEqual(cache.stats()["bytes"], nbytes)
+        cache.invalidate()
+        self.assertEqual(other.stats()["bytes"], 0)
+        cache.close()
+        other.close()
+
+    def testConcurrentWriters(self):
+        persistentcache.PersistentCache(self.filename).close()
+        pool = multiprocessing.Pool(4)
+        try:
+            written = pool.map(_writeResults,
+                               [(self.filename, worker, 25) for worker in range(4)])
+        finally:
+            pool.close()
+            pool.join()
+        cache = persistentcache.PersistentCache(self.filename)
+        self.assertEqual(cache.stats()["entries"], sum(written))
+        cache.close()
+
+    def testVisionSharesResults(self):
+        from tests.test_vision import ContentOir, FileCamera
+        fileCamera = FileCamera(["icon"])
+        try:
+            needle = fileCamera.needle("icon")
+            for expectedCalls in (1, 0):
+                contentOir = ContentOir()
+                v = opentestrobot.vision.Interface(fileCamera, contentOir)
+                cache = persistentcache.PersistentCache(self.filename)
+                v.setPersistentCache(cache)
+                self.assertEqual(len(v.locateImage(needle)), 1)
+                self.assertEqual(contentOir.calls, expectedCalls)
+                cache.close()
+        finally:
+            fileCamera.close()
+
+if __name__ == "__main__":
+    unittest.main()
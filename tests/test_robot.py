@@ -0,0 +1,130 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import unittest
+
+from opentestrobot import gesture, robot
+
+class TestSimulated(unittest.TestCase):
+    def setUp(self):
+        self.robot = robot.Simulated(acceleration=1000.0, maxVelocity=100.0,
+                                     homePosition=(0.0, 0.0, 0.0))
+
+    def testTravelTime(self):
+        # triangular profile: never reaches maxVelocity
+        self.assertAlmostEqual(robot.travelTime(2.5, 1000.0, 100.0), 0.1)
+        # trapezoidal profile: 0.2 s accelerating and decelerating,
+        # 20 mm of 30 mm cruising at 100 mm/s
+        self.assertAlmostEqual(robot.travelTime(30.0, 1000.0, 100.0), 0.4)
+
+    def testMove(self):
+        self.robot.move((30.0, 0.0, 0.0))
+        self.robot.move((0.0, 0.0, -10.0), relative=True)
+        self.assertEqual(self.robot.position(), (30.0, 0.0, -10.0))
+        self.assertAlmostEqual(self.robot.elapsed(), 0.4 + 0.2)
+        self.robot.init()
+        self.assertEqual(self.robot.position(), (0.0, 0.0, 0.0))
+        self.assertEqual(self.robot.stats()["moves"], 3)
+
+    def testStraightRunDoesNotStop(self):
+        self.robot.execute([(0.0, (x, 0.0, 0.0)) for x in (10.0, 20.0, 30.0)])
+        self.assertAlmostEqual(self.robot.elapsed(), 0.4)
+
+    def testPathTimesAreRespected(self):
+        self.robot.execute([(0.0, (0.0, 0.0, 0.0)), (2.0, (0.0, 0.0, 0.0)),
+                            (2.0, (2.5, 0.0, 0.0))])
+        self.assertAlmostEqual(self.robot.elapsed(), 2.1)
+
+class TestRobotGesture(unittest.TestCase):
+    def setUp(self):
+        self.robot = robot.Simulated(homePosition=(0.0, 0.0, 10.0))
+        self.gesture = gesture.Robot(self.robot, (0.0, 0.0), (60.0, 120.0),
+                                     touchZ=1.0, liftHeight=4.0)
+
+    def testRobotPos(self):
+        self.assertEqual(self.gesture.robotPos((0.5, 0.25)), (30.0, 30.0, 1.0))
+        self.assertEqual(self.gesture.robotPos((1.0, 1.0), pressed=False),
+                         (60.0, 120.0, 5.0))
+
+    def testTap(self):
+        self.gesture.tap((0.5, 0.5), 0.5)
+        self.assertEqual(self.robot.position(), (30.0, 60.0, 5.0))
+        travel = self.robot.travelTime((0.0, 0.0, 10.0), (30.0, 60.0, 5.0))
+        touch = self.robot.travelTime((0.0, 0.0, 5.0), (0.0, 0.0, 1.0))
+        self.assertAlmostEqual(self.robot.elapsed(), travel + touch + 0.5 + touch)
+
+    def testSequenceTakesAsLongAsGestures(self):
+        taps = [("tap", ((0.1 * i, 0.5), 0.0), {}) for i in range(5)]
+        self.gesture.executeSequence(taps)
+        sequenceTime = self.robot.elapsed()
+        other = robot.Simulated(homePosition=(0.0, 0.0, 10.0))
+        otherGesture = gesture.Robot(other, (0.0, 0.0), (60.0, 120.0),
+                                     touchZ=1.0, liftHeight=4.0)
+        for _, args, _ in taps:
+            otherGesture.tap(*args)
+        self.assertAlmostEqual(sequenceTime, other.elapsed())
+
+class TestPlanner(unittest.TestCase):
+    def testPlanOrder(self):
+        points = [(x, 0.0, 0.0) for x in (40.0, 10.0, 30.0, 0.0, 20.0)]
+        self.assertEqual(robot.planOrder(points, start=(0.0, 0.0, 0.0)),
+                         [3, 1, 4, 2, 0])
+        self.assertEqual(robot.planOrder([]), [])
+
+    def testTwoOptRemovesCrossing(self):
+        # nearest neighbour from the origin goes (2, 1), (3, 2), (2, 3),
+        # (4, 0) and the last move crosses the first one, 2-opt
+        # untangles it
+        points = [(3.0, 2.0, 0.0), (4.0, 0.0, 0.0), (2.0, 3.0, 0.0), (2.0, 1.0, 0.0)]
+        start = (0.0, 0.0, 0.0)
+        nearest = robot.planOrder(points, start=start, maxRounds=0)
+        self.assertEqual(nearest, [3, 0, 2, 1])
+        order = robot.planOrder(points, start=start)
+        self.assertEqual(order, [3, 2, 0, 1])
+        length = lambda o: sum(robot.distance(a, b) for a, b in
+                               zip([start] + [points[i] for i in o],
+                                   [points[i] for i in o]))
+        self.assertTrue(length(order) < length(nearest) - 0.5)
+
+    def testPlannedTapsAreFaster(self):
+        # PIN pad keys in the order 1, 9, 3, 7, 5, 2, 8, 4, 6, 0
+        keys = dict(("%d" % (n + 1), ((n % 3 + 0.5) / 3, (n // 3 + 0.5) / 4))
+                    for n in range(9))
+        keys["0"] = (0.5, 3.5 / 4)
+        positions = [keys[key] for key in "1937528460"]
+        times = []
+        for planned in (False, True):
+            simulated = robot.Simulated(homePosition=(0.0, 0.0, 10.0))
+            g = gesture.Robot(simulated, (0.0, 0.0), (60.0, 80.0))
+            if planned:
+                order = g.tapUnordered(positions)
+                self.assertEqual(sorted(order), list(range(10)))
+            else:
+                gesture.Interface.tapUnordered(g, positions)
+            times.append(simulated.elapsed())
+        self.assertTrue(times[1] < 0.8 * times[0], times)
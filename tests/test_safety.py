@@ -0,0 +1,92 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+
+import time
+import unittest
+
+from opentestrobot import gesture, safety
+from tests.test_gesture import SequenceGesture
+
+class TestSafetyRegions(unittest.TestCase):
+    def setUp(self):
+        self.regions = safety.SafetyRegions(
+            forbidden=[((0.9, 0.4), (1.0, 0.6))],
+            allowed=[((0.0, 0.0), (1.0, 0.5)), ((0.0, 0.5), (0.95, 1.0))])
+
+    def testPoints(self):
+        self.assertTrue(self.regions.isSafePoint((0.5, 0.5)))
+        self.assertFalse(self.regions.isSafePoint((0.95, 0.5)))
+        self.assertFalse(self.regions.isSafePoint((0.97, 0.9)))
+        self.assertFalse(self.regions.isSafePoint((1.5, 0.1)))
+
+    def testSegments(self):
+        # crosses from one allowed region to the other
+        self.assertTrue(self.regions.isSafeSegment((0.1, 0.1), (0.8, 0.9)))
+        self.assertFalse(self.regions.isSafeSegment((0.5, 0.5), (0.99, 0.5)))
+        # leaves allowed regions in the bottom-right corner
+        self.assertFalse(self.regions.isSafeSegment((0.5, 0.9), (0.99, 0.9)))
+        self.assertTrue(safety.SafetyRegions().isSafeSegment((0.0, 0.0), (1.0, 1.0)))
+
+    def testSegmentEndingOnRegionEdge(self):
+        # rounding errors must not skip the cell of the end position
+        for cellSize in (0.05, 10):
+            regions = safety.SafetyRegions([((0.8, 0.4), (0.7, 0.94))],
+                                           cellSize=cellSize)
+            self.assertFalse(regions.isSafeSegment((0.992, 0.3), (0.74, 0.4)))
+
+    def testChecksAreFast(self):
+        regions = safety.SafetyRegions(
+            forbidden=[((x / 20.0, y / 20.0), ((x + 0.5) / 20.0, (y + 0.5) / 20.0))
+                       for x in range(0, 20, 2) for y in range(0, 20, 2)])
+        startTime = time.time()
+        for i in range(1000):
+            regions.isSafePoint((0.5 + i * 1e-5, 0.99))
+            regions.isSafeSegment((0.0, 0.99), (0.01, 0.99))
+        self.assertTrue(time.time() - startTime < 0.5)
+
+class TestSafeGesture(unittest.TestCase):
+    def setUp(self):
+        self.backend = SequenceGesture()
+        self.gesture = safety.SafeGesture(
+            self.backend, safety.SafetyRegions(forbidden=[((0.4, 0.4), (0.6, 0.6))]))
+
+    def testUnsafeGesturesAreNotExecuted(self):
+        self.gesture.tap((0.1, 0.1))
+        self.assertRaises(safety.SafetyError, self.gesture.tap, (0.5, 0.5))
+        self.assertRaises(safety.SafetyError, self.gesture.swipe, (0.1, 0.1), (0.9, 0.9))
+        self.assertRaises(safety.SafetyError, self.gesture.rotate, (0.5, 0.2), (0.5, 0.5), 90)
+        self.gesture.tap((0.5, 0.5), bypassSafety=True)
+        self.assertEqual(self.backend.events, [("tap", (0.1, 0.1)), ("tap", (0.5, 0.5))])
+
+    def testBatchIsCheckedBeforeExecution(self):
+        def unsafeBatch():
+            with self.gesture.batch() as b:
+                b.tap((0.1, 0.1))
+                b.drag((0.1, 0.5), (0.9, 0.5))
+        self.assertRaises(safety.SafetyError, unsafeBatch)
+        self.assertEqual(self.backend.sequences, [])
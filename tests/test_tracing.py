@@ -0,0 +1,111 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+import json
+import unittest
+
+import opentestrobot
+
+from opentestrobot import tracing
+from tests.test_userinteraction import RecordingGesture
+
+class TestTracing(unittest.TestCase):
+    def setUp(self):
+        from tests.test_vision import ContentOcr, FileCamera
+        self.camera = FileCamera(["OK Cancel OK"])
+        v = opentestrobot.vision.Interface(self.camera, None, ContentOcr())
+        self.gesture = RecordingGesture()
+        self.ui = opentestrobot.UserInteraction(v, self.gesture)
+        self.spans = []
+        tracing.addSink(tracing.CallbackSink(self.spans.append))
+
+    def tearDown(self):
+        tracing.clearSinks()
+        self.camera.close()
+
+    def testDisabled(self):
+        tracing.clearSinks()
+        self.assertFalse(tracing.enabled())
+        with tracing.span("nothing") as s:
+            s.setTag("ignored", True)
+        self.assertTrue(tracing.currentSpan() is tracing.span("other"))
+        self.ui.tapText("Cancel")
+        self.assertEqual(self.spans, [])
+
+    def testSpanTree(self):
+        self.ui.tapText("Cancel")
+        self.assertEqual(len(self.spans), 1)
+        root = self.spans[0]
+        self.assertEqual(root.name, "UserInteraction.tapText")
+        self.assertEqual(root.tags["text"], "Cancel")
+        names = [s.name for s in root.walk()]
+        for name in ("vision.locate", "vision.capture", "vision.recognize",
+                     "gesture.tap"):
+            self.assertTrue(name in names, name)
+        locate = [s for s in root.walk() if s.name == "vision.locate"][0]
+        self.assertEqual(locate.tags["polls"], 1)
+        self.assertEqual(locate.tags["results"], 1)
+        for s in root.walk():
+            self.assertTrue(0 <= s.duration() <= root.duration())
+
+    def testResultCount(self):
+        self.ui.vision().setTextIndex()
+        self.ui.locateText("OK")
+        self.assertEqual(self.spans[0].tags["results"], 2)
+
+    def testErrorTag(self):
+        self.assertRaises(Exception, self.ui.tapText, "Missing", locateTimeout=0)
+        self.assertTrue("error" in self.spans[0].tags)
+
+    def testHistogramSink(self):
+        histogram = tracing.HistogramSink()
+        tracing.addSink(histogram)
+        for _ in range(3):
+            self.ui.locateText("OK")
+        summary = histogram.summary()
+        self.assertEqual(summary["UserInteraction.locateText"]["count"], 3)
+        stats = summary["vision.recognize"]
+        self.assertTrue(stats["min"] <= stats["p50"] <= stats["p99"] <= stats["max"])
+        histogram.reset()
+        self.assertEqual(histogram.summary(), {})
+
+    def testJsonLinesSink(self):
+        lines = []
+        class Lines(object):
+            def write(self, data):
+                lines.append(data)
+            def flush(self):
+                pass
+        tracing.addSink(tracing.JsonLinesSink(Lines()))
+        self.ui.locateText("OK")
+        self.assertEqual(len(lines), 1)
+        tree = json.loads(lines[0])
+        self.assertEqual(tree["name"], "UserInteraction.locateText")
+        self.assertEqual(tree["children"][0]["name"], "vision.locate")
+
+if __name__ == "__main__":
+    unittest.main()
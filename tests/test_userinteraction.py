@@ -28,6 +28,9 @@
 import unittest
 import opentestrobot
 import os
+import time
+
+from opentestrobot import camera, gesture, guielements, oir, safety
 
 try:
     import fmbtgti
@@ -74,3 +77,166 @@ class TestSwEmulation(unittest.TestCase):
         ui.tapText("6:29")
 
         self._verifyLastEvent(gti, "sendTap", (447, 20))
+
+
+class GrayOir(oir.Interface):
+    """OIR that finds pixels equal to needle byte from PGM frame files
+    """
+    def loadNeedle(self, needleFilename):
+        return ord(open(needleFilename, "rb").read(1))
+
+    def oirLocate(self, haystack, needle, area=None):
+        assert area == None, "area should have been cropped"
+        header, width, height, data = open(haystack.filename(), "rb").read().split(None, 3)
+        width, height = int(width), int(height)
+        pixels = bytearray(data[len("255\n"):])
+        return tuple(
+            guielements.ImageRectangle((x / float(width), y / float(height)),
+                                       ((x + 1) / float(width), (y + 1) / float(height)),
+                                       needle)
+            for y in xrange(height) for x in xrange(width)
+            if pixels[y * width + x] == needle)
+
+class RecordingGesture(gesture.Interface):
+    def __init__(self):
+        self.events = []
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        self.events.append(("tap", pos))
+
+    def drag(self, beginPos, endPos, beginDuration=0.0, endDuration=0.0, **kwargs):
+        self.events.append(("drag", beginPos, endPos))
+
+    def swipe(self, beginPos, endPos, **kwargs):
+        self.events.append(("swipe", beginPos, endPos))
+
+class TestArea(unittest.TestCase):
+    def setUp(self):
+        # 4x2 frame with pixels at (0, 0) and (3, 1) equal to the
+        # first byte of the needle file
+        pixels = bytearray(b"\x89\x00\x00\x00" b"\x00\x00\x00\x89")
+        self.gesture = RecordingGesture()
+        self.ui = opentestrobot.UserInteraction(
+            opentestrobot.vision.Interface(
+                camera.BufferSource(lambda: pixels, 4, 2, None, "GRAY8"),
+                GrayOir()),
+            self.gesture)
+        self.needle = os.path.join(moduleDir, "images", "call.png")
+        self.needle = self.needle[:-len(".png")]
+
+    def testLocateInArea(self):
+        self.assertEqual(len(self.ui.locateImage(self.needle)), 2)
+        lowerRight = guielements.Rectangle((0.5, 0.5), (1.0, 1.0))
+        results = self.ui.locateImage(self.needle, area=lowerRight)
+        self.assertEqual([e.getBbox() for e in results],
+                         [((0.75, 0.5), (1.0, 1.0))])
+
+    def testGesturesInArea(self):
+        right = guielements.Rectangle((0.5, 0.0), (1.0, 1.0))
+        self.ui.tapImage(self.needle, area=right)
+        self.ui.dragImage(self.needle, self.needle, endPos=(0.0, 0.0), area=right)
+        self.ui.swipeImage(self.needle, angle=0, distance=0.5, area=right)
+        self.assertEqual(self.gesture.events,
+                         [("tap", (0.875, 0.75)),
+                          ("drag", (0.875, 0.75), (0.75, 0.5)),
+                          ("swipe", (0.875, 0.75), (0.9375, 0.75))])
+
+    def testGestureKwargsOnLocatedItems(self):
+        ui = opentestrobot.UserInteraction(
+            self.ui._vision,
+            safety.SafeGesture(self.gesture, safety.SafetyRegions(
+                forbidden=[((0.5, 0.5), (1.0, 1.0))])))
+        right = guielements.Rectangle((0.5, 0.0), (1.0, 1.0))
+        self.assertRaises(safety.SafetyError, ui.tapImage, self.needle, area=right)
+        ui.tapImage(self.needle, area=right, bypassSafety=True)
+        ui.swipeImage(self.needle, angle=0, distance=0.5, area=right, bypassSafety=True)
+        ui.runPipeline([opentestrobot.Step("tapImage", self.needle, area=right,
+                                           bypassSafety=True)])
+        self.assertEqual(self.gesture.events,
+                         [("tap", (0.875, 0.75)),
+                          ("swipe", (0.875, 0.75), (0.9375, 0.75)),
+                          ("tap", (0.875, 0.75))])
+
+class MovingGesture(RecordingGesture):
+    """Taps move the needle pixel of the frame to the upper-left corner
+    after a while, leaving time for locating the next item"""
+    def __init__(self, pixels):
+        RecordingGesture.__init__(self)
+        self.pixels = pixels
+
+    def tap(self, pos, duration=0.0, **kwargs):
+        RecordingGesture.tap(self, pos, duration)
+        time.sleep(0.1)
+        self.pixels = bytearray(b"\x89\x00\x00\x00" b"\x00\x00\x00\x00")
+
+class TestPipeline(unittest.TestCase):
+    def setUp(self):
+        self.gesture = MovingGesture(
+            bytearray(b"\x00\x00\x00\x00" b"\x00\x00\x00\x89"))
+        self.ui = opentestrobot.UserInteraction(
+            opentestrobot.vision.Interface(
+                camera.BufferSource(lambda: self.gesture.pixels, 4, 2, None, "GRAY8"),
+                GrayOir()),
+            self.gesture)
+        self.needle = os.path.join(moduleDir, "images", "call.png")
+
+    def testPrelocatedStepsAreRevalidated(self):
+        report = self.ui.runPipeline([
+            opentestrobot.Step("swipe", (0.0, 0.0), (1.0, 1.0)),
+            opentestrobot.Step("tapImage", self.needle),
+            opentestrobot.Step("tapImage", self.needle)])
+        self.assertEqual(self.gesture.events,
+                         [("swipe", (0.0, 0.0), (1.0, 1.0)),
+                          ("tap", (0.875, 0.75)),
+                          ("tap", (0.125, 0.25))])
+        self.assertEqual([s["prelocated"] for s in report.steps],
+                         [False, True, False])
+        self.assertTrue(report.throughput() > 0)
+
+    def testUnknownStep(self):
+        self.assertRaises(ValueError, opentestrobot.Step, "locateImage", "x")
+
+class TestNear(unittest.TestCase):
+    def setUp(self):
+        from tests.test_vision import ContentOcr, FileCamera
+        self.camera = FileCamera(["OK Cancel OK Label"])
+        self.ocr = ContentOcr()
+        v = opentestrobot.vision.Interface(self.camera, None, self.ocr)
+        v.setTextIndex()
+        self.gesture = RecordingGesture()
+        self.ui = opentestrobot.UserInteraction(v, self.gesture)
+
+    def tearDown(self):
+        self.camera.close()
+
+    def testTapTextNearElement(self):
+        label = self.ui.locateText("Label")[0]
+        self.ui.tapText("OK", near=label)
+        self.assertEqual(self.gesture.events, [("tap", (0.25, 0.05))])
+        # resolved from the indexed frame of the previous locate after
+        # a new frame showed that the screen had not changed
+        self.assertEqual(self.camera.frames, 2)
+        self.assertEqual(self.ocr.wordCalls, 1)
+
+    def testChangedScreenIsSearchedAgain(self):
+        self.camera._contents = ["OK Cancel OK Label", "Label Back"]
+        label = self.ui.locateText("Label")[0]
+        self.assertEqual(self.ui.locateText("OK", near=label), ())
+        self.assertEqual([w.getText() for w in self.ui.words()], ["Label", "Back"])
+        self.assertEqual(self.ui.vision().lastFrame().digest(),
+                         self.ui.vision().frame().digest())
+
+    def testRelativePositions(self):
+        words = self.ui.vision().words()
+        cancel = words[1]
+        self.assertEqual([w.getText() for w in words.rightOf(cancel)], ["OK", "Label"])
+        self.assertEqual([w.getText() for w in words.leftOf(cancel)], ["OK"])
+        self.assertEqual(words.below(cancel), ())
+        self.assertEqual(words.overlapping(cancel.getBbox(), minIou=0.9), (cancel,))
+
+    def testWordsWithinArea(self):
+        self.ui.locateText("Label")
+        firstHalf = guielements.Rectangle((0.0, 0.0), (0.2, 1.0))
+        self.assertEqual([w.getText() for w in self.ui.words(area=firstHalf)],
+                         ["OK", "Cancel"])
+        self.assertEqual(self.ocr.wordCalls, 1)
@@ -0,0 +1,482 @@
+# Copyright (c) 2014 Tampere University of Technology,
+#                    Intel Corporation,
+#                    OptoFidelity,
+#                    and authors
+#
+# Permission is hereby granted, free of charge, to any person obtaining a copy
+# of this software and associated documentation files (the "Software"), to deal
+# in the Software without restriction, including without limitation the rights
+# to use, copy, modify, merge, publish, distribute, sublicense, and/or sell
+# copies of the Software, and to permit persons to whom the Software is
+# furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included in all
+# copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND, EXPRESS OR
+# IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES OF MERCHANTABILITY,
+# FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT. IN NO EVENT SHALL THE
+# AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM, DAMAGES OR OTHER
+# LIABILITY, WHETHER IN AN ACTION OF CONTRACT, TORT OR OTHERWISE, ARISING FROM,
+# OUT OF OR IN CONNECTION WITH THE SOFTWARE OR THE USE OR OTHER DEALINGS IN THE
+# SOFTWARE.
+
+# pylint: disable = C0103, C0111, C0302, C0326
+# pylint: disable = R0902, R0903, R0904, R0911, R0912, R0913, R0914, R0915
+# pylint: disable = W0212
+
+import multiprocessing
+import multiprocessing.pool
+import os
+import shutil
+import tempfile
+import unittest
+
+import opentestrobot
+from opentestrobot import camera, guielements, ocr, oir
+
+class FileCamera(camera.Interface):
+    """Camera that returns files with given contents, one per frame
+    """
+    def __init__(self, contents):
+        super(FileCamera, self).__init__()
+        self._dir = tempfile.mkdtemp()
+        self._contents = list(contents)
+        self.frames = 0
+
+    def close(self):
+        shutil.rmtree(self._dir)
+
+    def features(self):
+        return {"locateImage": 0,
+                "frame": "filename"}
+
+    def frame(self):
+        content = self._contents[min(self.frames, len(self._contents) - 1)]
+        self.frames += 1
+        filename = os.path.join(self._dir, "frame-%s" % (self.frames,))
+        open(filename, "wb").write(content)
+        return filename
+
+    def needle(self, content):
+        filename = os.path.join(self._dir, content + ".png")
+        open(filename, "wb").write(content)
+        return filename
+
+class ContentOir(oir.Interface):
+    """OIR that finds a needle if frame content equals the needle
+    """
+    def __init__(self):
+        super(ContentOir, self).__init__()
+        self.calls = 0
+        self.loads = 0
+
+    def loadNeedle(self, needleFilename):
+        self.loads += 1
+        return open(needleFilename, "rb").read()
+
+    def oirLocate(self, haystack, needle):
+        self.calls += 1
+        if open(haystack.filename(), "rb").read() == needle:
+            return (guielements.ImageRectangle(
+                (0.25, 0.25), (0.75, 0.75), needle),)
+        return ()
+
+class ContentOcr(ocr.Interface):
+    """OCR that finds text if it is included in frame content
+    """
+    def __init__(self):
+        super(ContentOcr, self).__init__()
+        self.wordCalls = 0
+
+    def ocrLocate(self, haystack, text):
+        if text in open(haystack.filename(), "rb").read():
+            return (guielements.TextRectangle((0, 0), (1, 1), text),)
+        return ()
+
+    def ocrWords(self, haystack, area=None):
+        self.wordCalls += 1
+        words = open(haystack.filename(), "rb").read().split()
+        return tuple(guielements.Word((i / 10.0, 0.0), ((i + 1) / 10.0, 0.1), word)
+                     for i, word in enumerate(words))
+
+class PixelOir(oir.Interface):
+    """OIR that finds GRAY8 pixels whose value equals the needle
+    """
+    def loadNeedle(self, needleFilename):
+        return ord(open(needleFilename, "rb").read(1))
+
+    def oirLocate(self, haystack, needle, area=None):
+        raise AssertionError("file based entry point called")
+
+    def oirLocateBuffer(self, haystack, needle, area=None):
+        width, height = haystack.size()
+        if area == None:
+            area = ((0.0, 0.0), (1.0, 1.0))
+        (left, top), (right, bottom) = area
+        results = []
+        for y in xrange(int(top * height), min(height, int(bottom * height) + 1)):
+            row = bytearray(haystack.row(y).tobytes())
+            for x in xrange(int(left * width), min(width, int(right * width) + 1)):
+                if row[x] == needle:
+                    results.append(guielements.ImageRectangle(
+                        (x / float(width), y / float(height)),
+                        ((x + 1) / float(width), (y + 1) / float(height)),
+                        needle))
+        return tuple(results)
+
+class TestLocate(unittest.TestCase):
+    def setUp(self):
+        self.oir = ContentOir()
+
+    def _vision(self, contents):
+        self.camera = FileCamera(contents)
+        return opentestrobot.vision.Interface(self.camera, self.oir,
+                                              ContentOcr())
+
+    def tearDown(self):
+        self.camera.close()
+
+    def testFoundImmediately(self):
+        v = self._vision(["icon"])
+        results = v.locateImage(self.camera.needle("icon"), locateTimeout=1.0)
+        self.assertEqual(len(results), 1)
+        self.assertEqual(v.locateStats()["polls"], 1)
+
+    def testUnchangedFramesAreNotRecognized(self):
+        v = self._vision(["a", "a", "a", "a", "b", "b", "icon"])
+        v.setPollInterval(0.001, 0.002, 2.0)
+        results = v.locateImage(self.camera.needle("icon"), locateTimeout=5.0)
+        self.assertEqual(len(results), 1)
+        stats = v.locateStats()
+        self.assertEqual(stats["polls"], 7)
+        self.assertEqual(stats["framesSkipped"], 4)
+        self.assertEqual(self.oir.calls, 3)
+
+    def testTimeoutWithBackoff(self):
+        v = self._vision(["a"])
+        v.setPollInterval(0.01, 0.04, 2.0)
+        results = v.locateImage(self.camera.needle("icon"), locateTimeout=0.2)
+        self.assertEqual(results, ())
+        stats = v.locateStats()
+        self.assertTrue(stats["totalTime"] >= 0.2)
+        # without backoff there would be about 20 polls
+        self.assertTrue(stats["polls"] < 12, stats)
+        self.assertEqual(self.oir.calls, 1)
+
+    def testBackgroundCapture(self):
+        v = self._vision(["a", "b", "c", "icon"])
+        v.startCapture(depth=2, interval=0.001)
+        try:
+            results = v.locateImage(self.camera.needle("icon"), locateTimeout=5.0)
+        finally:
+            v.stopCapture()
+        self.assertEqual(len(results), 1)
+        stats = v.frameBuffer().stats()
+        self.assertEqual(stats["frames"], 2)
+        self.assertEqual(stats["captured"], self.camera.frames)
+        self.assertEqual(stats["dropped"], self.camera.frames - 2)
+
+    def testNeedleCache(self):
+        v = self._vision(["icon"])
+        v.setNeedleCache(maxBytes=8)
+        icon = self.camera.needle("icon")
+        other = self.camera.needle("other")
+        v.locateImage(icon[:-len(".png")])
+        v.locateImage("file://" + icon)
+        v.locateImage(icon, forceReload=True)
+        v.locateImage(other)
+        v.locateImage(icon)
+        self.assertEqual(self.oir.loads, 4)
+        stats = v.needleCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["evictions"]),
+                         (1, 4, 2))
+        self.assertRaises(IOError, v.locateImage, icon + ".missing")
+
+    def testSetOirDropsPreparedNeedles(self):
+        class OtherOir(oir.Interface):
+            needles = []
+            def loadNeedle(self, needleFilename):
+                return ("other", needleFilename)
+            def oirLocate(self, haystack, needle, area=None):
+                self.needles.append(needle)
+                return ()
+        v = self._vision(["icon"])
+        icon = self.camera.needle("icon")
+        v.locateImage(icon)
+        v.setOir(OtherOir())
+        v.locateImage(icon)
+        self.assertEqual(OtherOir.needles, [("other", icon)])
+
+    def testImagesFromBackendPath(self):
+        # fMBT-like backends find images from their own bitmap path
+        class PathOir(oir.Interface):
+            needles = []
+            def oirLocate(self, haystack, needle, area=None):
+                self.needles.append(needle)
+                return ()
+        v = self._vision(["icon"])
+        v.setOir(PathOir())
+        self.assertEqual(v.locateImage("call.png"), ())
+        self.assertEqual(PathOir.needles, ["call.png"])
+
+    def testLocateAnyAndAll(self):
+        v = self._vision(["dialog", "dialog", "home"])
+        v.setPollInterval(0.001, 0.001)
+        dialog = self.camera.needle("dialog")
+        home = self.camera.needle("home")
+        result = v.locateAny([dialog, home], ["dia", "ome"])
+        self.assertTrue(result)
+        self.assertEqual(result.matched(), ([dialog], ["dia"]))
+        self.assertEqual(result.images()[home], ())
+        result = v.locateAll([home], ["ome"], locateTimeout=5.0)
+        self.assertTrue(result)
+        self.assertEqual(v.locateStats()["framesSkipped"], 0)
+        result = v.locateAll([home], ["dia"], locateTimeout=0.01)
+        self.assertFalse(result)
+        self.assertEqual(result.matched(), ([home], []))
+
+    def testTextIndex(self):
+        v = self._vision(["Call log", "Call log", "Contacts"])
+        v.setTextIndex(match="prefix")
+        self.assertEqual(len(v.locateText("Call")), 1)
+        self.assertEqual(v.locateText("Call lo")[0].getText(), "Call log")
+        self.assertEqual(len(v.locateText("Contacts")), 1)
+        self.assertEqual(v.textIndexStats(), {"hits": 1, "misses": 2,
+                                              "entries": 2})
+        self.assertEqual(v._ocr.wordCalls, 2)
+
+class TestNeedleCache(unittest.TestCase):
+    def testGrowingNeedleIsReaccounted(self):
+        class GrowingNeedle(object):
+            size = 4
+            def nbytes(self):
+                return self.size
+        needle = GrowingNeedle()
+        cache = oir.NeedleCache(maxBytes=100)
+        filename = tempfile.NamedTemporaryFile()
+        cache.get(filename.name, lambda f: needle)
+        needle.size = 40
+        cache.get(filename.name, lambda f: needle)
+        self.assertEqual(cache.stats()["bytes"], 40)
+        filename.close()
+
+class TestExecutors(unittest.TestCase):
+    def setUp(self):
+        self.needleFile = tempfile.NamedTemporaryFile(suffix=".png")
+        self.needleFile.write(b"\x07")
+        self.needleFile.flush()
+        pixels = bytearray(64 * 48)
+        for x, y in ((0, 0), (31, 23), (32, 24), (63, 47), (10, 40)):
+            pixels[y * 64 + x] = 7
+        self.vision = opentestrobot.vision.Interface(
+            camera.BufferSource(lambda: pixels, 64, 48, None, "GRAY8"),
+            PixelOir())
+
+    def tearDown(self):
+        self.needleFile.close()
+
+    def _bboxes(self):
+        return sorted(e.getBbox() for e in
+                      self.vision.locateImage(self.needleFile.name))
+
+    def testTilesAndPools(self):
+        expected = self._bboxes()
+        self.assertEqual(len(expected), 5)
+        self.vision.setTiling(2, 2, 0.1)
+        self.assertEqual(self._bboxes(), expected)
+        for pool in (multiprocessing.pool.ThreadPool(4),
+                     multiprocessing.Pool(2)):
+            self.vision.setExecutor(pool)
+            try:
+                self.assertEqual(self._bboxes(), expected)
+                result = self.vision.locateAll(
+                    [self.needleFile.name, self.needleFile.name])
+                self.assertEqual(
+                    len(result.images()[self.needleFile.name]), 5)
+            finally:
+                pool.close()
+                pool.join()
+
+class TestChangeDetection(unittest.TestCase):
+    def setUp(self):
+        self.frames = []
+        def grab():
+            if len(self.frames) > 1:
+                return self.frames.pop(0)
+            return self.frames[0]
+        self.vision = opentestrobot.vision.Interface(
+            camera.BufferSource(grab, 4, 4, None, "GRAY8"))
+        self.vision.setPollInterval(0.001)
+
+    def _frames(self, *values):
+        # frames with the top half filled with value
+        self.frames = [bytearray(chr(v) * 8 + b"\x00" * 8) for v in values]
+
+    def testWaitStable(self):
+        self._frames(0, 100, 200, 201, 201)
+        self.assertTrue(self.vision.waitStable(5.0, threshold=0.01))
+        self.assertEqual(len(self.frames), 1)
+        self._frames(0, 255)
+        self.assertTrue(self.vision.waitStable(0.05, threshold=0.01))
+        self._frames(0, 255, 0, 255, 0, 255, 0)
+        self.assertFalse(self.vision.waitStable(0.0, threshold=0.01))
+
+    def testRepeatedFramesDuringAnimation(self):
+        # every animation frame is delivered twice
+        self._frames(*[v for v in (0, 50, 100, 150, 200, 250) for _ in (0, 1)])
+        self.assertTrue(self.vision.waitStable(5.0, threshold=0.01, settle=0.02))
+        self.assertEqual(len(self.frames), 1)
+
+    def testWaitChange(self):
+        bottom = guielements.Rectangle((0.0, 0.5), (1.0, 1.0))
+        self._frames(0, 0, 255)
+        self.assertFalse(self.vision.waitChange(bottom, timeout=0.05))
+        self._frames(0, 0, 0, 255)
+        self.assertTrue(self.vision.waitChange(timeout=5.0))
+        self.assertEqual(len(self.frames), 1)
+
+    def testChangeThresholdSkipsRecognition(self):
+        self.vision.setOir(PixelOir())
+        needle = tempfile.NamedTemporaryFile(suffix=".png")
+        needle.write(b"\x07")
+        needle.flush()
+        self._frames(1, 2, 7)
+        self.vision.setChangeThreshold(0.005)
+        self.assertEqual(len(self.vision.locateImage(needle.name, 5.0)), 8)
+        self.assertEqual(self.vision.locateStats()["framesSkipped"], 1)
+
+class CountingPixelOir(PixelOir):
+    def __init__(self):
+        super(CountingPixelOir, self).__init__()
+        self.calls = 0
+
+    def oirLocateBuffer(self, haystack, needle, area=None):
+        self.calls += 1
+        return super(CountingPixelOir, self).oirLocateBuffer(haystack, needle, area)
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.needle = tempfile.NamedTemporaryFile(suffix=".png")
+        self.needle.write(b"\x07")
+        self.needle.flush()
+        self.pixels = self._screen(0)
+        self.oir = CountingPixelOir()
+        self.vision = opentestrobot.vision.Interface(
+            camera.BufferSource(lambda: bytearray(self.pixels), 16, 16, None, "GRAY8"),
+            self.oir)
+
+    def tearDown(self):
+        self.needle.close()
+
+    def _screen(self, seed):
+        # horizontal gradient, reversed on rows of seed, needle at (3, 3)
+        pixels = bytearray(16 * 16)
+        for y in range(16):
+            for x in range(16):
+                pixels[y * 16 + x] = 16 + (15 - x if y < seed else x) * 8
+        pixels[3 * 16 + 3] = 7
+        return pixels
+
+    def testRevisitedScreen(self):
+        self.vision.setResultCache(size=4)
+        first = self.vision.locateImage(self.needle.name)
+        self.pixels = self._screen(16)
+        self.vision.locateImage(self.needle.name)
+        self.pixels = self._screen(0)
+        self.assertEqual(self.vision.locateImage(self.needle.name), first)
+        self.assertEqual(self.oir.calls, 2)
+        stats = self.vision.resultCacheStats()
+        self.assertEqual((stats["hits"], stats["misses"], stats["entries"]),
+                         (1, 2, 2))
+        self.vision.setOir(self.oir)
+        self.vision.locateImage(self.needle.name)
+        self.assertEqual(self.oir.calls, 3)
+
+    def testItemAppearsBetweenPolls(self):
+        # the needle pixel does not change the fingerprint
+        empty = self._screen(0)
+        empty[3 * 16 + 3] = 16 + 3 * 8
+        screens = [empty, empty, self._screen(0)]
+        hashes = [opentestrobot.vision.perceptualHash(
+            camera.BufferFrame(pixels, 16, 16, None, "GRAY8")) for pixels in screens]
+        self.assertEqual(hashes[0], hashes[-1])
+        self.vision = opentestrobot.vision.Interface(
+            camera.BufferSource(lambda: bytearray(screens.pop(0) if len(screens) > 1
+                                                  else screens[0]),
+                                16, 16, None, "GRAY8"),
+            self.oir)
+        self.vision.setResultCache(tolerance=0)
+        self.assertEqual(self.vision.locateImage(self.needle.name), ())
+        self.assertEqual(len(self.vision.locateImage(self.needle.name, 1.0)), 1)
+        # empty results of an identical frame are cached
+        self.vision.setResultCache(tolerance=0)
+        screens[:] = [empty]
+        calls = self.oir.calls
+        self.vision.locateImage(self.needle.name)
+        self.vision.locateImage(self.needle.name)
+        self.assertEqual(self.oir.calls, calls + 1)
+
+    def testItemDisappears(self):
+        empty = self._screen(0)
+        empty[3 * 16 + 3] = 16 + 3 * 8
+        self.vision.setResultCache()
+        self.assertEqual(len(self.vision.locateImage(self.needle.name)), 1)
+        self.pixels = empty
+        self.assertEqual(self.vision.locateImage(self.needle.name), ())
+        self.assertEqual(self.oir.calls, 2)
+
+    def testTolerance(self):
+        frame = lambda seed: camera.BufferFrame(self._screen(seed), 16, 16, None, "GRAY8")
+        distance = bin(opentestrobot.vision.perceptualHash(frame(0)) ^
+                       opentestrobot.vision.perceptualHash(frame(2))).count("1")
+        self.assertTrue(distance > 0)
+        for tolerance, calls in ((distance - 1, 2), (distance, 1)):
+            self.oir.calls = 0
+            self.vision.setResultCache(tolerance=tolerance)
+            self.vision.locateImage(self.needle.name, frame=frame(0))
+            self.vision.locateImage(self.needle.name, frame=frame(2))
+            self.assertEqual(self.oir.calls, calls)
+        self.assertEqual(self.vision.resultCacheStats()["nearHits"], 1)
+
+    def testEviction(self):
+        self.vision.setResultCache(size=1)
+        other = tempfile.NamedTemporaryFile(suffix=".png")
+        other.write(b"\x08")
+        other.flush()
+        for filename in (self.needle.name, other.name, self.needle.name):
+            self.vision.locateImage(filename)
+        other.close()
+        self.assertEqual(self.oir.calls, 3)
+        self.assertEqual(self.vision.resultCacheStats()["evictions"], 2)
+        self.vision.setResultCache(False)
+        self.assertEqual(self.vision.resultCacheStats(), {})
+
+    def testFramesWithoutPixels(self):
+        fileCamera = FileCamera(["icon", "other", "icon"])
+        try:
+            contentOir = ContentOir()
+            v = opentestrobot.vision.Interface(fileCamera, contentOir)
+            v.setResultCache(tolerance=4)
+            needle = fileCamera.needle("icon")
+            for _ in range(3):
+                v.locateImage(needle)
+            self.assertEqual(contentOir.calls, 2)
+        finally:
+            fileCamera.close()
+
+class TestFrameRingBuffer(unittest.TestCase):
+    def testDropPolicies(self):
+        frames = [camera.BufferFrame(bytearray(10), 10, 1, None, "GRAY8")
+                  for _ in range(4)]
+        oldest = opentestrobot.vision.FrameRingBuffer(depth=3, maxBytes=20)
+        newest = opentestrobot.vision.FrameRingBuffer(depth=3,
+                                                      dropPolicy="newest")
+        for frame in frames:
+            oldest.put(frame)
+            newest.put(frame)
+        self.assertEqual(oldest.frames(), frames[2:])
+        self.assertEqual(oldest.latest(), frames[3])
+        self.assertEqual(newest.frames(), frames[:3])
+        self.assertEqual(newest.stats()["dropped"], 1)
+